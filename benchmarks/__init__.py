@@ -0,0 +1 @@
+"""Contains benchmarks for the proxy's hot paths."""
@@ -0,0 +1,116 @@
+"""Measures the storage and scan time saved by normalizing authors.
+
+Builds a posts table in the layout used before the authors table, with each
+author's name on every post and an index on (author, created_at), as a
+per-author feed would use. Measures the sizes of the table and the index and
+the median time of a full table scan; then migrates the table with
+db_ops.migrate_post_authors, indexes (author_id, created_at) instead, and
+measures again, including the size of the authors table and its index of
+names. Sizes are read from SQLite's dbstat table after VACUUM.
+
+Run from the repository root with: make bench
+"""
+# pylint: disable=wrong-import-position
+
+import os
+os.environ.setdefault("POPULARE_ALLOW_MISSING_SECRET", "")
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    "sqlite:////tmp/populare_benchmark.db"
+)
+import statistics
+import time
+from datetime import datetime, timedelta
+from populare_db_proxy.app_data import db
+from populare_db_proxy.db_ops import migrate_post_authors
+
+NUM_POSTS = 200000
+NUM_AUTHORS = 1000
+NUM_ITERATIONS = 20
+INDEX_NAME = "ix_posts_author_created_at"
+
+
+def create_legacy_posts() -> None:
+    """Creates and fills a posts table that stores authors' names."""
+    db.drop_all()
+    start = datetime.now() - timedelta(days=365)
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, "
+            "text VARCHAR(255) NOT NULL, author VARCHAR(255) NOT NULL, "
+            "created_at DATETIME NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO posts (text, author, created_at) VALUES (?, ?, ?)",
+            [
+                (
+                    f"post number {idx}",
+                    f"populare_user_{idx % NUM_AUTHORS:04d}",
+                    str(start + timedelta(seconds=idx))
+                )
+                for idx in range(NUM_POSTS)
+            ]
+        )
+        connection.exec_driver_sql(
+            f"CREATE INDEX {INDEX_NAME} ON posts (author, created_at)"
+        )
+
+
+def measure(author_column: str) -> tuple[int, int, int, float]:
+    """Returns the sizes of the posts table, its author index, and the
+    authors table, and the median time of a full scan of the posts table.
+
+    :param author_column: The column that identifies the author.
+    :return: The sizes in bytes, and the median scan time in milliseconds.
+    """
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql("VACUUM")
+        sizes = dict(connection.exec_driver_sql(
+            "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+        ).all())
+        latencies = []
+        for _ in range(NUM_ITERATIONS):
+            start = time.perf_counter()
+            connection.exec_driver_sql(
+                f"SELECT COUNT(DISTINCT {author_column}), MAX(created_at) "
+                "FROM posts NOT INDEXED"
+            ).all()
+            latencies.append(time.perf_counter() - start)
+    return (
+        sizes["posts"],
+        sizes[INDEX_NAME],
+        sum(size for name, size in sizes.items() if "authors" in name),
+        statistics.median(latencies) * 1000
+    )
+
+
+def main() -> None:
+    """Runs the program."""
+    create_legacy_posts()
+    before = measure("author")
+    with db.engine.begin() as connection:
+        # SQLite cannot drop a column that an index covers.
+        connection.exec_driver_sql(f"DROP INDEX {INDEX_NAME}")
+    start = time.perf_counter()
+    migrate_post_authors()
+    migration_seconds = time.perf_counter() - start
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            f"CREATE INDEX {INDEX_NAME} ON posts (author_id, created_at)"
+        )
+    after = measure("author_id")
+    print(f"{NUM_POSTS} posts by {NUM_AUTHORS} authors; migrated in "
+          f"{migration_seconds:.1f} s")
+    print(f"{'layout':<12}{'posts KiB':>11}{'index KiB':>11}"
+          f"{'authors KiB':>13}{'scan ms':>9}")
+    for name, (table_size, index_size, authors_size, latency) in (
+            ("name", before),
+            ("author_id", after)
+    ):
+        print(f"{name:<12}{table_size / 1024:>11.0f}"
+              f"{index_size / 1024:>11.0f}{authors_size / 1024:>13.0f}"
+              f"{latency:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmarks the ORM and Core read paths for a page of posts.
+
+Compares reading a page with select(Post), which builds an ORM instance per
+row, against db_ops.read_post_rows, which converts rows straight from the
+cursor to PostRow tuples. Reports the median latency and the peak memory
+allocated per read at each page size.
+
+Run from the repository root with: make bench
+"""
+# pylint: disable=wrong-import-position
+
+import os
+os.environ.setdefault("POPULARE_ALLOW_MISSING_SECRET", "")
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    "sqlite:////tmp/populare_benchmark.db"
+)
+import statistics
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from populare_db_proxy.app_data import db
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import init_db_schema, create_posts, \
+    read_post_rows
+
+NUM_POSTS = 5000
+PAGE_SIZES = (50, 1000)
+NUM_ITERATIONS = 200
+
+
+def read_orm_posts(limit: int) -> list[Post]:
+    """Returns a page of posts read through the ORM.
+
+    :param limit: The number of posts to read.
+    :return: The page of posts.
+    """
+    statement = (
+        select(Post)
+            .where(Post.created_at < datetime.now())
+            .order_by(Post.created_at.desc())
+            .limit(limit)
+    )
+    with Session(db.engine) as session:
+        return list(session.execute(statement).scalars())
+
+
+def measure(read: Callable[[int], list], limit: int) -> tuple[float, float]:
+    """Returns the median latency and peak allocation of a read.
+
+    :param read: The function that reads a page.
+    :param limit: The page size.
+    :return: A 2-tuple of the median latency in milliseconds and the peak
+        memory allocated during one read in KiB.
+    """
+    read(limit)
+    latencies = []
+    for _ in range(NUM_ITERATIONS):
+        start = time.perf_counter()
+        read(limit)
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    read(limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(latencies) * 1000, peak / 1024
+
+
+def main() -> None:
+    """Runs the program."""
+    db.drop_all()
+    init_db_schema()
+    start = datetime.now() - timedelta(days=1)
+    create_posts([
+        Post(
+            text=f"text{idx}",
+            author=f"author{idx % 100}",
+            created_at=start + timedelta(seconds=idx)
+        )
+        for idx in range(NUM_POSTS)
+    ])
+    print(f"{'path':<6}{'limit':>7}{'median ms':>12}{'peak KiB':>11}")
+    for limit in PAGE_SIZES:
+        for name, read in (("orm", read_orm_posts), ("core", read_post_rows)):
+            latency, peak = measure(read, limit)
+            print(f"{name:<6}{limit:>7}{latency:>12.3f}{peak:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
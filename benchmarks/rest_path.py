@@ -0,0 +1,96 @@
+"""Benchmarks the REST and GraphQL endpoints for a page of the feed.
+
+Compares GET /posts, which calls db_ops directly and joins cached post
+payloads, against the equivalent readPosts query on /graphql, which parses,
+validates, and resolves the document on every request. Requests go through
+Flask's test client, so the difference is the per-request overhead of each
+endpoint, without the network. Reports the median latency and requests per
+second at each page size.
+
+Run from the repository root with: make bench
+"""
+# pylint: disable=wrong-import-position
+
+import os
+os.environ.setdefault("POPULARE_ALLOW_MISSING_SECRET", "")
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    "sqlite:////tmp/populare_benchmark.db"
+)
+# The benchmark sends far more requests than a client's rate limit allows.
+os.environ.setdefault("POPULARE_RATE_LIMIT_ENABLED", "0")
+import statistics
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from flask.testing import FlaskClient
+from werkzeug.test import TestResponse
+from populare_db_proxy.app_data import db
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import init_db_schema, create_posts
+from populare_db_proxy.proxy import create_app
+
+NUM_POSTS = 5000
+PAGE_SIZES = (10, 50, 1000)
+NUM_ITERATIONS = 200
+
+
+def measure(request: Callable[[], TestResponse]) -> float:
+    """Returns the median latency of a request.
+
+    :param request: The function that sends the request.
+    :return: The median latency in milliseconds.
+    """
+    assert request().status_code == 200
+    latencies = []
+    for _ in range(NUM_ITERATIONS):
+        start = time.perf_counter()
+        request()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def request_functions(
+        client: FlaskClient,
+        limit: int
+) -> tuple[tuple[str, Callable[[], TestResponse]], ...]:
+    """Returns the functions that request a page through each endpoint.
+
+    :param client: The Flask test client.
+    :param limit: The page size.
+    :return: The endpoint names and request functions.
+    """
+    return (
+        ("graphql", lambda: client.post(
+            "/graphql",
+            data=f"{{ readPosts(limit: {limit}) }}",
+            content_type="application/graphql"
+        )),
+        ("rest", lambda: client.get(f"/posts?limit={limit}"))
+    )
+
+
+def main() -> None:
+    """Runs the program."""
+    app = create_app()
+    db.drop_all()
+    init_db_schema()
+    start = datetime.now() - timedelta(days=1)
+    create_posts([
+        Post(
+            text=f"text{idx}",
+            author=f"author{idx % 100}",
+            created_at=start + timedelta(seconds=idx)
+        )
+        for idx in range(NUM_POSTS)
+    ])
+    client = app.test_client()
+    print(f"{'path':<9}{'limit':>7}{'median ms':>12}{'req/s':>9}")
+    for limit in PAGE_SIZES:
+        for name, request in request_functions(client, limit):
+            latency = measure(request)
+            print(f"{name:<9}{limit:>7}{latency:>12.3f}{1000 / latency:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measures the write throughput of concurrent post creation by shard count.
+
+Starts writer threads that each create posts one at a time with
+db_ops.create_post, first against the primary alone and then with the posts
+table split across more shards, and reports the posts created per second and
+the median latency of a create. Every create also writes the post id counter,
+the change log sequence counter, and the post count aggregates on the
+primary, and holds their row locks until commit (see sharding.py), so the
+throughput is that of the primary's commits, however many shards there are.
+The shards are SQLite files, which lock the whole database on write, so the
+numbers show the ceiling of this layout rather than a MySQL deployment's.
+
+Run from the repository root with: make bench
+"""
+# pylint: disable=wrong-import-position
+
+import os
+os.environ.setdefault("POPULARE_ALLOW_MISSING_SECRET", "")
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    "sqlite:////tmp/populare_benchmark.db"
+)
+import statistics
+import threading
+import time
+from datetime import datetime
+from populare_db_proxy.app_data import app, db
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import init_db_schema, create_post
+from populare_db_proxy.sharding import shard_engines
+
+SHARD_COUNTS = (1, 2, 4)
+NUM_THREADS = 8
+POSTS_PER_THREAD = 200
+SHARD_DATABASE_PATH = "/tmp/populare_benchmark_shard{idx}.db"
+
+
+def configure_shards(count: int) -> None:
+    """Creates empty databases for the primary and count - 1 further shards.
+
+    :param count: The number of shards, including the primary.
+    """
+    for engine in shard_engines()[1:]:
+        engine.dispose()
+    paths = [SHARD_DATABASE_PATH.format(idx=idx) for idx in range(1, count)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    app.config["SQLALCHEMY_BINDS"] = {
+        f"shard{idx}": f"sqlite:///{path}"
+        for idx, path in enumerate(paths, 1)
+    }
+    db.drop_all()
+    init_db_schema()
+
+
+def write_posts(thread_idx: int, latencies: list[float]) -> None:
+    """Creates posts one at a time, recording the latency of each create.
+
+    :param thread_idx: The index of the writer thread.
+    :param latencies: The list to which to append latencies in seconds.
+    """
+    with app.app_context():
+        for idx in range(POSTS_PER_THREAD):
+            post = Post(
+                text=f"text{thread_idx}-{idx}",
+                author=f"author{thread_idx}",
+                created_at=datetime.now()
+            )
+            start = time.perf_counter()
+            create_post(post)
+            latencies.append(time.perf_counter() - start)
+
+
+def measure() -> tuple[float, float]:
+    """Returns the throughput and median latency of concurrent creates.
+
+    :return: A 2-tuple of the posts created per second and the median
+        latency of a create in milliseconds.
+    """
+    latencies = []
+    threads = [
+        threading.Thread(target=write_posts, args=(idx, latencies))
+        for idx in range(NUM_THREADS)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000
+
+
+def main() -> None:
+    """Runs the program."""
+    print(f"{'shards':<8}{'threads':>8}{'posts/s':>10}{'median ms':>12}")
+    for count in SHARD_COUNTS:
+        configure_shards(count)
+        throughput, latency = measure()
+        print(f"{count:<8}{NUM_THREADS:>8}{throughput:>10.0f}{latency:>12.3f}")
+    configure_shards(1)
+
+
+if __name__ == "__main__":
+    main()
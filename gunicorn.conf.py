@@ -0,0 +1,48 @@
+"""Gunicorn server hooks for aggregating Prometheus metrics across workers.
+
+These hooks are active only if PROMETHEUS_MULTIPROC_DIR is set; see
+populare_db_proxy/multiprocess_metrics.py.
+"""
+
+import os
+from populare_db_proxy.multiprocess_metrics import (
+    METRICS_PORT,
+    MULTIPROC_DIR_ENV,
+    mark_worker_dead,
+    multiprocess_enabled,
+    reset_metrics_directory,
+    serve_metrics
+)
+
+
+def on_starting(server: object) -> None:
+    """Clears metrics left by an earlier run before any worker starts.
+
+    :param server: The gunicorn arbiter.
+    """
+    # pylint: disable=unused-argument
+    if multiprocess_enabled():
+        reset_metrics_directory(os.environ[MULTIPROC_DIR_ENV])
+
+
+def when_ready(server: object) -> None:
+    """Serves the merged metrics of all workers from the master process.
+
+    :param server: The gunicorn arbiter.
+    """
+    # pylint: disable=unused-argument
+    if multiprocess_enabled():
+        serve_metrics(
+            int(os.environ.get("POPULARE_METRICS_PORT", METRICS_PORT))
+        )
+
+
+def child_exit(server: object, worker: object) -> None:
+    """Removes an exited worker's values for live gauges.
+
+    :param server: The gunicorn arbiter.
+    :param worker: The exited worker.
+    """
+    # pylint: disable=unused-argument
+    if multiprocess_enabled():
+        mark_worker_dead(worker.pid)
@@ -0,0 +1,191 @@
+"""Contains admission control for database-bound requests.
+
+When the database slows down, admitting every request only lengthens the
+queue: each worker thread blocks on a slow query, new requests wait behind
+them until clients time out, and the clients' retries add still more load.
+Instead, an adaptive concurrency limit caps the number of requests doing
+database work at once. Requests over the limit wait in a short, bounded queue;
+if the queue is full or the wait times out, the request is shed immediately
+with 503 Service Unavailable, which clients can retry after backing off.
+
+The limit follows observed latency in the style of AIMD congestion control.
+Each request's latency is compared with a baseline, the recent minimum
+latency. While latency stays near the baseline and the limit is in use, the
+limit grows additively; when latency exceeds the baseline by the tolerance,
+the database is queueing work, and the limit shrinks multiplicatively.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from flask import Config
+from prometheus_client import Counter, Gauge
+
+ADMISSION_INITIAL_LIMIT = 8
+ADMISSION_MIN_LIMIT = 1
+ADMISSION_MAX_LIMIT = 64
+ADMISSION_QUEUE_SIZE = 32
+ADMISSION_QUEUE_TIMEOUT_SECONDS = 0.5
+# Latency beyond this multiple of the baseline is treated as congestion.
+ADMISSION_LATENCY_TOLERANCE = 2.0
+# Latency below this is never treated as congestion, since jitter in fast
+# requests easily exceeds the tolerance.
+ADMISSION_LATENCY_FLOOR_SECONDS = 0.05
+ADMISSION_BACKOFF_RATIO = 0.9
+# How quickly the baseline rises toward higher latencies, so that it follows
+# lasting changes, e.g., a larger table, rather than staying at an outlier.
+ADMISSION_BASELINE_DECAY = 0.01
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+QUEUE_DEPTH = Gauge(
+    "populare_admission_queue_depth",
+    "Number of requests waiting for admission",
+    multiprocess_mode="livesum"
+)
+IN_FLIGHT = Gauge(
+    "populare_admission_in_flight",
+    "Number of admitted requests in progress",
+    multiprocess_mode="livesum"
+)
+CONCURRENCY_LIMIT = Gauge(
+    "populare_admission_concurrency_limit",
+    "Current adaptive concurrency limit",
+    multiprocess_mode="livesum"
+)
+SHED_REQUESTS = Counter(
+    "populare_admission_shed_requests_total",
+    "Number of requests rejected by admission control",
+    ["reason"]
+)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed by admission control."""
+
+    def __init__(self, reason: str) -> None:
+        """Instantiates the object.
+
+        :param reason: Why the request was shed, QUEUE_FULL or QUEUE_TIMEOUT.
+        """
+        super().__init__(f"Request shed: {reason}")
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """Limits concurrent requests with an adaptive limit and bounded queue."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+            self,
+            initial_limit: float = ADMISSION_INITIAL_LIMIT,
+            min_limit: float = ADMISSION_MIN_LIMIT,
+            max_limit: float = ADMISSION_MAX_LIMIT,
+            queue_size: int = ADMISSION_QUEUE_SIZE,
+            queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS
+    ) -> None:
+        """Instantiates the object.
+
+        :param initial_limit: The starting concurrency limit.
+        :param min_limit: The lowest the limit can fall.
+        :param max_limit: The highest the limit can rise.
+        :param queue_size: The maximum number of waiting requests.
+        :param queue_timeout: The maximum number of seconds a request waits.
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.baseline = None
+        self._condition = threading.Condition()
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def acquire(self) -> None:
+        """Admits a request, waiting in the queue if the limit is reached.
+
+        Every successful call must be paired with a call to release.
+
+        :raises Overloaded: If the queue is full or the wait timed out.
+        """
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                if self.waiting >= self.queue_size:
+                    SHED_REQUESTS.labels(reason=QUEUE_FULL).inc()
+                    raise Overloaded(QUEUE_FULL)
+                self.waiting += 1
+                QUEUE_DEPTH.inc()
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.in_flight < int(self.limit),
+                        timeout=self.queue_timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                    QUEUE_DEPTH.dec()
+                if not admitted:
+                    SHED_REQUESTS.labels(reason=QUEUE_TIMEOUT).inc()
+                    raise Overloaded(QUEUE_TIMEOUT)
+            self.in_flight += 1
+            IN_FLIGHT.inc()
+
+    def release(self, latency: float) -> None:
+        """Completes an admitted request and adapts the limit to its latency.
+
+        :param latency: The number of seconds the request took.
+        """
+        with self._condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            IN_FLIGHT.dec()
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += \
+                    (latency - self.baseline) * ADMISSION_BASELINE_DECAY
+            if latency > max(
+                    self.baseline * ADMISSION_LATENCY_TOLERANCE,
+                    ADMISSION_LATENCY_FLOOR_SECONDS
+            ):
+                self.limit = max(
+                    self.min_limit,
+                    self.limit * ADMISSION_BACKOFF_RATIO
+                )
+            elif saturated:
+                # Only grow a limit that is in use; otherwise, an idle server
+                # would drift to the maximum and admit a burst unchecked.
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Returns a context in which the request is admitted and timed.
+
+        :raises Overloaded: If the request is shed.
+        :return: The admission context.
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+def create_admission_limiter(config: Config) -> AdaptiveLimiter | None:
+    """Returns an admission limiter configured from the app's configuration.
+
+    :param config: The app's configuration.
+    :return: The limiter, or None if admission control is disabled.
+    """
+    if not config["ADMISSION_ENABLED"]:
+        return None
+    return AdaptiveLimiter(
+        max_limit=config["ADMISSION_MAX_LIMIT"],
+        queue_size=config["ADMISSION_QUEUE_SIZE"],
+        queue_timeout=config["ADMISSION_QUEUE_TIMEOUT_SECONDS"]
+    )
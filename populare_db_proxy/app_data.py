@@ -1,45 +1,181 @@
 """Contains application configuration."""
 
 import os
+import sqlite3
 from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, Connection
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.multiprocess import GunicornPrometheusMetrics
 from populare_db_proxy import __version__
+from populare_db_proxy.multiprocess_metrics import multiprocess_enabled
+from populare_db_proxy.memory import register_cache
 
 _DATABASE_SECRET_PATH = "/etc/populare-db-proxy/db-certs/db-uri"
 
 
-def get_database_uri(secret_filename: str = _DATABASE_SECRET_PATH) -> str:
-    """Returns the database URI.
+def get_database_uris(
+        secret_filename: str = _DATABASE_SECRET_PATH
+) -> list[str]:
+    """Returns the database URIs, one per shard of the posts table.
 
-    The database URI is loaded from secret_filename, which is a
-    Kubernetes secret volume mount. If the file is absent, this operation will
-    raise a FileNotFoundError because it cannot correctly function in a
-    distributed setting (see #19). However, for testing, the user can set the
+    The database URIs are loaded from secret_filename, which is a
+    Kubernetes secret volume mount, one per line; the first is the primary
+    database, and each further URI is a shard of the posts table (see
+    sharding.py). If the file is absent, this operation will raise a
+    FileNotFoundError because it cannot correctly function in a distributed
+    setting (see #19). However, for testing, the user can set the
     POPULARE_ALLOW_MISSING_SECRET environment variable, which will cause the
-    database URI to be loaded from the SQLALCHEMY_DATABASE_URI environment
-    variable, defaulting to the path /tmp/populare.db on the local filesystem.
+    primary database URI to be loaded from the SQLALCHEMY_DATABASE_URI
+    environment variable, defaulting to the path /tmp/populare.db on the local
+    filesystem, and any shard URIs from the whitespace-separated
+    POPULARE_SHARD_DATABASE_URIS environment variable.
 
     :param secret_filename: The path to the file containing the secret.
-    :return: The database URI.
+    :return: The database URIs; the first is the primary database.
     """
     try:
         with open(secret_filename, "r", encoding="utf-8") as infile:
-            return infile.read()
+            return [line.strip() for line in infile if line.strip()]
     except FileNotFoundError as exc:
         if "POPULARE_ALLOW_MISSING_SECRET" in os.environ:
-            return os.environ.get(
+            primary = os.environ.get(
                 "SQLALCHEMY_DATABASE_URI",
                 "sqlite:////tmp/populare.db"
             )
+            shards = os.environ.get("POPULARE_SHARD_DATABASE_URIS", "")
+            return [primary] + shards.split()
         raise exc
 
 
+def get_database_uri(secret_filename: str = _DATABASE_SECRET_PATH) -> str:
+    """Returns the URI of the primary database.
+
+    :param secret_filename: The path to the file containing the secret; see
+        get_database_uris.
+    :return: The database URI.
+    """
+    return get_database_uris(secret_filename)[0]
+
+
+@event.listens_for(Engine, "connect")
+def _disable_pysqlite_transactions(
+        dbapi_connection: object,
+        connection_record: object
+) -> None:
+    """Stops pysqlite from managing transactions itself.
+
+    pysqlite does not begin a transaction before a SAVEPOINT, so releasing the
+    first SAVEPOINT of a transaction would commit it. SQLAlchemy emits BEGIN
+    itself instead (see _begin_sqlite_transaction). See the SQLAlchemy
+    documentation on serializable isolation and savepoints with pysqlite.
+
+    :param dbapi_connection: The DBAPI connection.
+    :param connection_record: The connection's pool record.
+    """
+    # pylint: disable=unused-argument
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, "begin")
+def _begin_sqlite_transaction(connection: Connection) -> None:
+    """Begins a transaction on SQLite connections.
+
+    :param connection: The connection on which a transaction is beginning.
+    """
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("BEGIN")
+
+
 app = Flask(__name__)
 CORS(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config["SQLALCHEMY_DATABASE_URI"] = get_database_uri()
+_database_uris = get_database_uris()
+app.config["SQLALCHEMY_DATABASE_URI"] = _database_uris[0]
+# Shards of the posts table beyond the primary; see sharding.py.
+app.config["SQLALCHEMY_BINDS"] = {
+    f"shard{idx}": uri for idx, uri in enumerate(_database_uris[1:], 1)
+}
+# Directory in which gunicorn workers relay live feed events to each other.
+app.config["FEED_RELAY_DIR"] = os.environ.get("POPULARE_FEED_RELAY_DIR")
+# Maximum number of live feed streams per worker. Each stream holds one of the
+# worker's threads, which also serve /graphql and REST, so this must be well
+# below the thread count; further streams are rejected with 503.
+app.config["FEED_MAX_SUBSCRIPTIONS"] = int(
+    os.environ.get("POPULARE_FEED_MAX_SUBSCRIPTIONS", "4"))
+# Per-client rate limits; see rate_limit.py.
+app.config["RATE_LIMIT_ENABLED"] = \
+    os.environ.get("POPULARE_RATE_LIMIT_ENABLED", "1") != "0"
+app.config["RATE_LIMIT_READS_PER_SECOND"] = float(
+    os.environ.get("POPULARE_RATE_LIMIT_READS_PER_SECOND", "50"))
+app.config["RATE_LIMIT_READ_BURST"] = float(
+    os.environ.get("POPULARE_RATE_LIMIT_READ_BURST", "100"))
+app.config["RATE_LIMIT_WRITES_PER_SECOND"] = float(
+    os.environ.get("POPULARE_RATE_LIMIT_WRITES_PER_SECOND", "10"))
+app.config["RATE_LIMIT_WRITE_BURST"] = float(
+    os.environ.get("POPULARE_RATE_LIMIT_WRITE_BURST", "20"))
+# File in which gunicorn workers share rate limit buckets; if unset, each
+# worker enforces the limits independently.
+app.config["RATE_LIMIT_STORE"] = os.environ.get("POPULARE_RATE_LIMIT_STORE")
+# Header, set by a trusted upstream proxy, that identifies the client.
+app.config["RATE_LIMIT_IDENTITY_HEADER"] = os.environ.get(
+    "POPULARE_RATE_LIMIT_IDENTITY_HEADER")
+# Adaptive concurrency limit on database-bound requests; see admission.py.
+app.config["ADMISSION_ENABLED"] = \
+    os.environ.get("POPULARE_ADMISSION_ENABLED", "1") != "0"
+app.config["ADMISSION_MAX_LIMIT"] = int(
+    os.environ.get("POPULARE_ADMISSION_MAX_LIMIT", "64"))
+app.config["ADMISSION_QUEUE_SIZE"] = int(
+    os.environ.get("POPULARE_ADMISSION_QUEUE_SIZE", "32"))
+app.config["ADMISSION_QUEUE_TIMEOUT_SECONDS"] = float(
+    os.environ.get("POPULARE_ADMISSION_QUEUE_TIMEOUT_SECONDS", "0.5"))
+# Per-worker buffer of the most recent posts; see recent_posts.py. A size of 0
+# disables the buffer.
+app.config["RECENT_POSTS_SIZE"] = int(
+    os.environ.get("POPULARE_RECENT_POSTS_SIZE", "1000"))
+app.config["RECENT_POSTS_RECONCILE_SECONDS"] = float(
+    os.environ.get("POPULARE_RECENT_POSTS_RECONCILE_SECONDS", "1.0"))
+# Local write journal that accepts posts while the database is unavailable;
+# see journal.py. If unset, the journal is disabled.
+app.config["JOURNAL_DIR"] = os.environ.get("POPULARE_JOURNAL_DIR")
+app.config["JOURNAL_SEGMENT_BYTES"] = int(
+    os.environ.get("POPULARE_JOURNAL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+app.config["JOURNAL_ID_BLOCK_SIZE"] = int(
+    os.environ.get("POPULARE_JOURNAL_ID_BLOCK_SIZE", "1000"))
+# Deadline for each GraphQL request's database work; clients may shorten it
+# with the timeout header. See deadline.py.
+app.config["REQUEST_TIMEOUT_SECONDS"] = float(
+    os.environ.get("POPULARE_REQUEST_TIMEOUT_SECONDS", "10"))
+app.config["REQUEST_TIMEOUT_HEADER"] = os.environ.get(
+    "POPULARE_REQUEST_TIMEOUT_HEADER", "X-Request-Timeout")
+app.config["REQUEST_RETRY_ATTEMPTS"] = int(
+    os.environ.get("POPULARE_REQUEST_RETRY_ATTEMPTS", "3"))
+# Number of seconds for which clients may cache REST responses for reads.
+app.config["REST_MAX_AGE_SECONDS"] = int(
+    os.environ.get("POPULARE_REST_MAX_AGE_SECONDS", "1"))
+# Directory of the on-disk ring of request profiles; see profiling.py. If
+# unset, profiling is disabled.
+app.config["PROFILE_DIR"] = os.environ.get("POPULARE_PROFILE_DIR")
+app.config["PROFILE_RING_SIZE"] = int(
+    os.environ.get("POPULARE_PROFILE_RING_SIZE", "100"))
+# Secret that requests send to be profiled and that the admin endpoints
+# require; if unset, requests are only sampled and the admin endpoints are
+# disabled, including the memory endpoints.
+app.config["PROFILE_TOKEN"] = os.environ.get("POPULARE_PROFILE_TOKEN")
+app.config["PROFILE_SAMPLE_RATE"] = float(
+    os.environ.get("POPULARE_PROFILE_SAMPLE_RATE", "0"))
 db = SQLAlchemy(app)
-metrics = PrometheusMetrics(app)
+# SQLAlchemy caches compiled statements per engine; see query_cache_size.
+register_cache(
+    "sqlalchemy_compiled_statements",
+    lambda: len(db.engine._compiled_cache)  # pylint: disable=protected-access
+)
+# With multiprocess metrics, the gunicorn master serves all workers' metrics on
+# a dedicated port instead of each worker serving its own at /metrics. See
+# multiprocess_metrics.py.
+metrics = GunicornPrometheusMetrics(app) if multiprocess_enabled() \
+    else PrometheusMetrics(app)
 metrics.info('app_info', 'Application info', version=__version__)
@@ -0,0 +1,382 @@
+"""Contains functions for the archive tier of post storage.
+
+Cold posts are moved out of the hot posts table into per-month archive tables
+(e.g., posts_archive_2022_01) so that the hot table and its indexes stay small
+enough to fit in the buffer pool. The archive_partitions table records which
+archive tables exist and the range of created_at values each one holds, so that
+readers can walk partitions newest-first and stop as soon as they have enough
+posts. Archive tables are plain tables rather than native MySQL range
+partitions so that the same code runs on SQLite.
+
+A post keeps its id when it is archived. A post in a posts table whose id an
+archive table already holds, which only databases that reused ids can have,
+is a different post; it is left in the posts table and logged rather than
+archived over the other.
+"""
+
+from __future__ import annotations
+import logging
+from datetime import datetime
+from sqlalchemy import Table, Index, and_, or_, select, insert, delete
+from sqlalchemy.engine import Connection, Row, RowMapping
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from populare_db_proxy.db_schema import Post, PostRow, ArchivePartition, \
+    post_row_columns
+from populare_db_proxy.author_cache import post_rows
+from populare_db_proxy.sharding import (
+    num_shards,
+    shard_engines,
+    SHARD_POSTS_TABLE
+)
+from populare_db_proxy.app_data import db
+
+ARCHIVE_TABLE_PREFIX = "posts_archive_"
+ARCHIVE_BATCH_SIZE = 1000
+_logger = logging.getLogger(__name__)
+
+
+def month_of(timestamp: datetime) -> str:
+    """Returns the partition key for the month containing timestamp.
+
+    :param timestamp: The datetime.
+    :return: The partition key, formatted as "YYYY-MM".
+    """
+    return timestamp.strftime("%Y-%m")
+
+
+def archive_table(month: str) -> Table:
+    """Returns the archive table for a month, defining it if necessary.
+
+    The table has the same columns as the posts table, plus an index on
+    created_at. This function does not create the table in the database.
+
+    :param month: The partition key, formatted as "YYYY-MM".
+    :return: The archive table.
+    """
+    name = ARCHIVE_TABLE_PREFIX + month.replace("-", "_")
+    if name in db.metadata.tables:
+        return db.metadata.tables[name]
+    table = Post.__table__.to_metadata(db.metadata, name=name)
+    Index(f"ix_{name}_created_at", table.c.created_at)
+    return table
+
+
+def read_partitions(
+        session: Session,
+        before: datetime | None = None
+) -> list[ArchivePartition]:
+    """Returns the archive partitions, newest first.
+
+    :param session: The session in which to read.
+    :param before: If supplied, only return partitions that may hold posts
+        created earlier than this datetime.
+    :return: The archive partitions, newest first.
+    """
+    statement = select(ArchivePartition) \
+        .order_by(ArchivePartition.month.desc())
+    if before is not None:
+        statement = statement.where(ArchivePartition.min_created_at < before)
+    return list(session.execute(statement).scalars())
+
+
+def merge_archived_posts(
+        session: Session,
+        posts: list[PostRow],
+        limit: int,
+        before: datetime
+) -> list[PostRow]:
+    """Merges posts from the archive partitions into a page of hot posts.
+
+    Partitions are visited newest-first. The walk stops as soon as there are
+    `limit` posts that are all newer than everything in the remaining
+    partitions, so a page that is satisfied by the hot table only reads the
+    partition registry.
+
+    :param session: The session in which to read.
+    :param posts: The page of posts read from the hot table, most recent first.
+    :param limit: The maximum number of posts to return.
+    :param before: Only posts created earlier than this datetime are returned.
+    :return: The no more than `limit` most recent posts from the hot table and
+        the archive, most recent first, with ties on created_at broken by id,
+        as the hot table orders them.
+    """
+    for partition in read_partitions(session, before=before):
+        if len(posts) >= limit and \
+                posts[limit - 1].created_at > partition.max_created_at:
+            break
+        table = archive_table(partition.month)
+        rows = session.connection().execute(
+            select(*post_row_columns(table))
+                .where(table.c.created_at < before)
+                .order_by(table.c.created_at.desc(), table.c.id.desc())
+                .limit(limit)
+        )
+        posts = posts + post_rows(session.connection(), rows)
+        posts.sort(key=lambda post: (post.created_at, post.id), reverse=True)
+        posts = posts[:limit]
+    return posts
+
+
+def find_archived_post(
+        session: Session,
+        post_id: int
+) -> tuple[Table, PostRow] | None:
+    """Returns the archive table and contents of an archived post.
+
+    The post's row is locked until the session's transaction ends, since the
+    callers are about to update or delete it.
+
+    :param session: The session in which to read.
+    :param post_id: The id of the post to find.
+    :return: The archive table containing the post and the post, or None if
+        no archive table contains the post.
+    """
+    for partition in read_partitions(session):
+        table = archive_table(partition.month)
+        row = session.execute(
+            select(*post_row_columns(table))
+                .where(table.c.id == post_id)
+                .with_for_update()
+        ).first()
+        if row is not None:
+            return table, post_rows(session.connection(), [row])[0]
+    return None
+
+
+def archive_posts(
+        older_than: datetime,
+        batch_size: int = ARCHIVE_BATCH_SIZE
+) -> int:
+    """Moves posts created before older_than into the archive partitions.
+
+    Posts are moved oldest first in batches of at most batch_size, each batch
+    in its own short transaction, so that the hot table is never locked for
+    long. If the posts table is sharded, every shard's posts are moved in
+    turn into the archive partitions, which are on the primary. Post counts
+    and activity rollups are unaffected, since the posts still exist.
+
+    :param older_than: Posts created earlier than this datetime are archived.
+    :param batch_size: The maximum number of posts to move per transaction.
+    :return: The number of posts archived.
+    """
+    return sum(
+        _archive_shard_posts(shard, older_than, batch_size)
+        for shard in range(num_shards())
+    )
+
+
+def _archive_shard_posts(
+        shard: int,
+        older_than: datetime,
+        batch_size: int
+) -> int:
+    """Moves one shard's posts created before older_than into the archive.
+
+    :param shard: The index of the shard.
+    :param older_than: Posts created earlier than this datetime are archived.
+    :param batch_size: The maximum number of posts to move per transaction.
+    :return: The number of posts archived.
+    """
+    engine = shard_engines()[shard]
+    posts = Post.__table__ if shard == 0 else SHARD_POSTS_TABLE
+    num_archived = 0
+    statement = select(posts.c.id, posts.c.created_at) \
+        .where(posts.c.created_at < older_than) \
+        .order_by(posts.c.created_at, posts.c.id) \
+        .limit(batch_size)
+    last = None
+    while True:
+        with engine.begin() as connection:
+            # Posts that could not be archived stay behind; later batches
+            # start after them.
+            candidates = connection.execute(statement if last is None else
+                statement.where(or_(
+                    posts.c.created_at > last.created_at,
+                    and_(
+                        posts.c.created_at == last.created_at,
+                        posts.c.id > last.id
+                    )
+                ))
+            ).all()
+        if not candidates:
+            return num_archived
+        last = candidates[-1]
+        months = {month_of(row.created_at) for row in candidates}
+        for month in months:
+            # DDL implicitly commits on MySQL, so it happens outside of the
+            # transaction that moves the rows.
+            archive_table(month).create(db.engine, checkfirst=True)
+        if shard == 0:
+            with Session(db.engine) as session:
+                with session.begin():
+                    num_archived += _move_batch(
+                        session,
+                        session.connection(),
+                        posts,
+                        candidates,
+                        older_than
+                    )
+            continue
+        # The archive commits before the shard's delete, so that an
+        # interruption between them leaves a copy, which the next run
+        # replaces, rather than losing the posts.
+        with engine.begin() as connection:
+            with Session(db.engine) as session:
+                with session.begin():
+                    num_archived += _move_batch(
+                        session,
+                        connection,
+                        posts,
+                        candidates,
+                        older_than
+                    )
+
+
+def _move_batch(
+        session: Session,
+        connection: Connection,
+        posts: Table,
+        candidates: list[Row],
+        older_than: datetime
+) -> int:
+    """Moves a batch of posts from a shard's posts table into the archive.
+
+    :param session: The session in which to write the archive, on the
+        primary.
+    :param connection: The connection to the shard in its own transaction,
+        or the session's connection if the shard is the primary.
+    :param posts: The shard's posts table.
+    :param candidates: The ids and creation datetimes of the posts to move.
+    :param older_than: Only posts created earlier than this datetime are
+        moved.
+    :return: The number of posts moved.
+    """
+    # Re-read the batch under lock in case it changed since the candidates
+    # were selected.
+    rows = connection.execute(
+        select(posts)
+            .where(posts.c.id.in_([row.id for row in candidates]))
+            .where(posts.c.created_at < older_than)
+            .with_for_update()
+    ).mappings().all()
+    months = {month_of(row.created_at) for row in candidates}
+    by_month = {}
+    for row in rows:
+        month = month_of(row["created_at"])
+        by_month.setdefault(month, []).append(row)
+    num_moved = 0
+    for month, month_rows in by_month.items():
+        if month in months:
+            num_moved += _move_rows(
+                session,
+                connection,
+                posts,
+                month,
+                month_rows
+            )
+    return num_moved
+
+
+def _move_rows(
+        session: Session,
+        connection: Connection,
+        posts: Table,
+        month: str,
+        rows: list[RowMapping]
+) -> int:
+    """Moves rows from a posts table into a month's archive partition.
+
+    :param session: The session in which to write the archive.
+    :param connection: The connection on which to delete the rows.
+    :param posts: The posts table that holds the rows.
+    :param month: The partition key, formatted as "YYYY-MM".
+    :param rows: The rows of the posts table to move.
+    :return: The number of rows moved; see _insert_archived_rows.
+    """
+    table = archive_table(month)
+    rows = _insert_archived_rows(session, table, rows)
+    if not rows:
+        return 0
+    connection.execute(
+        delete(posts).where(posts.c.id.in_([row["id"] for row in rows]))
+    )
+    partition = session.get(ArchivePartition, month)
+    min_created_at = min(row["created_at"] for row in rows)
+    max_created_at = max(row["created_at"] for row in rows)
+    if partition is None:
+        session.add(ArchivePartition(
+            month=month,
+            table_name=table.name,
+            min_created_at=min_created_at,
+            max_created_at=max_created_at
+        ))
+    else:
+        partition.min_created_at = min(
+            partition.min_created_at,
+            min_created_at
+        )
+        partition.max_created_at = max(
+            partition.max_created_at,
+            max_created_at
+        )
+    return len(rows)
+
+
+def _insert_archived_rows(
+        session: Session,
+        table: Table,
+        rows: list[RowMapping]
+) -> list[RowMapping]:
+    """Inserts rows of a posts table into an archive table.
+
+    Rows are inserted together, or one at a time if any id is already
+    archived. An archived row identical to the row being inserted was copied
+    by an interrupted run, which archived posts without deleting them from
+    their shard, so the row counts as inserted. Any other archived row with
+    the same id belongs to a different post, which is kept; the row is not
+    inserted.
+
+    :param session: The session in which to write the archive.
+    :param table: The archive table.
+    :param rows: The rows to insert.
+    :return: The rows that are now archived, which may be deleted from their
+        posts table.
+    """
+    try:
+        with session.begin_nested():
+            session.execute(insert(table), [dict(row) for row in rows])
+        return rows
+    except IntegrityError:
+        pass
+    archived = []
+    for row in rows:
+        try:
+            with session.begin_nested():
+                session.execute(insert(table), [dict(row)])
+        except IntegrityError:
+            existing = session.execute(
+                select(table).where(table.c.id == row["id"])
+            ).mappings().one()
+            if dict(existing) != dict(row):
+                _logger.warning(
+                    "Post %d was not archived: %s holds another post with "
+                    "its id",
+                    row["id"],
+                    table.name
+                )
+                continue
+        archived.append(row)
+    return archived
+
+
+def archived_tables(session: Session) -> list[Table]:
+    """Returns every archive table, newest first.
+
+    :param session: The session in which to read.
+    :return: The archive tables, newest first.
+    """
+    return [
+        archive_table(partition.month)
+        for partition in read_partitions(session)
+    ]
@@ -0,0 +1,244 @@
+"""Contains the cache of author ids.
+
+Posts store the id of their author rather than the author's name; see
+db_schema.Author. Writes turn names into ids, creating authors that do not
+exist yet, and reads of posts tables turn ids back into names. Authors are
+never renamed or deleted, so both directions are cached in a bounded LRU, and
+most writes and reads do not touch the authors table at all. Names are
+resolved here rather than by joining the authors table, because the shards
+of the posts table hold no authors table; see sharding.py.
+
+Entries are only cached once the transaction that read or created them
+commits, so the id of an author whose creation is rolled back, and which the
+database may assign again, is never cached.
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any
+from prometheus_client import Counter
+from sqlalchemy import event, inspect, insert, select
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.orm import Mapper
+from populare_db_proxy.db_schema import Author, Post, PostRow
+from populare_db_proxy.memory import register_cache
+from populare_db_proxy.sessions import after_commit
+
+AUTHOR_CACHE_SIZE = 10000
+AUTHOR_CACHE_LOOKUPS = Counter(
+    "populare_author_cache_lookups_total",
+    "Number of author id cache lookups",
+    ["result"]
+)
+# Authors that exist are skipped, not raised as duplicates.
+_INSERT_AUTHORS = insert(Author) \
+    .prefix_with("OR IGNORE", dialect="sqlite") \
+    .prefix_with("IGNORE", dialect="mysql")
+
+
+class AuthorCache:
+    """Caches the ids of authors by name, and their names by id."""
+
+    def __init__(self, size: int = AUTHOR_CACHE_SIZE) -> None:
+        """Instantiates the object.
+
+        :param size: The maximum number of authors; the least recently used
+            authors are evicted beyond this.
+        """
+        self.size = size
+        self._ids = OrderedDict()
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = AUTHOR_CACHE_LOOKUPS.labels(result="hit")
+        self._misses = AUTHOR_CACHE_LOOKUPS.labels(result="miss")
+
+    def ids(
+            self,
+            connection: Connection,
+            names: Iterable[str]
+    ) -> dict[str, int]:
+        """Returns the ids of authors, creating authors that do not exist.
+
+        :param connection: A connection to the primary database in the
+            current transaction, in which any new authors are created.
+        :param names: The authors' names.
+        :return: A mapping from name to id.
+        """
+        result, missing = self._lookup(self._ids, names)
+        if not missing:
+            return result
+        # Inserting before reading takes SQLite's write lock first, so that
+        # concurrent writers wait for it instead of failing to upgrade a read
+        # lock. Authors that exist are skipped, and the locking read also
+        # sees those that another transaction committed since this one
+        # started.
+        connection.execute(
+            _INSERT_AUTHORS,
+            [{"name": name} for name in sorted(missing)]
+        )
+        found = dict(connection.execute(
+            select(Author.name, Author.id)
+                .where(Author.name.in_(missing))
+                .with_for_update()
+        ).all())
+        result.update(found)
+        self._put_after_commit(found.items())
+        return result
+
+    def names(
+            self,
+            connection: Connection,
+            author_ids: Iterable[int]
+    ) -> dict[int, str]:
+        """Returns the names of authors.
+
+        :param connection: A connection to the primary database in the
+            current transaction.
+        :param author_ids: The authors' ids.
+        :return: A mapping from id to name for every id that exists.
+        """
+        result, missing = self._lookup(self._names, author_ids)
+        if not missing:
+            return result
+        found = dict(connection.execute(
+            select(Author.id, Author.name).where(Author.id.in_(missing))
+        ).all())
+        result.update(found)
+        self._put_after_commit(
+            (name, author_id) for author_id, name in found.items()
+        )
+        return result
+
+    def clear(self) -> None:
+        """Removes every author."""
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+    def __len__(self) -> int:
+        """Returns the number of cached authors.
+
+        :return: The number of cached authors.
+        """
+        return len(self._ids)
+
+    def _lookup(
+            self,
+            entries: OrderedDict,
+            keys: Iterable[Hashable]
+    ) -> tuple[dict, set]:
+        """Looks keys up in one direction of the cache.
+
+        :param entries: The names by id, or the ids by name.
+        :param keys: The keys to look up.
+        :return: A 2-tuple of the cached entries and the keys that missed.
+        """
+        result = {}
+        missing = set()
+        with self._lock:
+            for key in set(keys):
+                value = entries.get(key)
+                if value is None:
+                    missing.add(key)
+                else:
+                    entries.move_to_end(key)
+                    result[key] = value
+        self._hits.inc(len(result))
+        self._misses.inc(len(missing))
+        return result, missing
+
+    def _put_after_commit(self, authors: Iterable[tuple[str, int]]) -> None:
+        """Caches authors once the current transaction commits.
+
+        :param authors: The authors' names and ids.
+        """
+        authors = list(authors)
+        if authors:
+            after_commit(lambda: self._put(authors))
+
+    def _put(self, authors: list[tuple[str, int]]) -> None:
+        """Caches authors in both directions.
+
+        :param authors: The authors' names and ids.
+        """
+        with self._lock:
+            for name, author_id in authors:
+                self._ids[name] = author_id
+                self._ids.move_to_end(name)
+                self._names[author_id] = name
+                self._names.move_to_end(author_id)
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            while len(self._names) > self.size:
+                self._names.popitem(last=False)
+
+
+author_cache = AuthorCache()
+register_cache("author_ids", author_cache.__len__)
+
+
+@event.listens_for(Author.__table__, "after_drop")
+def _after_drop(*args: Any, **kwargs: Any) -> None:
+    """Clears the cache once the authors table is dropped, e.g., in tests,
+    since a new authors table reuses ids.
+
+    :param args: The event arguments.
+    :param kwargs: The event keyword arguments.
+    """
+    # pylint: disable=unused-argument
+    author_cache.clear()
+
+
+def post_rows(connection: Connection, rows: Iterable[Row]) -> list[PostRow]:
+    """Returns the posts in rows read from a posts table.
+
+    :param connection: A connection to the primary database in the current
+        transaction.
+    :param rows: The rows, read with db_schema.post_row_columns from any
+        posts table, including a shard's or an archive table.
+    :return: The posts, in input order, with their authors' names.
+    """
+    rows = list(rows)
+    names = author_cache.names(connection, {row.author_id for row in rows})
+    return [
+        PostRow(
+            row.id,
+            row.text,
+            names[row.author_id],
+            row.created_at,
+            row.version
+        )
+        for row in rows
+    ]
+
+
+@event.listens_for(Post, "before_insert")
+def _before_insert(mapper: Mapper, connection: Connection, post: Post) -> None:
+    """Resolves the author id of a post added through the ORM.
+
+    :param mapper: The Post mapper.
+    :param connection: The connection on which the post is inserted.
+    :param post: The post.
+    """
+    # pylint: disable=unused-argument
+    if post.author_id is None and post.author is not None:
+        post.author_id = author_cache.ids(connection, [post.author])[
+            post.author
+        ]
+
+
+@event.listens_for(Post, "before_update")
+def _before_update(mapper: Mapper, connection: Connection, post: Post) -> None:
+    """Resolves the author id of a post whose author changed through the ORM.
+
+    :param mapper: The Post mapper.
+    :param connection: The connection on which the post is updated.
+    :param post: The post.
+    """
+    # pylint: disable=unused-argument
+    if inspect(post).attrs.author.history.added:
+        post.author_id = author_cache.ids(connection, [post.author])[
+            post.author
+        ]
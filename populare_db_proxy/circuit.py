@@ -0,0 +1,352 @@
+"""Contains the database circuit breaker and the stale feed page cache.
+
+When the database is slow or unreachable, every request that touches it waits
+for a timeout before failing, which ties up workers and adds load to a database
+that is already struggling. The circuit breaker watches every statement the
+engine executes. After enough consecutive failures, or latency breaches by
+statements issued within a request's deadline, it opens, and statements fail
+immediately with CircuitOpenError instead of reaching the database. After a
+cool-down, the breaker is half-open: a single statement is let through as a
+probe, and its outcome either closes the breaker or opens it for another
+cool-down.
+
+While the database is unavailable, read_posts serves the last good copy of
+the requested feed page, if it has one, and marks the response as stale. The
+first stale read after the cool-down starts a background refresh, which sends
+the half-open probe and, once the database recovers, re-reads every cached
+page.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from contextvars import ContextVar
+from typing import Any
+from prometheus_client import Counter, Gauge
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, ExceptionContext
+from sqlalchemy.exc import InterfaceError, OperationalError
+from populare_db_proxy.deadline import deadline_exceeded, remaining
+from populare_db_proxy.memory import register_cache
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_LATENCY_THRESHOLD_SECONDS = 1.0
+CIRCUIT_RESET_SECONDS = 10.0
+STALE_PAGE_CACHE_SIZE = 64
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+CIRCUIT_STATE = Gauge(
+    "populare_circuit_state",
+    "Database circuit breaker state (0 closed, 1 half-open, 2 open)",
+    multiprocess_mode="livemax"
+)
+STALE_PAGES_SERVED = Counter(
+    "populare_stale_pages_served_total",
+    "Number of feed pages served from the stale cache"
+)
+_served_stale = ContextVar("served_stale", default=False)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a statement is rejected because the breaker is open."""
+
+
+class CircuitBreaker:
+    """Tracks database health and rejects statements while it is down."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+            self,
+            failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+            latency_threshold: float = CIRCUIT_LATENCY_THRESHOLD_SECONDS,
+            reset_seconds: float = CIRCUIT_RESET_SECONDS
+    ) -> None:
+        """Instantiates the object in the closed state.
+
+        :param failure_threshold: The number of consecutive failures or
+            latency breaches that opens the breaker.
+        :param latency_threshold: The number of seconds beyond which a
+            successful statement counts as a breach.
+        :param reset_seconds: The number of seconds the breaker stays open
+            before allowing a probe.
+        """
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Closes the breaker and forgets past failures."""
+        with self._lock:
+            self._set_state(CLOSED)
+            self.failures = 0
+            self.opened_at = 0.0
+            self.probe_started_at = None
+
+    def _set_state(self, state: str) -> None:
+        """Sets the breaker's state. The caller must hold the lock.
+
+        :param state: The new state.
+        """
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Returns whether a statement may be sent to the database.
+
+        While half-open, only one probe is allowed at a time; if a probe has
+        not reported back within reset_seconds, another is allowed.
+
+        :return: Whether a statement may be sent to the database.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self.opened_at < self.reset_seconds:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.probe_started_at is not None and \
+                    now - self.probe_started_at < self.reset_seconds:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def probe_due(self) -> bool:
+        """Returns whether the breaker would let a probe through now.
+
+        :return: Whether the breaker would let a probe through now.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= \
+                    self.reset_seconds
+            return self.state == HALF_OPEN and self.probe_started_at is None
+
+    def record_success(self, latency: float | None) -> None:
+        """Records a completed statement.
+
+        :param latency: The number of seconds the statement took, or None if
+            the statement is not held to the latency threshold.
+        """
+        if latency is not None and latency > self.latency_threshold:
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self.probe_started_at = None
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        """Records a failed or slow statement; may open the breaker."""
+        with self._lock:
+            self.failures += 1
+            self.probe_started_at = None
+            if self.state == HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                self._set_state(OPEN)
+                self.opened_at = time.monotonic()
+
+
+class StalePageCache:
+    """Keeps the last good copy of recently read feed pages."""
+
+    def __init__(self, size: int = STALE_PAGE_CACHE_SIZE) -> None:
+        """Instantiates the object.
+
+        :param size: The maximum number of pages; the least recently stored
+            pages are evicted beyond this.
+        """
+        self.size = size
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, key: tuple) -> Any | None:
+        """Returns a cached page.
+
+        :param key: The page's key.
+        :return: The page, or None if it is not cached.
+        """
+        with self._lock:
+            return self._pages.get(key)
+
+    def put(self, key: tuple, page: Any) -> None:
+        """Stores the latest good copy of a page.
+
+        :param key: The page's key.
+        :param page: The page.
+        """
+        with self._lock:
+            self._pages.pop(key, None)
+            self._pages[key] = page
+            if len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+
+    def keys(self) -> list[tuple]:
+        """Returns the keys of the cached pages.
+
+        :return: The keys of the cached pages.
+        """
+        with self._lock:
+            return list(self._pages)
+
+    def clear(self) -> None:
+        """Removes every page."""
+        with self._lock:
+            self._pages.clear()
+
+    def __len__(self) -> int:
+        """Returns the number of cached pages.
+
+        :return: The number of cached pages.
+        """
+        return len(self._pages)
+
+    def refresh_in_background(
+            self,
+            read_page: Callable[[tuple], Any]
+    ) -> threading.Thread | None:
+        """Re-reads every cached page in a background thread.
+
+        Only one refresh runs at a time. Pages that fail to load keep their
+        stale copies; the refresh stops at the first failure, since the
+        database is still unavailable.
+
+        :param read_page: A function that reads a page from the database
+            given its key.
+        :return: The refresh thread, or None if a refresh is already running.
+        """
+        with self._lock:
+            if self._refreshing:
+                return None
+            self._refreshing = True
+
+        def refresh() -> None:
+            """Re-reads the cached pages."""
+            try:
+                for key in self.keys():
+                    self.put(key, read_page(key))
+            except (CircuitOpenError, OperationalError, InterfaceError):
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        return thread
+
+
+def mark_stale() -> None:
+    """Marks the current request's response as containing stale data."""
+    STALE_PAGES_SERVED.inc()
+    _served_stale.set(True)
+
+
+def served_stale() -> bool:
+    """Returns whether the current request was served stale data.
+
+    :return: Whether the current request was served stale data.
+    """
+    return _served_stale.get()
+
+
+def reset_stale() -> None:
+    """Clears the current request's stale mark."""
+    _served_stale.set(False)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool
+) -> None:
+    """Rejects statements while the breaker is open and times the others.
+
+    :param conn: The connection.
+    :param cursor: The DBAPI cursor.
+    :param statement: The statement.
+    :param parameters: The statement's parameters.
+    :param context: The execution context.
+    :param executemany: Whether the statement is an executemany.
+    """
+    # pylint: disable=unused-argument,too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    if not database_breaker.allow():
+        raise CircuitOpenError("Database circuit breaker is open")
+    conn.info.setdefault("circuit_start_times", []).append(time.monotonic())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool
+) -> None:
+    """Records a completed statement's latency.
+
+    Only statements issued within a request's deadline are held to the
+    latency threshold. Maintenance jobs, e.g., archiving and retention, run
+    outside of requests, and their batch statements are slow by design.
+
+    :param conn: The connection.
+    :param cursor: The DBAPI cursor.
+    :param statement: The statement.
+    :param parameters: The statement's parameters.
+    :param context: The execution context.
+    :param executemany: Whether the statement is an executemany.
+    """
+    # pylint: disable=unused-argument,too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    start = conn.info["circuit_start_times"].pop()
+    database_breaker.record_success(
+        time.monotonic() - start if remaining() is not None else None
+    )
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context: ExceptionContext) -> None:
+    """Records a failed statement.
+
+    Only operational errors, e.g., lost connections and timeouts, count as
+    failures; errors caused by the statement itself, or by the request's
+    deadline (see deadline.py), do not.
+
+    :param context: The exception context.
+    """
+    start_times = context.connection.info.get("circuit_start_times") \
+        if context.connection is not None else None
+    if start_times:
+        start_times.pop()
+    if deadline_exceeded():
+        # The request ran out of time; the database did not fail.
+        return
+    if context.is_disconnect or isinstance(
+            context.sqlalchemy_exception,
+            (OperationalError, InterfaceError)
+    ):
+        database_breaker.record_failure()
+
+
+database_breaker = CircuitBreaker()
+stale_feed_pages = StalePageCache()
+register_cache("stale_feed_pages", stale_feed_pages.__len__)
@@ -3,70 +3,777 @@
 See the AWS RDS Python interface documentation here:
 https://docs.aws.amazon.com/AmazonRDS/latest/UserGuide/UsingWithRDS.IAMDBAuth.Connecting.Python.html
 """
+# pylint: disable=too-many-lines
 
 from __future__ import annotations
+import json
+from collections import Counter
+from collections.abc import Iterable
 from datetime import datetime
-from sqlalchemy import select, update, delete
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import OperationalError
-from populare_db_proxy.db_schema import Post
+from sqlalchemy import (
+    Column,
+    Table,
+    column as column_clause,
+    table as table_clause,
+    select,
+    insert,
+    update,
+    delete,
+    func,
+    inspect,
+    bindparam
+)
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine, Row
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.exc import InterfaceError, OperationalError
+from populare_db_proxy.db_schema import (
+    Author,
+    Post,
+    PostRow,
+    PostCounter,
+    AuthorStats,
+    PostActivity,
+    PostChange,
+    TOTAL_POSTS_COUNTER,
+    CHANGES_COUNTER,
+    CHANGES_PRUNED_THROUGH_COUNTER,
+    POST_IDS_COUNTER,
+    JOURNAL_IDS_COUNTER,
+    post_row_columns
+)
+from populare_db_proxy.author_cache import author_cache, post_rows
+from populare_db_proxy.archive import (
+    ARCHIVE_TABLE_PREFIX,
+    merge_archived_posts,
+    find_archived_post,
+    archived_tables
+)
+from populare_db_proxy.sessions import (
+    session_scope,
+    get_request_session,
+    after_commit
+)
+from populare_db_proxy.feed import (
+    feed_broker,
+    POST_CREATED,
+    POST_UPDATED,
+    POST_DELETED
+)
+from populare_db_proxy.circuit import (
+    CircuitOpenError,
+    database_breaker,
+    stale_feed_pages,
+    mark_stale,
+    CLOSED
+)
+from populare_db_proxy.single_flight import SingleFlight
+from populare_db_proxy.post_cache import post_payloads
+from populare_db_proxy.recent_posts import recent_posts, Change
+from populare_db_proxy.sharding import (
+    is_sharded,
+    num_shards,
+    shard_engines,
+    shard_for,
+    group_by_shard,
+    shard_connection,
+    scatter,
+    merge_pages,
+    SHARD_POSTS_TABLE
+)
 from populare_db_proxy.app_data import db
 
 READ_POSTS_LIMIT = 50
+AUTHOR_STATS_LIMIT = 50
+CHANGES_SINCE_LIMIT = 500
+CHANGE_PRUNE_BATCH_SIZE = 1000
+CHANGE_CREATE = "create"
+CHANGE_UPDATE = "update"
+CHANGE_DELETE = "delete"
+_FEED_EVENT_TYPES = {
+    CHANGE_CREATE: POST_CREATED,
+    CHANGE_UPDATE: POST_UPDATED,
+    CHANGE_DELETE: POST_DELETED
+}
+# Set in a session's info once it has written posts.
+_HAS_WRITES = "has_writes"
+ACTIVITY_GRANULARITIES = ("minute", "hour", "day")
+ACTIVITY_BACKFILL_BATCH_SIZE = 10000
+AUTHOR_MIGRATION_BATCH_SIZE = 1000
+SHARD_MIGRATION_BATCH_SIZE = 1000
+# The column in which posts tables created before the authors table store
+# each post's author's name.
+_LEGACY_AUTHOR_COLUMN = "author"
+# strftime/DATE_FORMAT patterns that truncate a timestamp to a bucket start.
+_BUCKET_FORMATS = {
+    "sqlite": {
+        "minute": "%Y-%m-%d %H:%M:00",
+        "hour": "%Y-%m-%d %H:00:00",
+        "day": "%Y-%m-%d 00:00:00"
+    },
+    "mysql": {
+        "minute": "%Y-%m-%d %H:%i:00",
+        "hour": "%Y-%m-%d %H:00:00",
+        "day": "%Y-%m-%d 00:00:00"
+    }
+}
+
+
+_read_posts_flight = SingleFlight("read_posts")
+_READ_POST_ROWS = (
+    select(*post_row_columns(Post.__table__))
+        .where(Post.__table__.c.created_at < bindparam("before"))
+        .order_by(
+            Post.__table__.c.created_at.desc(),
+            Post.__table__.c.id.desc()
+        )
+        .limit(bindparam("limit"))
+)
 
 
 def init_db_schema() -> None:
     """Initializes the database schema."""
+    session = get_request_session()
     try:
-        db.create_all()
+        if session is None:
+            db.create_all()
+            with db.engine.begin() as connection:
+                _add_post_version_columns(connection)
+        else:
+            # Create the schema on the request's connection so that it does
+            # not wait on locks held by the request's own transaction.
+            db.metadata.create_all(bind=session.connection())
+            _add_post_version_columns(session.connection())
+        if is_sharded():
+            with session_scope() as shard_session:
+                _init_shards(shard_session)
     except OperationalError:
         # If the database already exists, this operation sometimes (not always)
         # raises an error.
         pass
 
 
+def _init_shards(session: Session) -> None:
+    """Creates the posts table on every shard and seeds the post id counter.
+
+    :param session: The session in which to initialize the shards.
+    """
+    for shard in range(1, num_shards()):
+        connection = shard_connection(session, shard)
+        SHARD_POSTS_TABLE.create(bind=connection, checkfirst=True)
+        _add_post_version_columns(connection)
+    seeded = session.execute(
+        select(PostCounter.value)
+            .where(PostCounter.name == POST_IDS_COUNTER)
+    ).scalar()
+    if seeded is None:
+        # Continue from the largest id assigned before sharding was enabled.
+        max_ids = scatter(
+            session,
+            lambda connection: connection.execute(
+                select(func.max(Post.__table__.c.id))
+            ).scalar(),
+            parallel=False
+        )
+        for table in archived_tables(session):
+            max_ids.append(session.execute(
+                select(func.max(table.c.id))
+            ).scalar())
+        session.add(PostCounter(
+            name=POST_IDS_COUNTER,
+            value=max((max_id or 0 for max_id in max_ids), default=0)
+        ))
+
+
+def _add_post_version_columns(connection: Connection) -> None:
+    """Adds the version column to posts tables created before it existed.
+
+    :param connection: The connection on which to alter the tables.
+    """
+    inspector = inspect(connection)
+    for name in inspector.get_table_names():
+        if name != Post.__tablename__ and \
+                not name.startswith(ARCHIVE_TABLE_PREFIX):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(name)}
+        if Post.version.key not in columns:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {name} ADD COLUMN {Post.version.key} "
+                "INTEGER NOT NULL DEFAULT 1"
+            )
+
+
+def _increment(
+        session: Session,
+        column: InstrumentedAttribute,
+        keys: dict,
+        delta: int
+) -> None:
+    """Adds delta to the value of a counter column, creating the row if needed.
+
+    The row is created or updated with a single upsert, so that transactions
+    that create the same row at the same time do not conflict on its primary
+    key.
+
+    :param session: The session in which the write is taking place.
+    :param column: The counter column to increment, e.g., PostCounter.value.
+    :param keys: A mapping from primary key column name to value that
+        identifies the row to increment.
+    :param delta: The amount to add to the counter.
+    """
+    model = column.class_
+    values = {**keys, column.key: delta}
+    if session.connection().dialect.name == "mysql":
+        statement = mysql_insert(model).values(values)
+        statement = statement.on_duplicate_key_update(
+            {column.key: column + statement.inserted[column.key]}
+        )
+    else:
+        statement = sqlite_insert(model).values(values)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column.key: column + statement.excluded[column.key]}
+        )
+    session.execute(statement)
+
+
+def _adjust_post_counts(session: Session, deltas: Counter) -> None:
+    """Applies per-author post count changes to the counter tables.
+
+    :param session: The session in which the write is taking place.
+    :param deltas: A mapping from author to the change in that author's post
+        count; the total post count changes by the sum of the deltas.
+    """
+    deltas = {author: delta for author, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    _increment(
+        session,
+        PostCounter.value,
+        {"name": TOTAL_POSTS_COUNTER},
+        sum(deltas.values())
+    )
+    for author, delta in sorted(deltas.items()):
+        _increment(session, AuthorStats.post_count, {"author": author}, delta)
+
+
+def truncate_to_bucket(timestamp: datetime, granularity: str) -> datetime:
+    """Returns the start of the time bucket that contains timestamp.
+
+    :param timestamp: The datetime to truncate.
+    :param granularity: One of ACTIVITY_GRANULARITIES.
+    :return: The start of the bucket of the given granularity that contains
+        timestamp.
+    """
+    if granularity not in ACTIVITY_GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    truncated = timestamp.replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        truncated = truncated.replace(minute=0)
+    if granularity == "day":
+        truncated = truncated.replace(hour=0)
+    return truncated
+
+
+def _adjust_post_activity(session: Session, deltas: Counter) -> None:
+    """Applies time-bucketed post count changes to the rollup table.
+
+    :param session: The session in which the write is taking place.
+    :param deltas: A mapping from creation timestamp to the change in the
+        number of posts created at that time; every granularity's bucket is
+        updated.
+    """
+    bucket_deltas = Counter()
+    for created_at, delta in deltas.items():
+        for granularity in ACTIVITY_GRANULARITIES:
+            bucket = truncate_to_bucket(created_at, granularity)
+            bucket_deltas[(granularity, bucket)] += delta
+    for (granularity, bucket), delta in sorted(bucket_deltas.items()):
+        if delta:
+            _increment(
+                session,
+                PostActivity.post_count,
+                {"granularity": granularity, "bucket_start": bucket},
+                delta
+            )
+
+
+def _on_posts_changed(
+        session: Session,
+        removed: Iterable[Post | Row] = (),
+        added: Iterable[Post | Row] = ()
+) -> None:
+    """Updates all incrementally maintained aggregates after a write.
+
+    This function must be called in the same transaction as the write so that
+    the aggregates never drift from the posts table on commit or rollback. An
+    update is expressed as the removal of the old row and the addition of the
+    new one.
+
+    :param session: The session in which the write is taking place.
+    :param removed: The rows removed from the posts table; each must have
+        author and created_at attributes.
+    :param added: The rows added to the posts table; each must have author
+        and created_at attributes.
+    """
+    author_deltas = Counter()
+    activity_deltas = Counter()
+    for row in removed:
+        author_deltas[row.author] -= 1
+        activity_deltas[row.created_at] -= 1
+    for row in added:
+        author_deltas[row.author] += 1
+        activity_deltas[row.created_at] += 1
+    _adjust_post_counts(session, author_deltas)
+    _adjust_post_activity(session, activity_deltas)
+
+
+def _record_writes(
+        session: Session,
+        operation: str,
+        posts: list[Post | Row]
+) -> None:
+    """Logs writes to the change log and publishes them to the live feed.
+
+    The change log rows are written in the same transaction as the writes;
+    the feed events are published only after commit.
+
+    :param session: The session in which the writes are taking place.
+    :param operation: One of CHANGE_CREATE, CHANGE_UPDATE, or CHANGE_DELETE.
+    :param posts: For creates and updates, the posts as written; for deletes,
+        rows with the deleted posts' ids.
+    """
+    if not posts:
+        return
+    session.info[_HAS_WRITES] = True
+    # Assign ids to new posts.
+    session.flush()
+    # Every change-writing transaction locks the same counter row from here
+    # until commit, so seq order is commit order.
+    _increment(
+        session,
+        PostCounter.value,
+        {"name": CHANGES_COUNTER},
+        len(posts)
+    )
+    changed_at = datetime.now()
+    is_delete = operation == CHANGE_DELETE
+    changes = [
+        PostChange(
+            operation=operation,
+            post_id=post.id,
+            text=None if is_delete else post.text,
+            author=None if is_delete else post.author,
+            created_at=None if is_delete else post.created_at,
+            changed_at=changed_at
+        )
+        for post in posts
+    ]
+    session.add_all(changes)
+    if recent_posts.size:
+        # Assign seqs to the changes, which order them in the buffer.
+        session.flush()
+        local_changes = [
+            (
+                change.seq,
+                post.id,
+                None if is_delete else
+                PostRow(*(getattr(post, field) for field in PostRow._fields))
+            )
+            for change, post in zip(changes, posts)
+        ]
+        after_commit(lambda: recent_posts.apply_local(local_changes))
+    event_type = _FEED_EVENT_TYPES[operation]
+    for post in posts:
+        data = json.dumps({"id": post.id}) if is_delete else str(post)
+        after_commit(
+            lambda data=data: feed_broker.publish(event_type, data)
+        )
+        if is_delete:
+            # Post ids can be reused after a delete on some backends.
+            after_commit(
+                lambda post_id=post.id: post_payloads.discard(post_id)
+            )
+
+
 def create_post(post: Post) -> Post:
     """Adds a post to the database.
 
     :param post: The post to add. The post need not have an explicitly set id
         field (i.e., it may be None). If None, post.id will be set by
-        autoincrement; if set in advance, post.id will be kept, but this
+        autoincrement (or, if the posts table is sharded, from the post id
+        counter); if set in advance, post.id will be kept, but this
         operation will raise an IntegrityError if there already exists a post
         in the database with that id. Therefore, we recommend that users do not
         supply an explicit id field.
     :return: The input post; post.id will be set if it was not before.
     """
-    with Session(db.engine, expire_on_commit=False) as session:
-        with session.begin():
-            session.add(post)
+    create_posts([post])
     return post
 
 
+def create_posts(posts: list[Post]) -> list[Post]:
+    """Adds many posts to the database in a single transaction.
+
+    :param posts: The posts to add. See create_post for details on the id
+        field. If any post cannot be added, none of the posts are added.
+    :return: The input posts; each post's id will be set if it was not before.
+    """
+    new_posts = [post for post in posts if inspect(post).transient]
+    with session_scope() as session:
+        _resolve_author_ids(session, new_posts)
+        if is_sharded():
+            _insert_sharded_posts(session, new_posts)
+        else:
+            session.add_all(posts)
+        _on_posts_changed(session, added=new_posts)
+        _record_writes(session, CHANGE_CREATE, new_posts)
+    return posts
+
+
+def _resolve_author_ids(session: Session, posts: list[Post]) -> None:
+    """Sets the author ids of new posts, creating authors as needed.
+
+    All of the posts' authors are looked up at once, so that the ORM does not
+    look them up one post at a time on flush; see author_cache.py.
+
+    :param session: The session in which the write is taking place.
+    :param posts: The new posts.
+    """
+    author_ids = author_cache.ids(
+        session.connection(),
+        {post.author for post in posts if post.author is not None}
+    )
+    for post in posts:
+        # Posts without an author are left to fail the NOT NULL constraint.
+        post.author_id = author_ids.get(post.author)
+
+
+def _insert_sharded_posts(session: Session, posts: list[Post]) -> None:
+    """Inserts new posts into their shards.
+
+    Posts without an id are assigned the next ids from the post id counter.
+    Each shard's posts are inserted with one statement, and the posts are then
+    marked detached, as though they had been added and committed through the
+    ORM, so that adding them again is a no-op.
+
+    :param session: The session in which the write is taking place.
+    :param posts: The new posts.
+    """
+    unassigned = [post for post in posts if post.id is None]
+    if unassigned:
+        _increment(
+            session,
+            PostCounter.value,
+            {"name": POST_IDS_COUNTER},
+            len(unassigned)
+        )
+        last_id = session.execute(
+            select(PostCounter.value)
+                .where(PostCounter.name == POST_IDS_COUNTER)
+        ).scalar()
+        first_id = last_id - len(unassigned) + 1
+        for post_id, post in enumerate(unassigned, first_id):
+            post.id = post_id
+    for shard, shard_posts in group_by_shard(posts, lambda p: p.id).items():
+        for post in shard_posts:
+            if post.version is None:
+                post.version = 1
+        shard_connection(session, shard).execute(
+            insert(Post.__table__),
+            [
+                {
+                    column.key: getattr(post, column.key)
+                    for column in post_row_columns(Post.__table__)
+                }
+                for post in shard_posts
+            ]
+        )
+        for post in shard_posts:
+            make_transient_to_detached(post)
+
+
+def create_journaled_posts(posts: list[Post]) -> int:
+    """Adds posts replayed from a write journal to the database.
+
+    Posts whose ids already exist are skipped, since a replay that is
+    interrupted after its write but before its checkpoint is repeated.
+
+    :param posts: The posts, with their journal-assigned ids.
+    :return: The number of posts added.
+    """
+    existing = read_posts_by_ids(post.id for post in posts)
+    new_posts = [post for post in posts if post.id not in existing]
+    create_posts(new_posts)
+    return len(new_posts)
+
+
+def reserve_journal_ids(count: int) -> tuple[int, int]:
+    """Reserves a block of negative post ids for a write journal.
+
+    Autoincrement only assigns positive ids, so the block never collides with
+    ids assigned by the database.
+
+    :param count: The number of ids to reserve.
+    :return: The first and last ids of the block; the block's ids descend
+        from the first to the last.
+    """
+    with session_scope() as session:
+        _increment(
+            session,
+            PostCounter.value,
+            {"name": JOURNAL_IDS_COUNTER},
+            count
+        )
+        reserved = session.execute(
+            select(PostCounter.value)
+                .where(PostCounter.name == JOURNAL_IDS_COUNTER)
+        ).scalar()
+    return -(reserved - count) - 1, -reserved
+
+
 def read_posts(
         limit: int = READ_POSTS_LIMIT,
         before: datetime | None = None
-) -> list[Post]:
+) -> list[PostRow]:
     """Returns a list of posts from the database.
 
+    The posts are read-only PostRow tuples, which have the same fields and
+    serialization as Post; see read_post_rows.
+
     :param limit: The maximum number of posts to return from the database.
     :param before: If supplied, return posts created earlier than this date; if
         None, return the most recent posts (`before` is set to datetime.now()).
     :return: The no more than `limit` most recent posts created earlier than
         `before` (or now, if not supplied) in chronological order. The
         chronological order will be most recent first; index 0 will have the
-        most recent post created earlier than `before`.
+        most recent post created earlier than `before`. Posts in the archive
+        partitions are included. If the database is unavailable, the last
+        good copy of the page is returned instead and the response is marked
+        as stale; see circuit.py. Pages that lie within the recent posts
+        buffer are served from memory; see recent_posts.py.
+    """
+    page = _read_recent_posts(limit, before)
+    if page is not None:
+        return page
+    key = (limit, before)
+    if database_breaker.state != CLOSED:
+        # Serve the stale copy without waiting on the database; the
+        # background refresh probes whether it has recovered.
+        result = stale_feed_pages.get(key)
+        if result is not None:
+            return _serve_stale_page(result)
+    try:
+        result = _read_posts_page_coalesced(key)
+    except (CircuitOpenError, OperationalError, InterfaceError):
+        result = stale_feed_pages.get(key)
+        if result is None:
+            raise
+        return _serve_stale_page(result)
+    # Only committed data is kept, in case the request's writes roll back.
+    after_commit(lambda: stale_feed_pages.put(key, result))
+    return result
+
+
+def _read_recent_posts(
+        limit: int,
+        before: datetime | None
+) -> list[PostRow] | None:
+    """Returns a page of posts from the recent posts buffer, if possible.
+
+    The buffer is not used while the database is unavailable, so that stale
+    responses are marked as such, or by requests that have written posts,
+    whose writes the buffer does not see until they commit.
+
+    :param limit: The maximum number of posts to return.
+    :param before: See read_posts.
+    :return: The page of posts, or None if it must be read from the database.
+    """
+    session = get_request_session()
+    if not recent_posts.size or database_breaker.state != CLOSED or (
+            session is not None and session.info.get(_HAS_WRITES)
+    ):
+        return None
+    sync_recent_posts()
+    return recent_posts.read(limit, before)
+
+
+def sync_recent_posts() -> None:
+    """Loads the recent posts buffer or reconciles it, if due.
+
+    Errors from an unavailable database are not raised; the buffer keeps its
+    contents until the next attempt.
+    """
+    try:
+        recent_posts.sync(_load_recent_posts, _read_recent_changes)
+    except (CircuitOpenError, OperationalError, InterfaceError):
+        pass
+
+
+def _load_recent_posts(size: int) -> tuple[int, list[PostRow]]:
+    """Returns the change log cursor and then the most recent posts.
+
+    :param size: The number of posts to read.
+    :return: A 2-tuple of the seq of the last committed change and the no more
+        than `size` most recent posts, read after the cursor.
+    """
+    with session_scope() as session:
+        cursor = max(
+            session.execute(select(func.max(PostChange.seq))).scalar() or 0,
+            session.execute(
+                select(PostCounter.value)
+                    .where(PostCounter.name == CHANGES_PRUNED_THROUGH_COUNTER)
+            ).scalar() or 0
+        )
+    return cursor, read_post_rows(size)
+
+
+def _read_recent_changes(
+        cursor: int,
+        limit: int
+) -> tuple[list[Change], int, bool]:
+    """Returns the changes after a cursor in the recent posts buffer's format.
+
+    :param cursor: See read_changes_since.
+    :param limit: See read_changes_since.
+    :return: See read_changes_since; each change is a (seq, post id, post or
+        None if deleted) tuple. The change log does not record versions, so
+        the posts' versions are None.
+    """
+    changes, next_cursor, reset = read_changes_since(cursor, limit)
+    return [
+        (
+            change.seq,
+            change.post_id,
+            None if change.operation == CHANGE_DELETE else PostRow(
+                change.post_id,
+                change.text,
+                change.author,
+                change.created_at,
+                None
+            )
+        )
+        for change in changes
+    ], next_cursor, reset
+
+
+def _read_posts_page(key: tuple[int, datetime | None]) -> list[PostRow]:
+    """Returns a page of posts from the database; see read_posts.
+
+    :param key: The page's (limit, before) arguments to read_posts.
+    :return: The page of posts.
+    """
+    return read_post_rows(*key)
+
+
+def read_post_rows(
+        limit: int = READ_POSTS_LIMIT,
+        before: datetime | None = None
+) -> list[PostRow]:
+    """Returns a page of posts read with SQLAlchemy Core, bypassing the ORM.
+
+    The statement is built once with bound parameters, so its compiled form
+    is reused from SQLAlchemy's statement cache, and rows are converted
+    straight from the cursor to PostRow tuples, with the authors' names
+    resolved from author ids by the author cache. Unlike read_posts, the
+    database is always read. If the posts table is sharded, every shard is
+    queried in parallel and the pages are merged; see sharding.py.
+
+    :param limit: The maximum number of posts to return.
+    :param before: If supplied, return posts created earlier than this date;
+        if None, return the most recent posts.
+    :return: The page of posts, most recent first; see read_posts.
     """
     before = before if before else datetime.now()
-    statement = (
-        select(Post)
-            .where(Post.created_at < before)
-            .order_by(Post.created_at.desc())
-            .limit(limit)
-    )
-    with Session(db.engine, expire_on_commit=False) as session:
-        with session.begin():
-            rows = session.execute(statement)
-            result = [row[0] for row in rows]
+    parameters = {"limit": limit, "before": before}
+    with session_scope() as session:
+        # Requests that have written posts read every shard through their own
+        # transaction, so that they see their writes.
+        pages = scatter(
+            session,
+            lambda connection: connection.execute(
+                _READ_POST_ROWS,
+                parameters
+            ).all(),
+            parallel=not session.info.get(_HAS_WRITES)
+        )
+        # Only the shards' merged page needs authors' names, which are
+        # resolved on the primary.
+        result = post_rows(session.connection(), merge_pages(pages, limit))
+        result = merge_archived_posts(session, result, limit, before)
+    return result
+
+
+def _read_posts_page_coalesced(
+        key: tuple[int, datetime | None]
+) -> list[PostRow]:
+    """Returns a page of posts, sharing one query among concurrent callers.
+
+    Requests that have written posts read through their own transaction, so
+    that they see their writes.
+
+    :param key: The page's (limit, before) arguments to read_posts.
+    :return: The page of posts.
+    """
+    session = get_request_session()
+    if session is not None and session.info.get(_HAS_WRITES):
+        return _read_posts_page(key)
+    return _read_posts_flight.do(key, lambda: _read_posts_page(key))
+
+
+def _serve_stale_page(page: list[PostRow]) -> list[PostRow]:
+    """Marks the response as stale and refreshes stale pages if it is time.
+
+    :param page: The stale page.
+    :return: The stale page.
+    """
+    mark_stale()
+    if database_breaker.probe_due():
+        stale_feed_pages.refresh_in_background(_read_posts_page)
+    return page
+
+
+def read_posts_by_ids(post_ids: Iterable[int]) -> dict[int, PostRow]:
+    """Returns the posts with the given ids from the database.
+
+    All posts in the hot table are read with a single query per shard; only
+    ids that are not found there are looked up in the archive partitions.
+
+    :param post_ids: The ids of the posts to read.
+    :return: A mapping from id to post for every id that exists in the
+        database. Ids that do not exist are omitted.
+    """
+    remaining = set(post_ids)
+    result = {}
+    if not remaining:
+        return result
+    posts = Post.__table__
+    with session_scope() as session:
+        for shard, shard_ids in group_by_shard(sorted(remaining)).items():
+            rows = shard_connection(session, shard).execute(
+                select(*post_row_columns(posts))
+                    .where(posts.c.id.in_(shard_ids))
+            )
+            result.update(
+                (post.id, post)
+                for post in post_rows(session.connection(), rows)
+            )
+        remaining.difference_update(result)
+        for table in archived_tables(session) if remaining else []:
+            rows = session.execute(
+                select(*post_row_columns(table))
+                    .where(table.c.id.in_(remaining))
+            )
+            result.update(
+                (post.id, post)
+                for post in post_rows(session.connection(), rows)
+            )
+            remaining.difference_update(result)
+            if not remaining:
+                break
     return result
 
 
@@ -80,23 +787,151 @@ def update_post(post: Post) -> Post:
         this operation does not raise an error, since that is the behavior of
         SQL.
     :return: The input post; the post with the corresponding id in the database
-        will be updated to match the input.
+        will be updated to match the input. If the post was archived, it is
+        moved back into the hot posts table.
     """
-    statement = (
-        update(Post)
-            .where(Post.id == post.id)
-            .values(
-                text=post.text,
-                author=post.author,
-                created_at=post.created_at
-            )
+    update_post_fields(
+        post.id,
+        text=post.text,
+        author=post.author,
+        created_at=post.created_at
     )
-    with Session(db.engine, expire_on_commit=False) as session:
-        with session.begin():
-            session.execute(statement)
     return post
 
 
+def update_post_fields(
+        post_id: int,
+        text: str | None = None,
+        author: str | None = None,
+        created_at: datetime | None = None
+) -> PostRow | None:
+    """Updates only the supplied fields of a post in the database.
+
+    Fields that are None are left unchanged, so callers need not read the post
+    first. Where the dialect supports UPDATE ... RETURNING, a text-only update
+    is a single statement. Changes to author or created_at also read the old
+    values, which the aggregate tables need.
+
+    :param post_id: The id of the post to update.
+    :param text: If supplied, the post's new text.
+    :param author: If supplied, the post's new author.
+    :param created_at: If supplied, the post's new creation datetime.
+    :return: The updated post, or None if no post has the id. If the post was
+        archived, it is moved back into the hot posts table. If no fields are
+        supplied, nothing is written, and the post is returned unchanged.
+    """
+    values = {
+        name: value for name, value in (
+            ("text", text),
+            ("author", author),
+            ("created_at", created_at)
+        ) if value is not None
+    }
+    if not values:
+        return read_posts_by_ids([post_id]).get(post_id)
+    posts = Post.__table__
+    columns = post_row_columns(posts)
+    with session_scope() as session:
+        statement = (
+            update(posts)
+                .where(posts.c.id == post_id)
+                .values(
+                    version=posts.c.version + 1,
+                    **_stored_values(session, values)
+                )
+        )
+        connection = shard_connection(session, shard_for(post_id))
+        old_row = None
+        if "author" in values or "created_at" in values:
+            row = connection.execute(
+                select(*columns)
+                    .where(posts.c.id == post_id)
+                    .with_for_update()
+            ).first()
+            updated = None
+            if row is not None:
+                connection.execute(statement)
+                old_row = post_rows(session.connection(), [row])[0]
+                updated = old_row._replace(
+                    version=old_row.version + 1,
+                    **values
+                )
+        elif connection.dialect.full_returning:
+            row = connection.execute(statement.returning(*columns)).first()
+            updated = None if row is None else \
+                post_rows(session.connection(), [row])[0]
+        else:
+            matched = connection.execute(statement).rowcount
+            row = connection.execute(
+                select(*columns).where(posts.c.id == post_id)
+            ).first() if matched else None
+            updated = None if row is None else \
+                post_rows(session.connection(), [row])[0]
+        if updated is None:
+            restored = _restore_archived_post(session, post_id, values)
+            if restored is None:
+                return None
+            old_row, updated = restored
+        if old_row is not None:
+            _on_posts_changed(session, removed=[old_row], added=[updated])
+        _record_writes(session, CHANGE_UPDATE, [updated])
+    return updated
+
+
+def _restore_archived_post(
+        session: Session,
+        post_id: int,
+        values: dict[str, object]
+) -> tuple[PostRow, PostRow] | None:
+    """Moves an archived post back into the hot table with updated fields.
+
+    :param session: The session in which to write.
+    :param post_id: The id of the post.
+    :param values: The fields to update.
+    :return: A 2-tuple of the archived post and the updated post, or None if
+        no archived post has the id.
+    """
+    archived = find_archived_post(session, post_id)
+    if archived is None:
+        return None
+    table, old_post = archived
+    updated = PostRow(
+        id=post_id,
+        text=values.get("text", old_post.text),
+        author=values.get("author", old_post.author),
+        created_at=values.get("created_at", old_post.created_at),
+        version=(old_post.version or 1) + 1
+    )
+    session.execute(delete(table).where(table.c.id == post_id))
+    shard_connection(session, shard_for(post_id)).execute(
+        insert(Post.__table__).values(
+            **_stored_values(session, updated._asdict())
+        )
+    )
+    return old_post, updated
+
+
+def _stored_values(
+        session: Session,
+        values: dict[str, object]
+) -> dict[str, object]:
+    """Returns post fields as they are stored in a posts table.
+
+    :param session: The session in which the write is taking place.
+    :param values: The fields, with the author's name, if any, as author.
+    :return: The fields, with the author's id as author_id instead; the
+        author is created if needed.
+    """
+    stored = dict(values)
+    if "author" in stored:
+        name = stored.pop("author")
+        stored["author_id"] = author_cache.ids(
+            session.connection(),
+            [name]
+        )[name]
+    return stored
+
+
 def delete_post(post_id: int) -> None:
     """Deletes a post in the database.
 
@@ -104,7 +939,602 @@ def delete_post(post_id: int) -> None:
         database with the specified id, this operation does not raise an error,
         since that is the behavior of SQL.
     """
-    statement = delete(Post).where(Post.id == post_id)
-    with Session(db.engine, expire_on_commit=False) as session:
+    posts = Post.__table__
+    with session_scope() as session:
+        connection = shard_connection(session, shard_for(post_id))
+        row = connection.execute(
+            select(*post_row_columns(posts))
+                .where(posts.c.id == post_id)
+                .with_for_update()
+        ).first()
+        statement = delete(posts).where(posts.c.id == post_id)
+        old_row = None if row is None else \
+            post_rows(session.connection(), [row])[0]
+        if old_row is None:
+            archived = find_archived_post(session, post_id)
+            if archived is not None:
+                table, old_row = archived
+                connection = session.connection()
+                statement = delete(table).where(table.c.id == post_id)
+        # Only the delete that removed the row adjusts the aggregates, in
+        # case a concurrent delete of the same post got there first.
+        if old_row is not None and connection.execute(statement).rowcount:
+            _on_posts_changed(session, removed=[old_row])
+            _record_writes(session, CHANGE_DELETE, [old_row])
+
+
+def delete_posts(post_ids: list[int]) -> int:
+    """Deletes many posts in the database in a single transaction.
+
+    :param post_ids: The ids of the posts to delete. Ids that do not exist in
+        the database are ignored. Archived posts are deleted from their
+        partitions.
+    :return: The number of posts deleted.
+    """
+    remaining = set(post_ids)
+    with session_scope() as session:
+        removed = []
+        for shard, shard_ids in group_by_shard(sorted(remaining)).items():
+            removed.extend(_delete_from_table(
+                shard_connection(session, shard),
+                Post.__table__,
+                shard_ids
+            ))
+        remaining.difference_update(row.id for row in removed)
+        for table in archived_tables(session) if remaining else []:
+            old_rows = _delete_from_table(
+                session.connection(),
+                table,
+                remaining
+            )
+            remaining.difference_update(row.id for row in old_rows)
+            removed.extend(old_rows)
+            if not remaining:
+                break
+        removed = post_rows(session.connection(), removed)
+        _on_posts_changed(session, removed=removed)
+        _record_writes(session, CHANGE_DELETE, removed)
+    return len(removed)
+
+
+def delete_expired_posts(
+        table: Table,
+        shard: int,
+        post_ids: list[int],
+        cutoff: datetime
+) -> int:
+    """Deletes posts from one posts or archive table in a single transaction,
+    if they were created before cutoff.
+
+    Unlike delete_posts, this operation never deletes a post with one of the
+    ids from any other table, and skips posts that are no longer expired.
+
+    :param table: The table; a shard's posts table or an archive partition.
+    :param shard: The index of the shard that holds the table; archive
+        partitions are on the primary, shard 0.
+    :param post_ids: The ids of the posts to delete.
+    :param cutoff: Only posts created earlier than this datetime are deleted.
+    :return: The number of posts deleted.
+    """
+    with session_scope() as session:
+        removed = _delete_from_table(
+            shard_connection(session, shard),
+            table,
+            post_ids,
+            table.c.created_at < cutoff
+        )
+        removed = post_rows(session.connection(), removed)
+        _on_posts_changed(session, removed=removed)
+        _record_writes(session, CHANGE_DELETE, removed)
+    return len(removed)
+
+
+def _delete_from_table(
+        connection: Connection,
+        table: Table,
+        post_ids: Iterable[int],
+        *conditions: ColumnElement
+) -> list[Row]:
+    """Deletes posts from a posts or archive table.
+
+    :param connection: The connection on which to delete.
+    :param table: The table.
+    :param post_ids: The ids of the posts to delete.
+    :param conditions: Further conditions the posts must meet to be deleted.
+    :return: The rows of the deleted posts, read with post_row_columns.
+    """
+    old_rows = connection.execute(
+        select(*post_row_columns(table))
+            .where(table.c.id.in_(post_ids), *conditions)
+            .with_for_update()
+    ).all()
+    if old_rows:
+        found = [row.id for row in old_rows]
+        connection.execute(delete(table).where(table.c.id.in_(found)))
+    return old_rows
+
+
+def read_post_count() -> int:
+    """Returns the total number of posts in the database.
+
+    The count is read from the counters table, not computed from the posts
+    table, so this operation takes constant time.
+
+    :return: The total number of posts in the database.
+    """
+    statement = (
+        select(PostCounter.value)
+            .where(PostCounter.name == TOTAL_POSTS_COUNTER)
+    )
+    with session_scope() as session:
+        count = session.execute(statement).scalar()
+    return count if count else 0
+
+
+def read_author_stats(
+        author: str | None = None,
+        limit: int = AUTHOR_STATS_LIMIT
+) -> list[AuthorStats]:
+    """Returns per-author post aggregates from the database.
+
+    :param author: If supplied, return only the stats for this author.
+    :param limit: The maximum number of authors to return.
+    :return: The stats for no more than `limit` authors with at least one post,
+        ordered by post count with the most prolific author first.
+    """
+    statement = (
+        select(AuthorStats)
+            .where(AuthorStats.post_count > 0)
+            .order_by(AuthorStats.post_count.desc(), AuthorStats.author)
+            .limit(limit)
+    )
+    if author is not None:
+        statement = statement.where(AuthorStats.author == author)
+    with session_scope() as session:
+        result = list(session.execute(statement).scalars())
+    return result
+
+
+def _post_tables(session: Session) -> list[tuple[Connection, Table]]:
+    """Returns every table that holds posts, with a connection to read it.
+
+    :param session: The session in which to read.
+    :return: The posts table of every shard and the archive partitions on the
+        primary, each with its connection in the session's transaction.
+    """
+    tables = [
+        (shard_connection(session, shard), Post.__table__)
+        for shard in range(num_shards())
+    ]
+    tables.extend(
+        (session.connection(), table) for table in archived_tables(session)
+    )
+    return tables
+
+
+def reconcile_post_counts() -> int:
+    """Repairs any drift between the counter tables and the posts table.
+
+    Drift can only arise from writes that bypass db_ops (e.g., manual SQL), so
+    this is intended to be run infrequently as a maintenance job. The posts
+    table of every shard and the archive partitions are scanned once, in the
+    same transaction as the repairs.
+
+    :return: The number of counters that were repaired.
+    """
+    with Session(db.engine) as session:
+        with session.begin():
+            actual_by_id = Counter()
+            for connection, table in _post_tables(session):
+                actual_by_id.update(dict(connection.execute(
+                    select(table.c.author_id, func.count())
+                        .group_by(table.c.author_id)
+                ).all()))
+            names = author_cache.names(session.connection(), actual_by_id)
+            actual = Counter({
+                names[author_id]: count
+                for author_id, count in actual_by_id.items()
+            })
+            stored = Counter(dict(session.execute(
+                select(AuthorStats.author, AuthorStats.post_count)
+            ).all()))
+            stored_total = session.execute(
+                select(PostCounter.value)
+                    .where(PostCounter.name == TOTAL_POSTS_COUNTER)
+            ).scalar()
+            deltas = Counter({
+                author: actual[author] - stored[author]
+                for author in set(actual) | set(stored)
+            })
+            num_repaired = sum(1 for delta in deltas.values() if delta)
+            _adjust_post_counts(session, deltas)
+            # The total is derived from the author deltas, so it only needs an
+            # explicit repair if it drifted independently of them.
+            actual_total = sum(actual.values())
+            expected_total = (stored_total or 0) + sum(deltas.values())
+            if expected_total != actual_total:
+                session.merge(PostCounter(
+                    name=TOTAL_POSTS_COUNTER,
+                    value=actual_total
+                ))
+                num_repaired += 1
+            session.execute(
+                delete(AuthorStats).where(AuthorStats.post_count == 0)
+            )
+    return num_repaired
+
+
+def _bucket_expression(
+        column: Column,
+        granularity: str,
+        dialect_name: str
+) -> ColumnElement:
+    """Returns a SQL expression that truncates a timestamp column to a bucket.
+
+    :param column: The timestamp column, e.g., Post.created_at.
+    :param granularity: One of ACTIVITY_GRANULARITIES.
+    :param dialect_name: The name of the database dialect, e.g., "sqlite".
+    :return: An expression that evaluates to the bucket start as a string in
+        the format "YYYY-MM-DD HH:MM:SS".
+    """
+    if dialect_name == "sqlite":
+        return func.strftime(_BUCKET_FORMATS["sqlite"][granularity], column)
+    return func.date_format(column, _BUCKET_FORMATS["mysql"][granularity])
+
+
+def _aggregate_post_activity(
+        connection: Connection,
+        table: Table,
+        batch_size: int
+) -> Counter:
+    """Returns the bucketed post counts of a posts or archive table.
+
+    :param connection: The connection with which to read the table.
+    :param table: The table to aggregate.
+    :param batch_size: The number of post ids to aggregate per query.
+    :return: A mapping from (granularity, bucket start) to number of posts.
+    """
+    dialect_name = connection.dialect.name
+    totals = Counter()
+    min_id, max_id = connection.execute(
+        select(func.min(table.c.id), func.max(table.c.id))
+    ).one()
+    if min_id is None:
+        return totals
+    for start_id in range(min_id, max_id + 1, batch_size):
+        for granularity in ACTIVITY_GRANULARITIES:
+            bucket = _bucket_expression(
+                table.c.created_at,
+                granularity,
+                dialect_name
+            )
+            rows = connection.execute(
+                select(bucket, func.count())
+                    .where(table.c.id >= start_id)
+                    .where(table.c.id < start_id + batch_size)
+                    .group_by(bucket)
+            )
+            for bucket_start, count in rows:
+                totals[(
+                    granularity,
+                    datetime.fromisoformat(bucket_start)
+                )] += count
+    return totals
+
+
+def backfill_post_activity(
+        batch_size: int = ACTIVITY_BACKFILL_BATCH_SIZE
+) -> int:
+    """Rebuilds the post_activity rollup table from the posts table.
+
+    The posts table of every shard and the archive partitions are aggregated
+    in batches of at most batch_size ids, with the database truncating and
+    grouping each batch; only the per-bucket counts travel over the network.
+    The rollup rows are deleted first, in the same transaction as the scan
+    and the rebuild, which locks the rollup table: writes that would update
+    it wait until the rebuild commits, and writes committed before the delete
+    are in the scan, so each post is counted exactly once. Because writes
+    wait for the whole scan, run this off-peak, when first enabling rollups
+    or to repair drift from writes that bypass db_ops.
+
+    :param batch_size: The number of post ids to aggregate per query.
+    :return: The number of rollup rows written.
+    """
+    with Session(db.engine) as session:
         with session.begin():
-            session.execute(statement)
+            session.execute(delete(PostActivity))
+            totals = Counter()
+            for connection, table in _post_tables(session):
+                totals.update(
+                    _aggregate_post_activity(connection, table, batch_size)
+                )
+            session.add_all(
+                PostActivity(
+                    granularity=granularity,
+                    bucket_start=bucket_start,
+                    post_count=count
+                )
+                for (granularity, bucket_start), count in totals.items()
+            )
+    return len(totals)
+
+
+def migrate_post_authors(
+        batch_size: int = AUTHOR_MIGRATION_BATCH_SIZE
+) -> int:
+    """Moves authors' names out of posts tables into the authors table.
+
+    Posts tables created before the authors table store each post's author's
+    name. Each such table (the posts table of every shard and the archive
+    partitions) gets an author_id column, which is filled in batches of at
+    most batch_size posts in id order, each in its own short transaction,
+    creating authors as needed; the name column is then dropped. On MySQL,
+    author_id is then made NOT NULL and, on the primary, a foreign key.
+
+    Run this once, while no older version of the proxy is writing, before
+    starting a version that reads author_id. If interrupted, it can be run
+    again; tables that have been migrated are skipped.
+
+    :param batch_size: The maximum number of posts to migrate per
+        transaction.
+    :return: The number of posts migrated.
+    """
+    init_db_schema()
+    with session_scope() as session:
+        tables = [
+            (shard, Post.__tablename__) for shard in range(num_shards())
+        ]
+        tables.extend((0, table.name) for table in archived_tables(session))
+    num_migrated = 0
+    for shard, name in tables:
+        engine = shard_engines()[shard]
+        columns = {
+            column_info["name"]
+            for column_info in inspect(engine).get_columns(name)
+        }
+        if _LEGACY_AUTHOR_COLUMN not in columns:
+            continue
+        if Post.author_id.key not in columns:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {name} ADD COLUMN {Post.author_id.key} "
+                    "INTEGER"
+                )
+        num_migrated += _fill_author_ids(shard, name, batch_size)
+        _drop_legacy_author_column(engine, name, is_primary=shard == 0)
+    return num_migrated
+
+
+def _fill_author_ids(shard: int, name: str, batch_size: int) -> int:
+    """Sets the author ids of a legacy posts table's posts from their names.
+
+    :param shard: The index of the shard that holds the table.
+    :param name: The name of the table.
+    :param batch_size: The maximum number of posts to migrate per
+        transaction.
+    :return: The number of posts migrated.
+    """
+    legacy = table_clause(
+        name,
+        column_clause("id"),
+        column_clause(_LEGACY_AUTHOR_COLUMN),
+        column_clause(Post.author_id.key)
+    )
+    statement = (
+        update(legacy)
+            .where(legacy.c.id == bindparam("post_id"))
+            .values({Post.author_id.key: bindparam("new_author_id")})
+    )
+    num_migrated = 0
+    last_id = None
+    while True:
+        batch = (
+            select(
+                legacy.c.id,
+                legacy.c[_LEGACY_AUTHOR_COLUMN].label("author_name")
+            )
+                .where(legacy.c[Post.author_id.key].is_(None))
+                .order_by(legacy.c.id)
+                .limit(batch_size)
+        )
+        if last_id is not None:
+            batch = batch.where(legacy.c.id > last_id)
+        with session_scope() as session:
+            connection = shard_connection(session, shard)
+            rows = connection.execute(batch).all()
+            if not rows:
+                return num_migrated
+            author_ids = author_cache.ids(
+                session.connection(),
+                {row.author_name for row in rows}
+            )
+            connection.execute(statement, [
+                {
+                    "post_id": row.id,
+                    "new_author_id": author_ids[row.author_name]
+                }
+                for row in rows
+            ])
+        num_migrated += len(rows)
+        last_id = rows[-1].id
+
+
+def _drop_legacy_author_column(
+        engine: Engine,
+        name: str,
+        is_primary: bool
+) -> None:
+    """Drops the name column of a legacy posts table whose ids are filled.
+
+    :param engine: The engine of the database that holds the table.
+    :param name: The name of the table.
+    :param is_primary: Whether the table is on the primary, which holds the
+        authors table.
+    """
+    with engine.begin() as connection:
+        if engine.dialect.name != "mysql":
+            # SQLite cannot add constraints to an existing table.
+            connection.exec_driver_sql(
+                f"ALTER TABLE {name} DROP COLUMN {_LEGACY_AUTHOR_COLUMN}"
+            )
+            return
+        foreign_key = f", ADD FOREIGN KEY ({Post.author_id.key}) " \
+            f"REFERENCES {Author.__tablename__} ({Author.id.key})" \
+            if is_primary else ""
+        connection.exec_driver_sql(
+            f"ALTER TABLE {name} DROP COLUMN {_LEGACY_AUTHOR_COLUMN}, "
+            f"MODIFY {Post.author_id.key} INTEGER NOT NULL{foreign_key}"
+        )
+
+
+def migrate_posts_to_shards(
+        batch_size: int = SHARD_MIGRATION_BATCH_SIZE
+) -> int:
+    """Moves posts written before sharding was enabled to their shards.
+
+    Until sharding is enabled, every post is stored on the primary, but once
+    it is, every read and write by id looks for a post on shard id % N. The
+    primary's posts are scanned in id order in batches of at most batch_size
+    posts, and each post that belongs on another shard is copied there and
+    then deleted from the primary. The batch stays locked on the primary
+    while it is copied, and each copy commits before the primary's delete, so
+    an interrupted run loses no posts; a post that is copied again replaces
+    its earlier copy. Aggregates are unaffected, since the posts still exist.
+
+    Run this once, after adding the shards to the database URI secret and
+    before the sharded proxy serves traffic. It can be run again; posts that
+    have been moved are skipped. With a single database, it does nothing.
+
+    :param batch_size: The maximum number of posts to scan per transaction.
+    :return: The number of posts moved.
+    """
+    if not is_sharded():
+        return 0
+    init_db_schema()
+    engines = shard_engines()
+    posts = Post.__table__
+    num_moved = 0
+    last_id = None
+    while True:
+        batch = select(posts).order_by(posts.c.id).limit(batch_size)
+        if last_id is not None:
+            batch = batch.where(posts.c.id > last_id)
+        with engines[0].begin() as primary:
+            rows = primary.execute(batch.with_for_update()).mappings().all()
+            if not rows:
+                return num_moved
+            last_id = rows[-1]["id"]
+            by_shard = group_by_shard(rows, lambda row: row["id"])
+            by_shard.pop(0, None)
+            for shard, shard_rows in by_shard.items():
+                moved_ids = [row["id"] for row in shard_rows]
+                with engines[shard].begin() as connection:
+                    connection.execute(
+                        delete(posts).where(posts.c.id.in_(moved_ids))
+                    )
+                    connection.execute(
+                        insert(posts),
+                        [dict(row) for row in shard_rows]
+                    )
+                primary.execute(
+                    delete(posts).where(posts.c.id.in_(moved_ids))
+                )
+                num_moved += len(moved_ids)
+
+
+def read_post_activity(
+        granularity: str,
+        start: datetime,
+        end: datetime
+) -> list[PostActivity]:
+    """Returns bucketed post counts from the rollup table.
+
+    :param granularity: One of ACTIVITY_GRANULARITIES.
+    :param start: Return buckets whose start is at or after the start of the
+        bucket containing this datetime.
+    :param end: Return buckets that start earlier than this datetime.
+    :return: The non-empty buckets in the range, in chronological order
+        (oldest first). Buckets with no posts are omitted.
+    """
+    statement = (
+        select(PostActivity)
+            .where(PostActivity.granularity == granularity)
+            .where(
+                PostActivity.bucket_start >=
+                truncate_to_bucket(start, granularity)
+            )
+            .where(PostActivity.bucket_start < end)
+            .where(PostActivity.post_count > 0)
+            .order_by(PostActivity.bucket_start)
+    )
+    with session_scope() as session:
+        result = list(session.execute(statement).scalars())
+    return result
+
+
+def read_changes_since(
+        cursor: int = 0,
+        limit: int = CHANGES_SINCE_LIMIT
+) -> tuple[list[PostChange], int, bool]:
+    """Returns the changes to the posts table committed after a cursor.
+
+    Clients sync by passing the cursor returned by their previous call; a
+    client with no state passes 0, or reloads its feed and starts from the
+    current cursor.
+
+    :param cursor: The seq of the last change the client has applied.
+    :param limit: The maximum number of changes to return.
+    :return: A 3-tuple of the no more than `limit` changes after cursor, in
+        commit order; the cursor to pass to the next call; and whether the
+        client must reload its feed because changes after its cursor have
+        been pruned from the log.
+    """
+    with session_scope() as session:
+        pruned_through = session.execute(
+            select(PostCounter.value)
+                .where(PostCounter.name == CHANGES_PRUNED_THROUGH_COUNTER)
+        ).scalar()
+        changes = list(session.execute(
+            select(PostChange)
+                .where(PostChange.seq > cursor)
+                .order_by(PostChange.seq)
+                .limit(limit)
+        ).scalars())
+    next_cursor = changes[-1].seq if changes else cursor
+    return changes, next_cursor, cursor < (pruned_through or 0)
+
+
+def prune_post_changes(
+        older_than: datetime,
+        batch_size: int = CHANGE_PRUNE_BATCH_SIZE
+) -> int:
+    """Deletes change log entries older than a datetime, in batches.
+
+    Clients whose cursor is older than the newest pruned entry are told to
+    reload their feed by read_changes_since.
+
+    :param older_than: Changes made earlier than this datetime are deleted.
+    :param batch_size: The maximum number of changes to delete per
+        transaction.
+    :return: The number of changes deleted.
+    """
+    num_deleted = 0
+    while True:
+        with Session(db.engine) as session:
+            with session.begin():
+                seqs = list(session.execute(
+                    select(PostChange.seq)
+                        .where(PostChange.changed_at < older_than)
+                        .order_by(PostChange.seq)
+                        .limit(batch_size)
+                ).scalars())
+                if not seqs:
+                    return num_deleted
+                session.execute(
+                    delete(PostChange).where(PostChange.seq <= seqs[-1])
+                )
+                session.merge(PostCounter(
+                    name=CHANGES_PRUNED_THROUGH_COUNTER,
+                    value=seqs[-1]
+                ))
+        num_deleted += len(seqs)
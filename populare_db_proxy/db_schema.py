@@ -1,21 +1,175 @@
 """Contains classes for the database schema."""
 
+from __future__ import annotations
 import json
+from datetime import datetime
+from typing import NamedTuple
+from sqlalchemy import Column, ForeignKey, Table, select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import column_property
 from populare_db_proxy.app_data import db
 
 TEXT_SIZE = 255
 AUTHOR_SIZE = 255
+COUNTER_NAME_SIZE = 64
+TOTAL_POSTS_COUNTER = "posts"
+CHANGES_COUNTER = "changes"
+CHANGES_PRUNED_THROUGH_COUNTER = "changes_pruned_through"
+# The last post id allocated while the posts table is sharded.
+POST_IDS_COUNTER = "post_ids"
+# The number of negative post ids reserved by write journals.
+JOURNAL_IDS_COUNTER = "journal_ids"
+OPERATION_SIZE = 16
+GRANULARITY_SIZE = 16
+MONTH_SIZE = 7
+TABLE_NAME_SIZE = 64
+
+
+class Author(db.Model):
+    """Defines the authors table.
+
+    Posts reference their author by id, so that each author's name is stored
+    once instead of on every post. Rows are never updated or deleted, so the
+    mapping between names and ids can be cached indefinitely; see
+    author_cache.py.
+    """
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "authors"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Case- and accent-sensitive on MySQL, so that distinct names are never
+    # merged into one author.
+    name = db.Column(
+        db.String(AUTHOR_SIZE).with_variant(
+            mysql.VARCHAR(AUTHOR_SIZE, collation="utf8mb4_bin"),
+            "mysql"
+        ),
+        nullable=False,
+        unique=True
+    )
 
 
 class Post(db.Model):
-    """Defines the posts table."""
+    """Defines the posts table.
+
+    The table stores the id of the post's author. The author attribute holds
+    the author's name: it is loaded with the post, and a post created or
+    updated with a new name has its author_id resolved on flush; see
+    author_cache.py.
+
+    Ids are never reused, since archived posts keep theirs: on SQLite, the
+    table is declared AUTOINCREMENT, which only applies to newly created
+    databases. MySQL 5.7 resets a table's AUTO_INCREMENT to one past its
+    largest id on restart, so there, the ids of the newest posts can be
+    reused if they were archived or deleted before a restart; MySQL 8.0
+    persists the counter.
+    """
     # pylint: disable=too-few-public-methods
 
     __tablename__ = "posts"
+    __table_args__ = {"sqlite_autoincrement": True}
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     text = db.Column(db.String(TEXT_SIZE), nullable=False)
-    author = db.Column(db.String(AUTHOR_SIZE), nullable=False)
+    author_id = db.Column(
+        db.Integer,
+        ForeignKey(Author.id),
+        nullable=False
+    )
+    # Assigned values are kept through flushes, which do not write them.
+    author = column_property(
+        select(Author.name)
+            .where(Author.id == author_id)
+            .scalar_subquery(),
+        expire_on_flush=False
+    )
     created_at = db.Column(db.DateTime, nullable=False)
+    # Incremented by every update, so that caches keyed by (id, version) see
+    # updates; see post_cache.py.
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default="1"
+    )
+
+    def __repr__(self) -> str:
+        """Returns the JSON serialization of a row in the table.
+
+        :return: The JSON serialization of a row in the table.
+        """
+        return _post_json(self)
+
+
+class PostRow(NamedTuple):
+    """A read-only row of the posts table, read without the ORM.
+
+    Has the same fields and JSON serialization as Post, but costs one tuple
+    instead of an instrumented object and its identity map bookkeeping.
+    """
+
+    id: int
+    text: str
+    author: str
+    created_at: datetime
+    version: int
+
+    def __repr__(self) -> str:
+        """Returns the JSON serialization of the row.
+
+        :return: The JSON serialization of the row.
+        """
+        return _post_json(self)
+
+
+def post_row_columns(table: Table) -> list[Column]:
+    """Returns the columns of a posts table that make up a PostRow.
+
+    :param table: The posts table, a shard's, or an archive table.
+    :return: The columns, in PostRow field order; author_id takes the place
+        of author, since the table stores the author's id.
+    """
+    return [
+        table.c.author_id if field == "author" else table.c[field]
+        for field in PostRow._fields
+    ]
+
+
+def _post_json(post: Post | PostRow) -> str:
+    """Returns the JSON serialization of a post.
+
+    :param post: The post.
+    :return: The JSON serialization of the post.
+    """
+    fields = {
+        "id": post.id,
+        "text": post.text,
+        "author": post.author,
+        "created_at": post.created_at.isoformat()
+    }
+    return json.dumps(fields)
+
+
+class PostCounter(db.Model):
+    """Defines the post_counters table.
+
+    Each row is a named counter that db_ops keeps up to date in the same
+    transaction as the write that changes it, so that aggregates can be read
+    with a single primary key lookup instead of a scan of the posts table.
+    """
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "post_counters"
+    name = db.Column(db.String(COUNTER_NAME_SIZE), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AuthorStats(db.Model):
+    """Defines the author_stats table, which holds per-author aggregates."""
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "author_stats"
+    author = db.Column(db.String(AUTHOR_SIZE), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
 
     def __repr__(self) -> str:
         """Returns the JSON serialization of a row in the table.
@@ -23,9 +177,87 @@ class Post(db.Model):
         :return: The JSON serialization of a row in the table.
         """
         fields = {
-            "id": self.id,
-            "text": self.text,
             "author": self.author,
-            "created_at": self.created_at.isoformat()
+            "post_count": self.post_count
+        }
+        return json.dumps(fields)
+
+
+class PostActivity(db.Model):
+    """Defines the post_activity table, which holds time-bucketed post counts.
+
+    Each row counts the posts created in the bucket that starts at
+    bucket_start and spans one unit of granularity (e.g., one hour).
+    """
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "post_activity"
+    granularity = db.Column(db.String(GRANULARITY_SIZE), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        """Returns the JSON serialization of a row in the table.
+
+        :return: The JSON serialization of a row in the table.
+        """
+        fields = {
+            "bucket_start": self.bucket_start.isoformat(),
+            "post_count": self.post_count
+        }
+        return json.dumps(fields)
+
+
+class ArchivePartition(db.Model):
+    """Defines the archive_partitions table, the registry of archive tables.
+
+    Each row describes one per-month archive table that holds cold posts. The
+    created_at bounds are conservative: they always contain every post in the
+    partition, but may be wider than necessary after deletes.
+    """
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "archive_partitions"
+    month = db.Column(db.String(MONTH_SIZE), primary_key=True)
+    table_name = db.Column(db.String(TABLE_NAME_SIZE), nullable=False)
+    min_created_at = db.Column(db.DateTime, nullable=False)
+    max_created_at = db.Column(db.DateTime, nullable=False)
+
+
+class PostChange(db.Model):
+    """Defines the post_changes table, a log of every write to the posts table.
+
+    Rows are written in the same transaction as the write they describe, and
+    seq increases in commit order. Deletes are recorded as tombstones, with
+    no post fields.
+    """
+    # pylint: disable=too-few-public-methods
+
+    __tablename__ = "post_changes"
+    # Never reuse a seq, even after the newest changes are pruned.
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    operation = db.Column(db.String(OPERATION_SIZE), nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.String(TEXT_SIZE), nullable=True)
+    author = db.Column(db.String(AUTHOR_SIZE), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        """Returns the JSON serialization of a row in the table.
+
+        :return: The JSON serialization of a row in the table.
+        """
+        fields = {
+            "seq": self.seq,
+            "operation": self.operation,
+            "post_id": self.post_id,
+            "post": None if self.created_at is None else {
+                "id": self.post_id,
+                "text": self.text,
+                "author": self.author,
+                "created_at": self.created_at.isoformat()
+            }
         }
         return json.dumps(fields)
@@ -0,0 +1,284 @@
+"""Contains request deadlines, statement timeouts, and transient retries.
+
+Nothing else bounds how long a query may run, so one slow statement can pin a
+worker indefinitely. Each GraphQL request gets a deadline, from the client's
+timeout header (which may only shorten it) or the configured default. The
+deadline is kept in a context variable, so it reaches every statement that
+db_ops executes for the request without being passed around:
+
+* A statement that would start after the deadline is not sent; it raises
+  DeadlineExceeded instead.
+* On MySQL, SELECT statements carry a MAX_EXECUTION_TIME hint set to the
+  time remaining, so the server stops them at the deadline.
+* On SQLite, a progress handler interrupts statements that run past the
+  deadline.
+
+Statements cancelled by the deadline mark the request as timed out. Transient
+errors, e.g., lost connections, deadlocks, and lock timeouts, are recorded as
+well, so that the request can be retried with jittered backoff while budget
+remains; see retry_transient.
+"""
+
+from __future__ import annotations
+import random
+import sqlite3
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, TypeVar
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, ExceptionContext
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+REQUEST_TIMEOUT_SECONDS = 10.0
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 0.05
+# Number of SQLite virtual machine instructions between deadline checks.
+SQLITE_PROGRESS_INSTRUCTIONS = 1000
+# MySQL error codes for lost connections, lock wait timeouts, and deadlocks.
+_TRANSIENT_MYSQL_ERRORS = {1205, 1213, 2006, 2013}
+# MySQL error code for statements stopped by MAX_EXECUTION_TIME.
+_MYSQL_STATEMENT_TIMEOUT = 3024
+DEADLINES_EXCEEDED = Counter(
+    "populare_deadlines_exceeded_total",
+    "Number of requests whose database work was cancelled by their deadline"
+)
+TRANSIENT_RETRIES = Counter(
+    "populare_transient_retries_total",
+    "Number of retries after transient database errors"
+)
+_T = TypeVar("_T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when database work is cancelled by the request's deadline."""
+
+
+class TransientDatabaseError(Exception):
+    """Raised to retry work that hit a transient database error."""
+
+
+class _Deadline:
+    """The deadline and outcome of the current request's database work."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, expires_at: float) -> None:
+        """Instantiates the object.
+
+        :param expires_at: The time.monotonic() at which the deadline passes.
+        """
+        self.expires_at = expires_at
+        self.cancelled = False
+        self.transient_error = False
+
+
+_deadline: ContextVar[_Deadline | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """Applies a deadline to the database work in the enclosed block.
+
+    :param seconds: The number of seconds from now at which the deadline
+        passes.
+    """
+    token = _deadline.set(_Deadline(time.monotonic() + seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Returns the time remaining before the current deadline.
+
+    :return: The number of seconds remaining, which is negative once the
+        deadline has passed; or None if there is no deadline.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline.expires_at - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """Returns whether database work was cancelled by the current deadline.
+
+    :return: Whether database work was cancelled by the current deadline.
+    """
+    deadline = _deadline.get()
+    return deadline is not None and deadline.cancelled
+
+
+def transient_error_seen() -> bool:
+    """Returns whether the current work hit a transient database error.
+
+    :return: Whether the current work hit a transient database error.
+    """
+    deadline = _deadline.get()
+    return deadline is not None and deadline.transient_error
+
+
+def parse_timeout_header(value: str | None, default: float) -> float:
+    """Returns a request's timeout given its timeout header.
+
+    :param value: The header's value, in seconds, if any.
+    :param default: The default (and maximum) timeout, in seconds.
+    :return: The request's timeout, in seconds; malformed or non-positive
+        values are ignored.
+    """
+    try:
+        timeout = float(value) if value else default
+    except ValueError:
+        return default
+    return min(timeout, default) if timeout > 0 else default
+
+
+def retry_transient(
+        function: Callable[[], _T],
+        attempts: int = RETRY_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY_SECONDS
+) -> _T:
+    """Calls function, retrying it after transient database errors.
+
+    The function signals a transient error by raising TransientDatabaseError,
+    or by raising OperationalError or InterfaceError for a statement that
+    deadline.py recognizes as transient. Retries back off exponentially with
+    full jitter, and stop once the next attempt would start after the
+    deadline.
+
+    :param function: The function to call, e.g., one that runs a request in
+        a fresh transaction.
+    :param attempts: The maximum number of calls.
+    :param base_delay: The maximum delay before the first retry, in seconds.
+    :return: The function's result.
+    """
+    for attempt in range(attempts):
+        deadline = _deadline.get()
+        if deadline is not None:
+            deadline.transient_error = False
+        try:
+            return function()
+        except (TransientDatabaseError, OperationalError, InterfaceError):
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            budget = remaining()
+            if not transient_error_seen() or attempt + 1 >= attempts or (
+                    budget is not None and budget <= delay
+            ):
+                raise
+        TRANSIENT_RETRIES.inc()
+        time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def cancel() -> None:
+    """Marks the current request's work as cancelled by its deadline.
+
+    Statements are cancelled here; work that waits on the database in some
+    other way, e.g., on another thread, calls this once it stops waiting at
+    the deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is not None and not deadline.cancelled:
+        deadline.cancelled = True
+        DEADLINES_EXCEEDED.inc()
+
+
+def _add_mysql_timeout(statement: str, milliseconds: int) -> str:
+    """Adds a MAX_EXECUTION_TIME optimizer hint to a SELECT statement.
+
+    :param statement: The statement.
+    :param milliseconds: The statement's timeout.
+    :return: The statement with the hint, or unchanged if it is not a SELECT.
+    """
+    if not statement.lstrip()[:6].upper() == "SELECT":
+        return statement
+    start = len(statement) - len(statement.lstrip()) + 6
+    return (
+        f"{statement[:start]} /*+ MAX_EXECUTION_TIME({milliseconds}) */"
+        f"{statement[start:]}"
+    )
+
+
+# circuit.py imports this module before registering its own listeners, so
+# these run first: statements cancelled here are never timed by the breaker.
+@event.listens_for(Engine, "before_cursor_execute", retval=True)
+def _before_cursor_execute(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool
+) -> tuple[str, Any]:
+    """Cancels statements past the deadline and bounds the others.
+
+    :param conn: The connection.
+    :param cursor: The DBAPI cursor.
+    :param statement: The statement.
+    :param parameters: The statement's parameters.
+    :param context: The execution context.
+    :param executemany: Whether the statement is an executemany.
+    :return: The statement to execute and its parameters.
+    """
+    # pylint: disable=unused-argument,too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    budget = remaining()
+    if budget is None:
+        return statement, parameters
+    if budget <= 0:
+        cancel()
+        raise DeadlineExceeded("Request deadline exceeded")
+    if conn.dialect.name == "mysql":
+        statement = _add_mysql_timeout(statement, max(1, int(budget * 1000)))
+    return statement, parameters
+
+
+def _sqlite_progress() -> int:
+    """Interrupts SQLite statements that run past the deadline.
+
+    :return: Nonzero to interrupt the statement.
+    """
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        cancel()
+        return 1
+    return 0
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection: object, connection_record: object) -> None:
+    """Installs the deadline progress handler on SQLite connections.
+
+    :param dbapi_connection: The DBAPI connection.
+    :param connection_record: The connection's pool record.
+    """
+    # pylint: disable=unused-argument
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(
+            _sqlite_progress,
+            SQLITE_PROGRESS_INSTRUCTIONS
+        )
+
+
+# Runs before the circuit breaker's listener, which ignores statements
+# cancelled by the deadline.
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context: ExceptionContext) -> None:
+    """Records statement timeouts and transient errors.
+
+    :param context: The exception context.
+    """
+    error = context.original_exception
+    code = error.args[0] if getattr(error, "args", None) else None
+    if code == _MYSQL_STATEMENT_TIMEOUT:
+        cancel()
+        return
+    deadline = _deadline.get()
+    if deadline is None or deadline.cancelled:
+        return
+    if context.is_disconnect or code in _TRANSIENT_MYSQL_ERRORS or (
+            isinstance(error, sqlite3.OperationalError) and
+            "database is locked" in str(error)
+    ):
+        deadline.transient_error = True
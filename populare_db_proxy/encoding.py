@@ -0,0 +1,177 @@
+"""Contains the encoders for GraphQL responses.
+
+Responses are encoded with orjson, which is several times faster than the
+standard library for the large lists of serialized posts that feed pages
+contain. Clients may instead ask for MessagePack (Accept: application/msgpack)
+or CBOR (Accept: application/cbor) responses. orjson, msgpack, and cbor2 are
+in requirements.txt; an installation without one of them falls back to the
+standard library's equivalent JSON output or does not offer the binary format.
+
+In binary responses, posts are native maps rather than JSON strings, and their
+timestamps are integer microseconds since the Unix epoch, so clients parse no
+text; see native_post. Naive timestamps are taken to be UTC. The schema's post
+fields are Strings either way: for binary responses, resolvers return
+PostPayloads, which the encoder replaces with native maps.
+"""
+
+from __future__ import annotations
+import json
+from datetime import datetime, timezone
+from typing import Any
+from werkzeug.datastructures import MIMEAccept
+from populare_db_proxy.db_schema import Post, PostRow
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+CBOR_MIMETYPE = "application/cbor"
+_EPOCH = datetime(1970, 1, 1)
+
+
+class PostPayload(str):
+    """A post's JSON serialization that keeps the post it serializes.
+
+    GraphQL serializes a PostPayload returned for a String field unchanged,
+    so that encode_binary can replace it with the post's native map.
+    """
+
+    post: Post | PostRow
+
+    def __new__(cls, payload: str, post: Post | PostRow) -> PostPayload:
+        """Instantiates the object.
+
+        :param payload: The post's JSON serialization.
+        :param post: The post.
+        """
+        instance = super().__new__(cls, payload)
+        instance.post = post
+        return instance
+
+    def __str__(self) -> str:
+        """Returns the payload itself, which keeps its post.
+
+        :return: The payload.
+        """
+        return self
+
+
+def encode_json(data: Any, pretty: bool = False) -> str:
+    """Returns the compact (or, if pretty, indented) JSON encoding of data.
+
+    :param data: The data to encode, e.g., a GraphQL execution result.
+    :param pretty: Whether to indent the output for human readers.
+    :return: The JSON encoding of data.
+    """
+    if pretty:
+        return json.dumps(data, indent=2, separators=(",", ": "))
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")  # pylint: disable=no-member
+    return json.dumps(data, separators=(",", ":"))
+
+
+def binary_mimetypes() -> list[str]:
+    """Returns the binary response formats whose encoders are installed.
+
+    :return: The mimetypes of the available binary formats.
+    """
+    mimetypes = []
+    if msgpack is not None:
+        mimetypes.append(MSGPACK_MIMETYPE)
+    if cbor2 is not None:
+        mimetypes.append(CBOR_MIMETYPE)
+    return mimetypes
+
+
+def negotiate_mimetype(accept: MIMEAccept) -> str:
+    """Returns the response format that best matches a request's Accept.
+
+    :param accept: The request's Accept header.
+    :return: The mimetype of the response format; JSON unless the client
+        prefers an available binary format.
+    """
+    return accept.best_match(
+        [JSON_MIMETYPE] + binary_mimetypes(),
+        default=JSON_MIMETYPE
+    )
+
+
+def encode_binary(data: Any, mimetype: str) -> bytes:
+    """Returns the binary encoding of data.
+
+    :param data: The data to encode, e.g., a GraphQL execution result.
+    :param mimetype: The mimetype of an available binary format.
+    :return: The encoding of data.
+    """
+    # pylint: disable=no-member
+    data = _native_payloads(data)
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(data, use_bin_type=True)
+    return cbor2.dumps(data)
+
+
+def _native_payloads(data: Any) -> Any:
+    """Returns data with each PostPayload replaced by its native map.
+
+    :param data: The data, e.g., a GraphQL execution result.
+    :return: A copy of the data's containers with native posts; data itself
+        is not modified.
+    """
+    if isinstance(data, PostPayload):
+        return native_post(data.post)
+    if isinstance(data, dict):
+        return {key: _native_payloads(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_native_payloads(value) for value in data]
+    return data
+
+
+def decode_binary(payload: bytes, mimetype: str) -> Any:
+    """Returns the data that encode_binary encoded.
+
+    :param payload: The encoding.
+    :param mimetype: The mimetype of an available binary format.
+    :return: The data.
+    """
+    # pylint: disable=no-member
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.unpackb(payload, raw=False)
+    return cbor2.loads(payload)
+
+
+def native_post(post: Post | PostRow) -> dict[str, Any]:
+    """Returns a post as a map for binary responses.
+
+    :param post: The post.
+    :return: The post's fields, as in its JSON serialization, except that
+        created_at is an integer timestamp; see timestamp_micros.
+    """
+    return {
+        "id": post.id,
+        "text": post.text,
+        "author": post.author,
+        "created_at": timestamp_micros(post.created_at)
+    }
+
+
+def timestamp_micros(value: datetime) -> int:
+    """Returns a datetime as integer microseconds since the Unix epoch.
+
+    :param value: The datetime; if naive, it is taken to be UTC.
+    :return: The number of microseconds since the Unix epoch.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + \
+        delta.microseconds
@@ -0,0 +1,339 @@
+"""Contains the live feed, which pushes post changes to clients over SSE.
+
+Instead of polling readPosts, clients hold open a Server-Sent Events stream on
+/feed/stream. Every committed post write is published to an in-process broker,
+which fans it out to each connected client's bounded buffer. A client that
+falls too far behind is sent a reset event and disconnected, so that one slow
+reader cannot make the broker buffer without bound; the client then reloads
+its feed and reconnects. Recent events are kept in a bounded history, so a
+client that reconnects with a Last-Event-ID header receives the events it
+missed.
+
+Each open stream holds one of its worker's threads for as long as the client
+is connected, and those threads also serve /graphql and REST. So that idle
+subscribers cannot starve other requests, each worker accepts no more than a
+configured number of streams, well below its thread count, and rejects the
+rest with 503; rejected clients fall back to polling readPosts.
+
+Gunicorn runs several worker processes, each with its own broker. When a relay
+directory is configured, each worker binds a Unix datagram socket in that
+directory and forwards the events it publishes to every other worker's socket,
+so clients see writes regardless of which worker handled them.
+"""
+
+from __future__ import annotations
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass
+from prometheus_client import Counter
+
+FEED_HISTORY_SIZE = 1000
+FEED_BUFFER_SIZE = 100
+FEED_HEARTBEAT_SECONDS = 15.0
+FEED_RELAY_MAX_DATAGRAM_SIZE = 65536
+POST_CREATED = "post_created"
+POST_UPDATED = "post_updated"
+POST_DELETED = "post_deleted"
+RESET = "reset"
+FEED_RELAY_DROPPED = Counter(
+    "populare_feed_relay_dropped_total",
+    "Number of feed events that could not be relayed to another worker",
+    ["reason"]
+)
+_logger = logging.getLogger(__name__)
+
+
+class FeedFull(Exception):
+    """Raised when a broker already has its maximum number of subscribers."""
+
+
+@dataclass(frozen=True)
+class FeedEvent:
+    """An event in the live feed.
+
+    :ivar event_id: The event's id, which increases over time. Ids are
+        microsecond timestamps so that they are comparable across workers.
+    :ivar event_type: The type of the event, e.g., POST_CREATED.
+    :ivar data: The event's payload; for post events, the post's JSON
+        serialization, or just its id for deletes.
+    """
+
+    event_id: int
+    event_type: str
+    data: str
+
+    def to_sse(self) -> str:
+        """Returns the event in the Server-Sent Events wire format.
+
+        :return: The event in the Server-Sent Events wire format.
+        """
+        return f"id: {self.event_id}\nevent: {self.event_type}\n" \
+               f"data: {self.data}\n\n"
+
+
+class Subscription:
+    """A client's bounded buffer of feed events."""
+
+    def __init__(self, buffer_size: int) -> None:
+        """Instantiates the object.
+
+        :param buffer_size: The maximum number of undelivered events; if more
+            arrive, the subscription is marked as overflowed.
+        """
+        self.buffer_size = buffer_size
+        self.overflowed = False
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def put(self, event: FeedEvent) -> None:
+        """Adds an event to the buffer and wakes the client.
+
+        :param event: The event to add.
+        """
+        with self._condition:
+            if len(self._events) >= self.buffer_size:
+                self.overflowed = True
+                self._events.clear()
+            else:
+                self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> FeedEvent | None:
+        """Removes and returns the next event, waiting if necessary.
+
+        :param timeout: The maximum number of seconds to wait.
+        :return: The next event, or None if none arrived before the timeout
+            or the subscription overflowed.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._events or self.overflowed,
+                timeout=timeout
+            )
+            return self._events.popleft() if self._events else None
+
+    def __len__(self) -> int:
+        """Returns the number of undelivered events.
+
+        :return: The number of undelivered events.
+        """
+        return len(self._events)
+
+
+class FeedBroker:
+    """Fans feed events out to subscribers in this process."""
+
+    def __init__(
+            self,
+            history_size: int = FEED_HISTORY_SIZE,
+            buffer_size: int = FEED_BUFFER_SIZE,
+            max_subscriptions: int | None = None
+    ) -> None:
+        """Instantiates the object.
+
+        :param history_size: The number of recent events to keep for clients
+            that resume with Last-Event-ID.
+        :param buffer_size: The size of each subscriber's buffer.
+        :param max_subscriptions: The maximum number of subscribers; if None,
+            the number is unbounded.
+        """
+        self.buffer_size = buffer_size
+        self.max_subscriptions = max_subscriptions
+        self.relay = None
+        self._history = deque(maxlen=history_size)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._last_event_id = 0
+
+    def publish(self, event_type: str, data: str) -> FeedEvent:
+        """Publishes a new event to local subscribers and other workers.
+
+        :param event_type: The type of the event, e.g., POST_CREATED.
+        :param data: The event's payload.
+        :return: The published event.
+        """
+        with self._lock:
+            self._last_event_id = max(
+                self._last_event_id + 1,
+                time.time_ns() // 1000
+            )
+            event = FeedEvent(self._last_event_id, event_type, data)
+        self.deliver(event)
+        if self.relay is not None:
+            self.relay.send(event)
+        return event
+
+    def deliver(self, event: FeedEvent) -> None:
+        """Delivers an event to local subscribers without relaying it.
+
+        :param event: The event to deliver.
+        """
+        with self._lock:
+            self._last_event_id = max(self._last_event_id, event.event_id)
+            self._history.append(event)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, last_event_id: int | None = None) -> Subscription:
+        """Returns a new subscription to the feed.
+
+        :param last_event_id: If supplied, the subscription starts with every
+            event in the history that is newer than this id.
+        :return: The new subscription.
+        :raises FeedFull: If the broker has its maximum number of subscribers.
+        """
+        subscription = Subscription(self.buffer_size)
+        with self._lock:
+            if self.max_subscriptions is not None and \
+                    len(self._subscriptions) >= self.max_subscriptions:
+                raise FeedFull(
+                    f"Live feed has {len(self._subscriptions)} subscribers"
+                )
+            if last_event_id is not None:
+                for event in self._history:
+                    if event.event_id > last_event_id:
+                        subscription.put(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Removes a subscription from the feed.
+
+        :param subscription: The subscription to remove.
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def num_subscriptions(self) -> int:
+        """Returns the number of connected subscribers.
+
+        :return: The number of connected subscribers.
+        """
+        return len(self._subscriptions)
+
+
+class SocketRelay:
+    """Relays feed events between worker processes over Unix sockets."""
+
+    def __init__(
+            self,
+            broker: FeedBroker,
+            directory: str,
+            name: str | None = None
+    ) -> None:
+        """Instantiates the object and starts receiving relayed events.
+
+        :param broker: The local broker to which to deliver relayed events.
+        :param directory: The directory shared by every worker's socket.
+        :param name: The name of this worker's socket; defaults to the process
+            id.
+        """
+        self.broker = broker
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        name = name if name is not None else str(os.getpid())
+        self.path = os.path.join(directory, f"{name}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        # Sending never blocks, so a stalled worker cannot stall writes.
+        self._send_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_socket.setblocking(False)
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def send(self, event: FeedEvent) -> None:
+        """Sends an event to every other worker.
+
+        Sockets left behind by workers that have exited are removed. Events
+        that cannot be sent are dropped, never raised, since they are sent
+        after their write commits; the other workers' subscribers miss them.
+
+        :param event: The event to send.
+        """
+        datagram = json.dumps([
+            event.event_id,
+            event.event_type,
+            event.data
+        ]).encode("utf-8")
+        for path in glob.glob(os.path.join(self.directory, "*.sock")):
+            if path == self.path:
+                continue
+            try:
+                self._send_socket.sendto(datagram, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # The peer's receive buffer is full; it will have to resync.
+                FEED_RELAY_DROPPED.labels(reason="full").inc()
+            except OSError:
+                # E.g., the event is larger than the socket allows.
+                FEED_RELAY_DROPPED.labels(reason="error").inc()
+                _logger.exception("Could not relay feed event to %s", path)
+
+    def _receive(self) -> None:
+        """Delivers relayed events to the local broker until closed."""
+        while True:
+            try:
+                datagram = self._socket.recv(FEED_RELAY_MAX_DATAGRAM_SIZE)
+            except OSError:
+                return
+            try:
+                event_id, event_type, data = json.loads(datagram)
+            except (ValueError, TypeError):
+                # E.g., a datagram from something other than a relay.
+                FEED_RELAY_DROPPED.labels(reason="malformed").inc()
+                _logger.warning("Dropped malformed relayed feed event")
+                continue
+            self.broker.deliver(FeedEvent(event_id, event_type, data))
+
+    def close(self) -> None:
+        """Stops relaying and removes this worker's socket."""
+        self._socket.close()
+        self._send_socket.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def stream_events(
+        broker: FeedBroker,
+        subscription: Subscription,
+        heartbeat_seconds: float = FEED_HEARTBEAT_SECONDS
+) -> Iterator[str]:
+    """Yields a subscription's events in the Server-Sent Events format.
+
+    A comment line is sent as a heartbeat whenever no event arrives within
+    heartbeat_seconds, so that proxies do not close the idle connection. The
+    subscription is removed when the client disconnects.
+
+    :param broker: The broker that owns the subscription.
+    :param subscription: The subscription to stream.
+    :param heartbeat_seconds: The maximum time between messages.
+    :return: A generator of Server-Sent Events messages.
+    """
+    try:
+        yield f"retry: {int(heartbeat_seconds * 1000)}\n\n"
+        while True:
+            event = subscription.get(timeout=heartbeat_seconds)
+            if subscription.overflowed:
+                yield f"event: {RESET}\ndata: {{}}\n\n"
+                return
+            yield event.to_sse() if event is not None else ": heartbeat\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+feed_broker = FeedBroker()
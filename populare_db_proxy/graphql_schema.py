@@ -6,10 +6,14 @@ https://docs.graphene-python.org/projects/sqlalchemy/en/latest/tutorial/
 
 from __future__ import annotations
 from datetime import datetime
+from promise import Promise
+from promise.dataloader import DataLoader
 from graphene import (
     ObjectType,
     String,
     Int,
+    Boolean,
+    Field,
     DateTime,
     Schema,
     ResolveInfo,
@@ -18,18 +22,136 @@ from graphene import (
 from populare_db_proxy.db_ops import (
     init_db_schema,
     read_posts as db_read_posts,
-    create_post as db_create_post,
-    update_post as db_update_post,
+    read_posts_by_ids as db_read_posts_by_ids,
+    update_post_fields as db_update_post_fields,
     delete_post as db_delete_post,
-    READ_POSTS_LIMIT
+    read_post_count as db_read_post_count,
+    read_author_stats as db_read_author_stats,
+    read_post_activity as db_read_post_activity,
+    read_changes_since as db_read_changes_since,
+    CHANGES_SINCE_LIMIT,
+    READ_POSTS_LIMIT,
+    AUTHOR_STATS_LIMIT
 )
-from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_schema import Post, PostRow
+from populare_db_proxy.post_cache import serialize_post
+from populare_db_proxy.journal import create_post_durably
+from populare_db_proxy.encoding import PostPayload
+from populare_db_proxy.profiling import SERIALIZE, profile_phase
+
+
+def present_post(
+        info: ResolveInfo,
+        post: Post | PostRow,
+        cached: bool = True
+) -> str:
+    """Returns a post's JSON serialization.
+
+    :param info: The GraphQL context; in Flask, the request, on which the
+        proxy sets native_payloads for binary responses.
+    :param post: The post.
+    :param cached: Whether the post's JSON serialization may come from, and
+        be stored in, the post payload cache.
+    :return: The post's JSON serialization; for binary responses, a
+        PostPayload, which the encoder replaces with the post's native map.
+    """
+    with profile_phase(SERIALIZE):
+        # Binary responses never send the JSON, so they leave the cache to
+        # the JSON responses that do.
+        if getattr(info.context, "native_payloads", False):
+            return PostPayload(str(post), post)
+        return serialize_post(post) if cached else str(post)
+
+
+class PostLoader(DataLoader):
+    """Batches and caches post lookups by id for the life of one request.
+
+    Every post id requested anywhere in a GraphQL document, including through
+    aliases, is collected and resolved with a single database query.
+    """
+
+    def __init__(self, native_payloads: bool = False) -> None:
+        """Instantiates the object.
+
+        :param native_payloads: Whether to load posts as PostPayloads for a
+            binary response; see present_post.
+        """
+        super().__init__()
+        self.native_payloads = native_payloads
+
+    def batch_load_fn(self, keys: list[int]) -> Promise:
+        """Loads the posts with the given ids.
+
+        :param keys: The ids of the posts to load.
+        :return: A promise of the JSON serializations of the posts, in the
+            same order as keys; missing posts are None.
+        """
+        # pylint: disable=method-hidden
+        posts = db_read_posts_by_ids(keys)
+        with profile_phase(SERIALIZE):
+            return Promise.resolve([
+                self._present(posts[key]) if key in posts else None
+                for key in keys
+            ])
+
+    def _present(self, post: PostRow) -> str:
+        """Returns a loaded post's JSON serialization.
+
+        :param post: The post.
+        :return: The post's JSON serialization; a PostPayload if the loader
+            serves a binary response.
+        """
+        if self.native_payloads:
+            return PostPayload(str(post), post)
+        return serialize_post(post)
+
+
+def get_post_loader(info: ResolveInfo) -> PostLoader:
+    """Returns the post loader for the current request.
+
+    The loader is stored on the GraphQL context (in Flask, the request), so
+    that its cache lives exactly as long as the request. If there is no
+    context, a new loader is returned.
+
+    :param info: The GraphQL context.
+    :return: The post loader for the current request.
+    """
+    loader = getattr(info.context, "post_loader", None)
+    if loader is None:
+        loader = PostLoader(
+            getattr(info.context, "native_payloads", False)
+        )
+        if info.context is not None:
+            info.context.post_loader = loader
+    return loader
+
+
+class ChangeSet(ObjectType):
+    """Represents a page of the post change log."""
+    # pylint: disable=too-few-public-methods
+
+    changes = List(
+        String,
+        description="The JSON serializations of the changes, in commit order."
+    )
+    cursor = Int(description="The cursor to pass to the next changesSince.")
+    reset = Boolean(
+        description="Whether the client must reload its feed because changes "
+                    "after its cursor have been pruned."
+    )
 
 
 class Query(ObjectType):
     """Represents available GraphQL queries."""
 
     init_db = String()
+    post = String(
+        post_id=Int(name="id")
+    )
+    posts = List(
+        String,
+        post_ids=List(Int, name="ids")
+    )
     read_posts = List(
         String,
         limit=Int(required=False),
@@ -38,7 +160,11 @@ class Query(ObjectType):
     create_post = String(
         text=String(),
         author=String(),
-        created_at=DateTime()
+        created_at=DateTime(),
+        description="Creates a post and returns its JSON serialization. Posts "
+                    "accepted while the database is unavailable are journaled "
+                    "and have negative ids, which they keep permanently once "
+                    "they are written to the database."
     )
     update_post = String(
         post_id=Int(),
@@ -49,6 +175,23 @@ class Query(ObjectType):
     delete_post = String(
         post_id=Int()
     )
+    post_count = Int()
+    author_stats = List(
+        String,
+        author=String(required=False),
+        limit=Int(required=False)
+    )
+    post_activity = List(
+        String,
+        granularity=String(),
+        start=DateTime(name="from"),
+        end=DateTime(name="to")
+    )
+    changes_since = Field(
+        ChangeSet,
+        cursor=Int(required=False),
+        limit=Int(required=False)
+    )
 
     @staticmethod
     def resolve_init_db(root: ObjectType | None, info: ResolveInfo) -> str:
@@ -89,9 +232,50 @@ class Query(ObjectType):
         # pylint: disable=unused-argument
         limit = limit if limit is not None else READ_POSTS_LIMIT
         return [
-            str(post) for post in db_read_posts(limit=limit, before=before)
+            present_post(info, post)
+            for post in db_read_posts(limit=limit, before=before)
         ]
 
+    @staticmethod
+    def resolve_post(
+            root: ObjectType | None,
+            info: ResolveInfo,
+            post_id: int
+    ) -> Promise:
+        """Returns the response to a post query.
+
+        curl -d '{ post(id: 1) }' -H "Content-Type: application/graphql" -X
+        POST http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :param post_id: The id of the post to read (the "id" argument).
+        :return: A promise of the response to a post query; None if the post
+            does not exist.
+        """
+        # pylint: disable=unused-argument
+        return get_post_loader(info).load(post_id)
+
+    @staticmethod
+    def resolve_posts(
+            root: ObjectType | None,
+            info: ResolveInfo,
+            post_ids: list[int]
+    ) -> Promise:
+        """Returns the response to a posts query.
+
+        curl -d '{ posts(ids: [1, 2]) }' -H "Content-Type: application/graphql"
+        -X POST http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :param post_ids: The ids of the posts to read (the "ids" argument).
+        :return: A promise of the response to a posts query, in the same order
+            as post_ids; missing posts are None.
+        """
+        # pylint: disable=unused-argument
+        return get_post_loader(info).load_many(post_ids)
+
     @staticmethod
     def resolve_create_post(
             root: ObjectType | None,
@@ -116,42 +300,49 @@ class Query(ObjectType):
         """
         # pylint: disable=unused-argument
         post = Post(text=text, author=author, created_at=created_at)
-        db_create_post(post)
-        return str(post)
+        create_post_durably(post)
+        return present_post(info, post, cached=False)
 
     @staticmethod
     def resolve_update_post(
             root: ObjectType | None,
             info: ResolveInfo,
             post_id: int,
-            text: str,
-            author: str,
-            created_at: datetime
-    ) -> str:
+            text: str | None = None,
+            author: str | None = None,
+            created_at: datetime | None = None
+    ) -> str | None:
         """Returns the response to an update_post query.
 
+        Only the supplied fields are updated.
+
         curl -d '{ updatePost(postId: 1, text: "new text", author:
         "new author", createdAt: "2006-01-02T15:04:05") }' -H "Content-Type:
         application/graphql" -X POST http://localhost:5000/graphql
 
+        curl -d '{ updatePost(postId: 1, text: "new text") }' -H
+        "Content-Type: application/graphql" -X POST
+        http://localhost:5000/graphql
+
         :param root: The root GraphQL object.
         :param info: The GraphQL context.
         :param post_id: The id of the post to update.
-        :param text: The text with which to update the post.
-        :param author: The author with which to update the post.
-        :param created_at: The created_at datetime with which to update the
-            post. For POST requests, format this as an ISO string.
-        :return: The response to an update_post query.
+        :param text: If supplied, the text with which to update the post.
+        :param author: If supplied, the author with which to update the post.
+        :param created_at: If supplied, the created_at datetime with which to
+            update the post. For POST requests, format this as an ISO string.
+        :return: The response to an update_post query, which is the updated
+            post; None if no post has the id.
         """
         # pylint: disable=unused-argument, too-many-arguments
-        post = Post(
-            id=post_id,
+        post = db_update_post_fields(
+            post_id,
             text=text,
             author=author,
             created_at=created_at
         )
-        db_update_post(post)
-        return str(post)
+        return present_post(info, post, cached=False) \
+            if post is not None else None
 
     @staticmethod
     def resolve_delete_post(
@@ -173,6 +364,112 @@ class Query(ObjectType):
         db_delete_post(post_id)
         return "ok"
 
+    @staticmethod
+    def resolve_post_count(root: ObjectType | None, info: ResolveInfo) -> int:
+        """Returns the response to a post_count query.
+
+        curl -d '{ postCount }' -H "Content-Type: application/graphql" -X POST
+        http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :return: The response to a post_count query.
+        """
+        # pylint: disable=unused-argument
+        return db_read_post_count()
+
+    @staticmethod
+    def resolve_author_stats(
+            root: ObjectType | None,
+            info: ResolveInfo,
+            author: str | None = None,
+            limit: int | None = None
+    ) -> list[str]:
+        """Returns the response to an author_stats query.
+
+        curl -d '{ authorStats(limit: 10) }' -H "Content-Type:
+        application/graphql" -X POST http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :param author: If supplied, return only the stats for this author.
+        :param limit: The maximum number of authors to return. If not
+            specified, uses the package default.
+        :return: The response to an author_stats query.
+        """
+        # pylint: disable=unused-argument
+        limit = limit if limit is not None else AUTHOR_STATS_LIMIT
+        return [
+            str(stats)
+            for stats in db_read_author_stats(author=author, limit=limit)
+        ]
+
+    @staticmethod
+    def resolve_post_activity(
+            root: ObjectType | None,
+            info: ResolveInfo,
+            granularity: str,
+            start: datetime,
+            end: datetime
+    ) -> list[str]:
+        """Returns the response to a post_activity query.
+
+        curl -d '{ postActivity(granularity: "hour", from:
+        "2022-01-01T00:00:00", to: "2022-01-02T00:00:00") }' -H
+        "Content-Type: application/graphql" -X POST
+        http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :param granularity: The bucket size; one of "minute", "hour", or
+            "day".
+        :param start: The beginning of the time range (the "from" argument).
+        :param end: The end of the time range (the "to" argument), exclusive.
+        :return: The response to a post_activity query.
+        """
+        # pylint: disable=unused-argument, too-many-arguments
+        return [
+            str(bucket) for bucket in db_read_post_activity(
+                granularity=granularity,
+                start=start,
+                end=end
+            )
+        ]
+
+    @staticmethod
+    def resolve_changes_since(
+            root: ObjectType | None,
+            info: ResolveInfo,
+            cursor: int | None = None,
+            limit: int | None = None
+    ) -> ChangeSet:
+        """Returns the response to a changes_since query.
+
+        curl -d '{ changesSince(cursor: 0) { changes cursor reset } }' -H
+        "Content-Type: application/graphql" -X POST
+        http://localhost:5000/graphql
+
+        :param root: The root GraphQL object.
+        :param info: The GraphQL context.
+        :param cursor: The cursor returned by the client's previous
+            changes_since query; if not specified, 0.
+        :param limit: The maximum number of changes to return. If not
+            specified, uses the package default.
+        :return: The response to a changes_since query.
+        """
+        # pylint: disable=unused-argument
+        cursor = cursor if cursor is not None else 0
+        limit = limit if limit is not None else CHANGES_SINCE_LIMIT
+        changes, next_cursor, reset = db_read_changes_since(
+            cursor=cursor,
+            limit=limit
+        )
+        return ChangeSet(
+            changes=[str(change) for change in changes],
+            cursor=next_cursor,
+            reset=reset
+        )
+
 
 def get_schema() -> Schema:
     """Returns the GraphQL schema for the proxy.
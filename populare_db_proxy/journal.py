@@ -0,0 +1,591 @@
+"""Contains the local write journal, which accepts posts during outages.
+
+When the database fails over, every createPost fails and clients retry, which
+makes the burst on recovery worse. If a journal directory is configured,
+createPost instead appends the post to a local append-only journal whenever
+the database circuit breaker is not closed (see circuit.py), which covers
+both outages and latency breaches, and replays the journal to the database in
+journal order, in batched inserts, once it is healthy again.
+
+The journal is a series of segment files of checksummed JSON lines. A post is
+acknowledged only once it has been fsynced; concurrent appends share one fsync
+(group commit): while one thread syncs, the others append, and the next sync
+covers them all. A segment is rotated once it exceeds its size limit, and
+segments are deleted once every post in them has been replayed. The replay
+position is kept in a checkpoint file, so replay resumes after a restart. A
+torn record at the end of the journal, from a crash mid-append, was never
+acknowledged and is discarded.
+
+Journaled posts need ids before the database can assign them. Each worker
+reserves blocks of negative ids, which autoincrement never assigns, from a
+counter in the database while it is healthy, and records each block in the
+journal so that a restart during an outage does not reuse ids. Replay skips
+posts whose ids already exist, so a crash between a batch's insert and its
+checkpoint does not duplicate posts. Journaled posts are not readable until
+they are replayed, and they keep their negative ids permanently.
+
+A request that journals a post and is then retried after a transient error
+must not journal it again. Requests therefore run their retries in a
+journal_scope, in which each post a request creates is keyed by its position
+among the request's creates. A retry that reaches a key that an earlier
+attempt journaled returns that journaled post, with its id, whatever the
+breaker's state, so the post is journaled once and replay, which skips ids
+that already exist, writes it once.
+"""
+
+from __future__ import annotations
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from prometheus_client import Counter, Gauge
+from sqlalchemy.exc import InterfaceError, OperationalError
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import (
+    create_post,
+    create_journaled_posts,
+    reserve_journal_ids
+)
+from populare_db_proxy.circuit import (
+    CircuitOpenError,
+    database_breaker,
+    CLOSED
+)
+
+JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024
+JOURNAL_ID_BLOCK_SIZE = 1000
+JOURNAL_REPLAY_BATCH_SIZE = 500
+JOURNAL_REPLAY_INTERVAL_SECONDS = 1.0
+RECORD_POST = "post"
+RECORD_IDS = "ids"
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".log"
+_CHECKPOINT_FILENAME = "checkpoint"
+JOURNAL_APPENDS = Counter(
+    "populare_journal_appends_total",
+    "Number of posts accepted by the write journal"
+)
+JOURNAL_REPLAYED = Counter(
+    "populare_journal_replayed_total",
+    "Number of journaled posts written to the database"
+)
+JOURNAL_FSYNCS = Counter(
+    "populare_journal_fsyncs_total",
+    "Number of write journal fsyncs; appends per fsync is the group size"
+)
+JOURNAL_BACKLOG = Gauge(
+    "populare_journal_backlog_posts",
+    "Number of journaled posts not yet written to the database",
+    multiprocess_mode="livesum"
+)
+JOURNAL_LAG = Gauge(
+    "populare_journal_lag_seconds",
+    "Age of the oldest journaled post not yet written to the database",
+    multiprocess_mode="livemax"
+)
+# Set by create_write_journal; None if the journal is disabled.
+write_journal = None  # pylint: disable=invalid-name
+
+
+class JournalUnavailable(Exception):
+    """Raised when the journal cannot accept a post."""
+
+
+class _JournalScope:
+    """The posts that a request's attempts have journaled."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        # Maps each idempotency key to the id of the post journaled for it.
+        self.journaled: dict[int, int] = {}
+        self.next_key = 0
+
+
+_journal_scope: ContextVar[_JournalScope | None] = ContextVar(
+    "journal_scope",
+    default=None
+)
+
+
+class WriteJournal:
+    """Durably journals posts and replays them to the database."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+            self,
+            directory: str,
+            segment_bytes: int = JOURNAL_SEGMENT_BYTES,
+            id_block_size: int = JOURNAL_ID_BLOCK_SIZE
+    ) -> None:
+        """Opens the journal, recovering its state from disk.
+
+        :param directory: The directory that holds the journal's files; it is
+            created if it does not exist.
+        :param segment_bytes: The size beyond which a segment is rotated.
+        :param id_block_size: The number of ids to reserve at a time.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.id_block_size = id_block_size
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.lock_file = None
+        self._next_id = None
+        self._last_id = None
+        self._written = 0
+        self._synced = 0
+        # The journaled_at times of the posts not yet replayed, oldest first.
+        self._pending = deque()
+        os.makedirs(directory, exist_ok=True)
+        self._segment, self._file = self._recover()
+        self.update_gauges()
+
+    def update_gauges(self) -> None:
+        """Sets the backlog and lag gauges to the journal's current state.
+
+        The gauges are set explicitly rather than computed on collection so
+        that they are exported with multiprocess metrics; see
+        multiprocess_metrics.py. The replayer updates them every interval.
+        """
+        with self._lock:
+            JOURNAL_BACKLOG.set(len(self._pending))
+            JOURNAL_LAG.set(
+                time.time() - self._pending[0] if self._pending else 0.0
+            )
+
+    @property
+    def backlog(self) -> int:
+        """Returns the number of journaled posts not yet replayed.
+
+        :return: The number of journaled posts not yet replayed.
+        """
+        return len(self._pending)
+
+    @property
+    def remaining_ids(self) -> int:
+        """Returns the number of reserved ids not yet assigned.
+
+        :return: The number of reserved ids not yet assigned.
+        """
+        with self._lock:
+            if self._next_id is None:
+                return 0
+            return max(0, self._next_id - self._last_id + 1)
+
+    def add_ids(self, first: int, last: int) -> None:
+        """Replaces the block of reserved ids.
+
+        :param first: The first id to assign.
+        :param last: The last id to assign; ids are assigned in descending
+            order from first to last.
+        """
+        with self._lock:
+            self._next_id, self._last_id = first, last
+            self._write({RECORD_IDS: [first, last]})
+            seq = self._written
+        self._sync(seq)
+
+    def append(self, post: Post) -> Post:
+        """Durably journals a post, assigning its id.
+
+        :param post: The post.
+        :return: The input post, with its id set; it is written to the
+            database when the journal is replayed.
+        """
+        with self._lock:
+            if self._next_id is None or self._next_id < self._last_id:
+                raise JournalUnavailable("No reserved post ids")
+            post.id = self._next_id
+            self._next_id -= 1
+            journaled_at = time.time()
+            self._write({RECORD_POST: {
+                "id": post.id,
+                "text": post.text,
+                "author": post.author,
+                "created_at": post.created_at.isoformat(),
+                "journaled_at": journaled_at
+            }})
+            self._pending.append(journaled_at)
+            seq = self._written
+        self._sync(seq)
+        JOURNAL_APPENDS.inc()
+        return post
+
+    def replay(
+            self,
+            write_posts: Callable[[list[Post]], None],
+            batch_size: int = JOURNAL_REPLAY_BATCH_SIZE
+    ) -> int:
+        """Writes the journaled posts to the database in journal order.
+
+        The checkpoint is advanced after each batch, and segments that have
+        been replayed are deleted.
+
+        :param write_posts: A function that writes a batch of posts to the
+            database, skipping posts that already exist.
+        :param batch_size: The maximum number of posts per batch.
+        :return: The number of posts replayed.
+        """
+        num_replayed = 0
+        with self._replay_lock:
+            position = self._read_checkpoint()
+            while True:
+                posts, next_position = self._read_batch(position, batch_size)
+                if posts:
+                    write_posts(posts)
+                if next_position != position:
+                    self._write_checkpoint(next_position)
+                    self._delete_segments_before(next_position[0])
+                with self._lock:
+                    for _ in posts:
+                        self._pending.popleft()
+                JOURNAL_REPLAYED.inc(len(posts))
+                num_replayed += len(posts)
+                position = next_position
+                if len(posts) < batch_size:
+                    return num_replayed
+
+    def start_replayer(
+            self,
+            write_posts: Callable[[list[Post]], None],
+            reserve_ids: Callable[[int], tuple[int, int]],
+            interval: float = JOURNAL_REPLAY_INTERVAL_SECONDS
+    ) -> threading.Thread:
+        """Replays the journal and reserves ids in a background thread.
+
+        Every interval, the thread tops up the reserved ids if fewer than half
+        a block remain and replays any backlog. Failures, e.g., because the
+        database is still unavailable, are retried on the next interval.
+
+        :param write_posts: See replay.
+        :param reserve_ids: A function that reserves a number of ids in the
+            database and returns the first and last of them; see add_ids.
+        :param interval: The number of seconds between attempts.
+        :return: The thread.
+        """
+
+        def run() -> None:
+            """Replays the journal until the journal is closed."""
+            while True:
+                try:
+                    if self.remaining_ids < self.id_block_size // 2:
+                        self.add_ids(*reserve_ids(self.id_block_size))
+                    if self._pending:
+                        self.replay(write_posts)
+                except (CircuitOpenError, OperationalError, InterfaceError):
+                    pass
+                self.update_gauges()
+                if self._stopped.wait(interval):
+                    return
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        """Stops the replayer and closes the active segment."""
+        self._stopped.set()
+        with self._sync_lock, self._lock:
+            self._file.close()
+
+    def _write(self, record: dict) -> None:
+        """Writes a record to the active segment without syncing it. The
+        caller must hold the lock.
+
+        :param record: The record.
+        """
+        payload = json.dumps(record).encode("utf-8")
+        self._file.write(b"%08x %s\n" % (zlib.crc32(payload), payload))
+        self._written += 1
+
+    def _sync(self, seq: int) -> None:
+        """Waits until the seq-th record written by this process is durable.
+
+        :param seq: The number of records that must be durable.
+        """
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                self._file.flush()
+                target = self._written
+                size = self._file.tell()
+            # Other threads append while this one waits for the disk; the
+            # next sync makes all of their records durable at once.
+            os.fsync(self._file.fileno())
+            JOURNAL_FSYNCS.inc()
+            self._synced = target
+            if size >= self.segment_bytes:
+                self._rotate()
+
+    def _rotate(self) -> None:
+        """Starts a new segment. The caller must hold the sync lock."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._segment += 1
+            # pylint: disable=consider-using-with
+            self._file = open(self._segment_path(self._segment), "ab")
+            if self._next_id is not None:
+                # Carry the id block over, since old segments are deleted.
+                self._write({RECORD_IDS: [self._next_id, self._last_id]})
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+
+    def _recover(self) -> tuple[int, object]:
+        """Restores the journal's state from its files.
+
+        :return: A 2-tuple of the active segment's index and its file,
+            opened for appending.
+        """
+        segments = self._segments() or [0]
+        checkpoint = self._read_checkpoint()
+        for segment in segments:
+            if segment < checkpoint[0]:
+                continue
+            start = checkpoint[1] if segment == checkpoint[0] else 0
+            for _, record in self._read_records(segment, start):
+                if RECORD_POST in record:
+                    self._pending.append(record[RECORD_POST]["journaled_at"])
+        active = segments[-1]
+        good_end = 0
+        for good_end, record in self._read_records(active, 0):
+            if RECORD_IDS in record:
+                self._next_id, self._last_id = record[RECORD_IDS]
+            else:
+                self._next_id = record[RECORD_POST]["id"] - 1
+        # pylint: disable=consider-using-with
+        segment_file = open(self._segment_path(active), "ab")
+        # Discard a torn record left by a crash mid-append.
+        segment_file.truncate(good_end)
+        return active, segment_file
+
+    def _segments(self) -> list[int]:
+        """Returns the indices of the segments on disk.
+
+        :return: The indices, in ascending order.
+        """
+        return sorted(
+            int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(_SEGMENT_PREFIX) and
+            name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, segment: int) -> str:
+        """Returns the path of a segment.
+
+        :param segment: The segment's index.
+        :return: The path of the segment.
+        """
+        return os.path.join(
+            self.directory,
+            f"{_SEGMENT_PREFIX}{segment:010d}{_SEGMENT_SUFFIX}"
+        )
+
+    def _read_records(
+            self,
+            segment: int,
+            offset: int
+    ) -> Iterator[tuple[int, dict]]:
+        """Reads the complete, intact records of a segment.
+
+        :param segment: The segment's index.
+        :param offset: The byte offset at which to start reading.
+        :return: An iterator of (offset after the record, record) tuples; it
+            stops at the first torn or corrupt record.
+        """
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as infile:
+            infile.seek(offset)
+            for line in infile:
+                if not line.endswith(b"\n"):
+                    return
+                checksum, _, payload = line[:-1].partition(b" ")
+                if checksum != b"%08x" % zlib.crc32(payload):
+                    return
+                offset += len(line)
+                yield offset, json.loads(payload)
+
+    def _read_batch(
+            self,
+            position: tuple[int, int],
+            batch_size: int
+    ) -> tuple[list[Post], tuple[int, int]]:
+        """Reads the next posts to replay.
+
+        :param position: The (segment, offset) at which to start reading.
+        :param batch_size: The maximum number of posts to read.
+        :return: A 2-tuple of the posts and the position after them.
+        """
+        posts = []
+        segment, offset = position
+        while True:
+            for offset, record in self._read_records(segment, offset):
+                if RECORD_POST in record:
+                    fields = record[RECORD_POST]
+                    posts.append(Post(
+                        id=fields["id"],
+                        text=fields["text"],
+                        author=fields["author"],
+                        created_at=datetime.fromisoformat(
+                            fields["created_at"]
+                        )
+                    ))
+                    if len(posts) == batch_size:
+                        return posts, (segment, offset)
+            with self._lock:
+                if segment >= self._segment:
+                    return posts, (segment, offset)
+            segment, offset = segment + 1, 0
+
+    def _read_checkpoint(self) -> tuple[int, int]:
+        """Returns the replay position.
+
+        :return: The (segment, offset) of the first record not yet replayed.
+        """
+        path = os.path.join(self.directory, _CHECKPOINT_FILENAME)
+        if not os.path.exists(path):
+            segments = self._segments()
+            return (segments[0] if segments else 0), 0
+        with open(path, "r", encoding="utf-8") as infile:
+            segment, offset = json.load(infile)
+        return segment, offset
+
+    def _write_checkpoint(self, position: tuple[int, int]) -> None:
+        """Durably saves the replay position.
+
+        :param position: The (segment, offset) of the first record not yet
+            replayed.
+        """
+        path = os.path.join(self.directory, _CHECKPOINT_FILENAME)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as outfile:
+            json.dump(list(position), outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _delete_segments_before(self, segment: int) -> None:
+        """Deletes the segments that have been replayed.
+
+        :param segment: The index of the segment being replayed.
+        """
+        for old_segment in self._segments():
+            if old_segment < segment:
+                os.remove(self._segment_path(old_segment))
+
+
+@contextmanager
+def journal_scope() -> Iterator[None]:
+    """Journals each post created in the enclosed block at most once.
+
+    Enclose a request's retry loop, and call start_attempt before each
+    attempt.
+    """
+    token = _journal_scope.set(_JournalScope())
+    try:
+        yield
+    finally:
+        _journal_scope.reset(token)
+
+
+def start_attempt() -> None:
+    """Restarts the current journal scope's idempotency keys for a new
+    attempt at its request, so that the attempt's creates get the same keys
+    as the previous attempt's.
+    """
+    scope = _journal_scope.get()
+    if scope is not None:
+        scope.next_key = 0
+
+
+def create_post_durably(post: Post) -> Post:
+    """Adds a post to the database, or to the journal if it is unavailable.
+
+    :param post: The post to add; see db_ops.create_post.
+    :return: The input post, with its id set. If the database circuit breaker
+        is not closed and the journal is enabled, the post is journaled and
+        will be written to the database when the journal is replayed. If the
+        journal has no reserved ids, the database is tried anyway. If an
+        earlier attempt at the request journaled the post, it is not added
+        again, and has the journaled post's id; see journal_scope.
+    """
+    scope = _journal_scope.get()
+    key = None
+    if scope is not None:
+        key = scope.next_key
+        scope.next_key += 1
+        if key in scope.journaled:
+            post.id = scope.journaled[key]
+            return post
+    if write_journal is None or database_breaker.state == CLOSED:
+        return create_post(post)
+    try:
+        write_journal.append(post)
+    except JournalUnavailable:
+        return create_post(post)
+    if scope is not None:
+        scope.journaled[key] = post.id
+    return post
+
+
+def create_write_journal(config: dict) -> WriteJournal | None:
+    """Opens the write journal described by the app config and replays it.
+
+    :param config: The app config; see app_data.py.
+    :return: The write journal, or None if no journal directory is
+        configured.
+    """
+    if not config["JOURNAL_DIR"]:
+        return None
+    directory, lock_file = _claim_journal_directory(config["JOURNAL_DIR"])
+    journal = WriteJournal(
+        directory,
+        segment_bytes=config["JOURNAL_SEGMENT_BYTES"],
+        id_block_size=config["JOURNAL_ID_BLOCK_SIZE"]
+    )
+    # Held until the process exits.
+    journal.lock_file = lock_file
+    journal.start_replayer(create_journaled_posts, reserve_journal_ids)
+    return journal
+
+
+def _claim_journal_directory(root: str) -> tuple[str, object]:
+    """Locks a journal directory for this worker.
+
+    Each worker needs its own journal. Workers claim the numbered directories
+    under root in order, so a restarted worker takes over, and replays, the
+    journal of a worker that exited.
+
+    :param root: The directory that holds the workers' journals.
+    :return: A 2-tuple of the claimed directory and its lock file, which
+        holds the lock until it is closed.
+    """
+    os.makedirs(root, exist_ok=True)
+    for slot in itertools.count():
+        directory = os.path.join(root, f"worker-{slot}")
+        os.makedirs(directory, exist_ok=True)
+        # pylint: disable=consider-using-with
+        lock_file = open(os.path.join(directory, "lock"), "ab")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        return directory, lock_file
+    raise RuntimeError("unreachable")
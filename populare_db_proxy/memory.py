@@ -0,0 +1,152 @@
+"""Contains memory accounting for the admin memory endpoints.
+
+A worker's RSS alone does not say what holds its memory. On request, a worker
+starts tracemalloc and takes a baseline snapshot; later reports list the
+source lines whose allocations grew the most since the baseline. Reports also
+count live ORM instances, e.g., of Post, and give the size of each internal
+cache, so that cache limits can be weighed against pod memory limits.
+
+Modules register their caches with register_cache. Each worker traces and
+reports only its own memory; reports include the worker's pid.
+"""
+
+from __future__ import annotations
+import gc
+import os
+import resource
+import threading
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+MEMORY_TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 1
+# Allocations made by tracemalloc itself and by imports are not of interest.
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+)
+_caches: dict[str, Callable[[], int]] = {}
+_baseline = None  # pylint: disable=invalid-name
+_lock = threading.Lock()
+
+
+def register_cache(name: str, size: Callable[[], int]) -> None:
+    """Registers a cache whose size memory reports include.
+
+    :param name: The cache's name in reports.
+    :param size: A function that returns the number of entries in the cache.
+    """
+    _caches[name] = size
+
+
+def cache_sizes() -> dict[str, int]:
+    """Returns the number of entries in each registered cache.
+
+    :return: A mapping from cache name to number of entries.
+    """
+    return {name: size() for name, size in sorted(_caches.items())}
+
+
+def start_tracing(frames: int = TRACEMALLOC_FRAMES) -> None:
+    """Starts tracing allocations, if not already, and takes a baseline.
+
+    Tracing slows allocation down and costs memory of its own, so it should
+    be stopped when no longer needed.
+
+    :param frames: The number of stack frames to record per allocation.
+    """
+    global _baseline  # pylint: disable=global-statement
+    with _lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        _baseline = _take_snapshot()
+
+
+def stop_tracing() -> None:
+    """Stops tracing allocations and discards the baseline."""
+    global _baseline  # pylint: disable=global-statement
+    with _lock:
+        tracemalloc.stop()
+        _baseline = None
+
+
+def allocation_diffs(
+        limit: int = MEMORY_TOP_ALLOCATIONS
+) -> list[dict[str, Any]]:
+    """Returns the source lines whose allocations grew most since baseline.
+
+    :param limit: The maximum number of lines to return.
+    :return: The lines, largest growth first, with their allocated sizes and
+        allocation counts now and relative to the baseline; empty if
+        allocations are not being traced.
+    """
+    with _lock:
+        if _baseline is None or not tracemalloc.is_tracing():
+            return []
+        snapshot = _take_snapshot()
+        diffs = snapshot.compare_to(_baseline, "lineno")
+    return [
+        {
+            "location": f"{diff.traceback[0].filename}:"
+                        f"{diff.traceback[0].lineno}",
+            "size_bytes": diff.size,
+            "size_diff_bytes": diff.size_diff,
+            "count": diff.count,
+            "count_diff": diff.count_diff
+        }
+        for diff in diffs[:limit]
+    ]
+
+
+def live_instances(types: dict[str, type]) -> dict[str, int]:
+    """Returns the number of live instances of each type in this worker.
+
+    Walks every object the garbage collector tracks, so it is slow.
+
+    :param types: The types, by name.
+    :return: A mapping from type name to number of instances.
+    """
+    counts = dict.fromkeys(types, 0)
+    for obj in gc.get_objects():
+        for name, cls in types.items():
+            if isinstance(obj, cls):
+                counts[name] += 1
+    return counts
+
+
+def memory_report(
+        live_types: dict[str, type],
+        limit: int = MEMORY_TOP_ALLOCATIONS
+) -> dict[str, Any]:
+    """Returns this worker's memory report.
+
+    :param live_types: The types whose live instances to count, by name,
+        e.g., ORM models.
+    :param limit: The maximum number of allocation diffs to include.
+    :return: The report.
+    """
+    tracing = tracemalloc.is_tracing()
+    traced, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "pid": os.getpid(),
+        # ru_maxrss is in KiB on Linux.
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        * 1024,
+        "tracing": tracing,
+        "traced_bytes": traced,
+        "traced_peak_bytes": peak,
+        "top_allocation_diffs": allocation_diffs(limit),
+        "live_objects": live_instances(live_types),
+        "caches": cache_sizes()
+    }
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    """Returns a snapshot of traced allocations, without uninteresting ones.
+
+    :return: The snapshot.
+    """
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
@@ -0,0 +1,81 @@
+"""Contains Prometheus metrics aggregation across gunicorn workers.
+
+Each gunicorn worker is a separate process with its own metrics, so a scrape
+of one worker's /metrics endpoint under-reports the pod and jumps between
+workers. If the PROMETHEUS_MULTIPROC_DIR environment variable names a
+directory when gunicorn starts, prometheus_client instead writes every
+worker's metrics to files in that directory, and the gunicorn master serves
+the merged metrics of all workers on a dedicated port; see gunicorn.conf.py.
+The variable must be set before prometheus_client is imported, i.e., in the
+environment that launches gunicorn, because prometheus_client decides where
+to keep values at import time.
+
+Counters and histograms are summed over all workers, including ones that have
+exited. Gauges declare how worker values are merged with their
+multiprocess_mode, e.g., "livesum" for in-flight requests; when a worker
+exits, its values for live gauges are removed. Gauges computed on collection
+with set_function are not written to the files, so they must be set
+explicitly to be exported in this mode.
+"""
+
+from __future__ import annotations
+import glob
+import os
+from prometheus_client import CollectorRegistry, start_http_server
+from prometheus_client.multiprocess import MultiProcessCollector, \
+    mark_process_dead
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+METRICS_PORT = 9200
+
+
+def multiprocess_enabled() -> bool:
+    """Returns whether metrics are aggregated across worker processes.
+
+    :return: Whether the PROMETHEUS_MULTIPROC_DIR environment variable is set.
+    """
+    return bool(os.environ.get(MULTIPROC_DIR_ENV))
+
+
+def reset_metrics_directory(directory: str) -> None:
+    """Creates the metrics directory and removes metrics of earlier runs.
+
+    Counters of workers from an earlier run would otherwise be added to the
+    new run's. This must run before any worker starts.
+
+    :param directory: The directory in which workers write their metrics.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for filename in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(filename)
+
+
+def build_registry(directory: str | None = None) -> CollectorRegistry:
+    """Returns a registry that merges the metrics of all workers.
+
+    :param directory: The directory in which workers write their metrics;
+        defaults to PROMETHEUS_MULTIPROC_DIR.
+    :return: The registry.
+    """
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=directory)
+    return registry
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = "0.0.0.0") -> None:
+    """Serves the merged metrics of all workers in a background thread.
+
+    :param port: The port on which to serve the metrics.
+    :param host: The address on which to listen.
+    """
+    start_http_server(port, host, registry=build_registry())
+
+
+def mark_worker_dead(pid: int, directory: str | None = None) -> None:
+    """Removes an exited worker's values for live gauges.
+
+    :param pid: The worker's process id.
+    :param directory: The directory in which workers write their metrics;
+        defaults to PROMETHEUS_MULTIPROC_DIR.
+    """
+    mark_process_dead(pid, path=directory)
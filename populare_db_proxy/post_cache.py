@@ -0,0 +1,101 @@
+"""Contains the cache of serialized posts.
+
+Serializing a post builds a dict, formats its timestamp, and encodes it as
+JSON; a page of the feed does this for every post on every request, although
+posts rarely change. Instead, each post's serialization is cached under its
+id along with the post's version, which every update increments, and its
+created_at. A cached payload is only served if both match the post just read
+from the database, so an update made by any worker invalidates every
+worker's copy. Ids alone do not identify a post: SQLite reuses the ids of
+deleted and archived posts, and every new post starts at version 1, so
+another worker's payload for a deleted post could otherwise be served for
+the new post that reused its id.
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from prometheus_client import Counter
+from populare_db_proxy.db_schema import Post, PostRow
+from populare_db_proxy.memory import register_cache
+
+POST_CACHE_SIZE = 100000
+POST_CACHE_LOOKUPS = Counter(
+    "populare_post_cache_lookups_total",
+    "Number of serialized post cache lookups",
+    ["result"]
+)
+
+
+class PostPayloadCache:
+    """Caches the JSON serialization of posts by id, version, and
+    created_at."""
+
+    def __init__(self, size: int = POST_CACHE_SIZE) -> None:
+        """Instantiates the object.
+
+        :param size: The maximum number of posts; the least recently used
+            posts are evicted beyond this.
+        """
+        self.size = size
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = POST_CACHE_LOOKUPS.labels(result="hit")
+        self._misses = POST_CACHE_LOOKUPS.labels(result="miss")
+
+    def serialize(self, post: Post | PostRow) -> str:
+        """Returns the JSON serialization of a post, from cache if possible.
+
+        :param post: The post, as read from the database.
+        :return: The JSON serialization of the post, i.e., str(post).
+        """
+        if post.id is None or post.version is None:
+            return str(post)
+        stamp = (post.version, post.created_at)
+        with self._lock:
+            cached = self._payloads.get(post.id)
+            if cached is not None and cached[0] == stamp:
+                self._payloads.move_to_end(post.id)
+                self._hits.inc()
+                return cached[1]
+        payload = str(post)
+        self._misses.inc()
+        with self._lock:
+            self._payloads[post.id] = (stamp, payload)
+            self._payloads.move_to_end(post.id)
+            if len(self._payloads) > self.size:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def discard(self, post_id: int) -> None:
+        """Removes a post, e.g., because it was deleted.
+
+        :param post_id: The id of the post.
+        """
+        with self._lock:
+            self._payloads.pop(post_id, None)
+
+    def clear(self) -> None:
+        """Removes every post."""
+        with self._lock:
+            self._payloads.clear()
+
+    def __len__(self) -> int:
+        """Returns the number of cached posts.
+
+        :return: The number of cached posts.
+        """
+        return len(self._payloads)
+
+
+post_payloads = PostPayloadCache()
+register_cache("post_payloads", post_payloads.__len__)
+
+
+def serialize_post(post: Post | PostRow) -> str:
+    """Returns the JSON serialization of a post, from cache if possible.
+
+    :param post: The post, as read from the database.
+    :return: The JSON serialization of the post, i.e., str(post).
+    """
+    return post_payloads.serialize(post)
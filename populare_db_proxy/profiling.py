@@ -0,0 +1,418 @@
+"""Contains on-demand profiling of individual requests.
+
+Aggregate metrics show that a request shape is slow, but not where its time
+goes. A request is profiled if its X-Profile-Token header matches the
+configured token, or at random at the configured sample rate. A profiled
+request runs under cProfile, and its wall time is broken down into exclusive
+phases:
+
+* parse and validate: of the GraphQL document.
+* resolve: resolvers and db_ops, excluding the phases below.
+* sql: statement execution, timed by engine events.
+* serialize: post payloads and response encoding.
+* other: the rest, e.g., admission control and Flask.
+
+Each profile is written as a JSON file to a directory that keeps only the
+newest ones, so all workers share one bounded ring on disk. The admin
+endpoints list and fetch profiles given the token, and profiled responses
+carry the profile's id in the X-Profile-Id header.
+"""
+
+from __future__ import annotations
+import cProfile
+import glob
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from functools import partial
+from typing import Any, TypeVar
+from flask import Response
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.ast import Document
+from graphql.type.schema import GraphQLSchema
+from graphql.validation import validate
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, ExceptionContext
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_RING_SIZE = 100
+# Number of functions, by cumulative time, kept from each cProfile trace.
+PROFILE_TOP_FUNCTIONS = 40
+# Number of characters of the request body kept with each profile.
+PROFILE_BODY_CHARS = 2000
+PARSE = "parse"
+VALIDATE = "validate"
+RESOLVE = "resolve"
+SQL = "sql"
+SERIALIZE = "serialize"
+OTHER = "other"
+PROFILED_REQUESTS = Counter(
+    "populare_profiled_requests_total",
+    "Number of profiled requests, by what triggered profiling",
+    ["trigger"]
+)
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9]{20}-[0-9]+$")
+_NO_PHASE = nullcontext()
+_T = TypeVar("_T")
+
+
+class _Phases:
+    """Accumulates the exclusive time spent in each phase of a request."""
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self.totals = defaultdict(float)
+        # Entries are [name, start time, time spent in nested phases].
+        self._stack = []
+
+    def enter(self, name: str) -> None:
+        """Starts timing a phase, pausing the enclosing one.
+
+        :param name: The phase.
+        """
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self, name: str) -> None:
+        """Stops timing a phase, resuming the enclosing one.
+
+        :param name: The phase, which must be the innermost one; otherwise,
+            nothing is done.
+        """
+        if not self._stack or self._stack[-1][0] != name:
+            return
+        _, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.totals[name] += elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+
+_phases: ContextVar[_Phases | None] = ContextVar("phases", default=None)
+
+
+class Profiler:
+    """Profiles requests and keeps the newest profiles on disk."""
+
+    def __init__(
+            self,
+            directory: str,
+            ring_size: int = PROFILE_RING_SIZE,
+            token: str | None = None,
+            sample_rate: float = 0.0
+    ) -> None:
+        """Instantiates the object.
+
+        :param directory: The directory in which to keep profiles; it is
+            created if it does not exist.
+        :param ring_size: The maximum number of profiles to keep.
+        :param token: The secret that requests send in the X-Profile-Token
+            header to be profiled, and that the admin endpoints require; if
+            None, requests are only sampled and profiles cannot be fetched.
+        :param sample_rate: The fraction of requests to profile at random.
+        """
+        self.directory = directory
+        self.ring_size = ring_size
+        self.token = token
+        self.sample_rate = sample_rate
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, token: str | None) -> bool:
+        """Returns whether a request carries the profile token.
+
+        :param token: The value of the request's X-Profile-Token header.
+        :return: Whether the token matches.
+        """
+        return token_matches(token, self.token)
+
+    def trigger(self, token: str | None) -> str | None:
+        """Returns why a request should be profiled, if it should.
+
+        :param token: The value of the request's X-Profile-Token header.
+        :return: "header" if the request asked to be profiled, "sample" if it
+            was sampled, or None if it should not be profiled.
+        """
+        if self.authorized(token):
+            return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def run(
+            self,
+            function: Callable[[], Response],
+            trigger: str,
+            details: dict[str, Any]
+    ) -> Response:
+        """Profiles a request and stores its profile.
+
+        :param function: The function that serves the request.
+        :param trigger: Why the request is profiled; see trigger.
+        :param details: Details of the request to store with the profile,
+            e.g., its path.
+        :return: The response, with the X-Profile-Id header set.
+        """
+        phases = _Phases()
+        token = _phases.set(phases)
+        profile = cProfile.Profile()
+        started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            response = profile.runcall(function)
+        finally:
+            _phases.reset(token)
+        duration = time.perf_counter() - start
+        totals = dict(phases.totals)
+        totals[OTHER] = max(0.0, duration - sum(totals.values()))
+        stats = io.StringIO()
+        pstats.Stats(profile, stream=stats).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(PROFILE_TOP_FUNCTIONS)
+        profile_id = self._write({
+            **details,
+            "trigger": trigger,
+            "status": response.status_code,
+            "started_at": started_at.isoformat(),
+            "duration_ms": duration * 1000,
+            "phases_ms": {
+                name: seconds * 1000 for name, seconds in totals.items()
+            },
+            "stats": stats.getvalue()
+        })
+        PROFILED_REQUESTS.labels(trigger=trigger).inc()
+        response.headers[PROFILE_ID_HEADER] = profile_id
+        return response
+
+    def list_profiles(self) -> list[dict[str, Any]]:
+        """Returns summaries of the stored profiles, newest first.
+
+        :return: The profiles, without their cProfile traces.
+        """
+        summaries = []
+        for profile_id in reversed(self._profile_ids()):
+            profile = self.get_profile(profile_id)
+            if profile is not None:
+                profile.pop("stats")
+                summaries.append(profile)
+        return summaries
+
+    def get_profile(self, profile_id: str) -> dict[str, Any] | None:
+        """Returns a stored profile.
+
+        :param profile_id: The profile's id.
+        :return: The profile; None if it does not exist or has been evicted.
+        """
+        if not _PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(
+                    os.path.join(self.directory, f"{profile_id}.json"),
+                    "r",
+                    encoding="utf-8"
+            ) as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, profile: dict[str, Any]) -> str:
+        """Stores a profile, evicting the oldest beyond the ring size.
+
+        :param profile: The profile.
+        :return: The profile's id, which sorts by time of writing.
+        """
+        profile_id = f"{time.time_ns():020d}-{os.getpid()}"
+        profile["id"] = profile_id
+        filename = os.path.join(self.directory, f"{profile_id}.json")
+        with open(f"{filename}.tmp", "w", encoding="utf-8") as outfile:
+            json.dump(profile, outfile)
+        os.replace(f"{filename}.tmp", filename)
+        profile_ids = self._profile_ids()
+        for evicted in profile_ids[:max(0, len(profile_ids) - self.ring_size)]:
+            try:
+                os.remove(os.path.join(self.directory, f"{evicted}.json"))
+            except FileNotFoundError:
+                # Another worker evicted it first.
+                pass
+        return profile_id
+
+    def _profile_ids(self) -> list[str]:
+        """Returns the ids of the stored profiles, oldest first.
+
+        :return: The ids of the stored profiles.
+        """
+        return sorted(
+            os.path.basename(filename)[:-len(".json")]
+            for filename in glob.glob(os.path.join(self.directory, "*.json"))
+        )
+
+
+class ProfiledBackend(GraphQLCoreBackend):
+    """Executes GraphQL documents with the parse, validate, and resolve
+    phases timed separately."""
+    # pylint: disable=too-few-public-methods
+
+    def document_from_string(
+            self,
+            schema: GraphQLSchema,
+            document_string: str | Document
+    ) -> GraphQLDocument:
+        """Parses a document.
+
+        :param schema: The schema.
+        :param document_string: The document.
+        :return: The parsed document.
+        """
+        with profile_phase(PARSE):
+            document = super().document_from_string(schema, document_string)
+        document.execute = partial(
+            _execute_and_validate,
+            schema,
+            document.document_ast,
+            **self.execute_params
+        )
+        return document
+
+
+def _execute_and_validate(
+        schema: GraphQLSchema,
+        document_ast: Document,
+        *args: Any,
+        **kwargs: Any
+) -> ExecutionResult:
+    """Validates and executes a document, as graphql-core does.
+
+    :param schema: The schema.
+    :param document_ast: The parsed document.
+    :param args: The execution arguments.
+    :param kwargs: The execution keyword arguments.
+    :return: The execution result.
+    """
+    if kwargs.get("validate", True):
+        with profile_phase(VALIDATE):
+            errors = validate(schema, document_ast)
+        if errors:
+            return ExecutionResult(errors=errors, invalid=True)
+    with profile_phase(RESOLVE):
+        return execute(schema, document_ast, *args, **kwargs)
+
+
+def token_matches(token: str | None, expected: str | None) -> bool:
+    """Returns whether a request's token matches a configured secret.
+
+    :param token: The token the request carries, if any.
+    :param expected: The secret, if configured.
+    :return: Whether both are set and equal; compared in constant time.
+    """
+    return bool(token and expected) and hmac.compare_digest(
+        token.encode("utf-8"),
+        expected.encode("utf-8")
+    )
+
+
+def profiling_active() -> bool:
+    """Returns whether the current request is being profiled.
+
+    :return: Whether the current request is being profiled.
+    """
+    return _phases.get() is not None
+
+
+def profile_phase(name: str) -> AbstractContextManager:
+    """Returns a context manager that times the enclosed block as a phase.
+
+    :param name: The phase.
+    :return: The context manager; it does nothing unless the current request
+        is being profiled.
+    """
+    phases = _phases.get()
+    return _NO_PHASE if phases is None else _timed_phase(phases, name)
+
+
+def detach_phases() -> None:
+    """Stops timing phases in the current context.
+
+    Phases are timed on the request's thread. A copy of the request's context
+    that runs work on another thread calls this first, so that its statements
+    do not interleave with the request's phases; the request times its wait
+    for the work instead.
+    """
+    _phases.set(None)
+
+
+@contextmanager
+def _timed_phase(phases: _Phases, name: str) -> Iterator[None]:
+    """Times the enclosed block as a phase.
+
+    :param phases: The current request's phases.
+    :param name: The phase.
+    """
+    phases.enter(name)
+    try:
+        yield
+    finally:
+        phases.exit(name)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(*args: Any) -> None:
+    """Starts timing a statement in a profiled request.
+
+    :param args: The event arguments.
+    """
+    # pylint: disable=unused-argument
+    phases = _phases.get()
+    if phases is not None:
+        phases.enter(SQL)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(*args: Any) -> None:
+    """Stops timing a statement in a profiled request.
+
+    :param args: The event arguments.
+    """
+    # pylint: disable=unused-argument
+    phases = _phases.get()
+    if phases is not None:
+        phases.exit(SQL)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context: ExceptionContext) -> None:
+    """Stops timing a failed statement in a profiled request.
+
+    :param context: The exception context.
+    """
+    # pylint: disable=unused-argument
+    phases = _phases.get()
+    if phases is not None:
+        phases.exit(SQL)
+
+
+def create_profiler(config: dict) -> Profiler | None:
+    """Returns the profiler described by the app config.
+
+    :param config: The app config; see app_data.py.
+    :return: The profiler, or None if no profile directory is configured.
+    """
+    if not config["PROFILE_DIR"]:
+        return None
+    return Profiler(
+        config["PROFILE_DIR"],
+        ring_size=config["PROFILE_RING_SIZE"],
+        token=config["PROFILE_TOKEN"],
+        sample_rate=config["PROFILE_SAMPLE_RATE"]
+    )
@@ -1,10 +1,275 @@
 """Contains the proxy server."""
 
-from flask import Flask
+from __future__ import annotations
+import json
+import os
+from collections.abc import Callable
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any
+from flask import Flask, Response, request, stream_with_context, url_for
 from flask_graphql import GraphQLView
+from flask_graphql.graphqlview import HttpQueryError
+from graphql.backend.core import GraphQLCoreBackend
 from populare_db_proxy.graphql_schema import get_schema
 from populare_db_proxy.app_data import app
-from populare_db_proxy.db_ops import init_db_schema
+from populare_db_proxy.db_ops import init_db_schema, sync_recent_posts, \
+    read_posts, read_posts_by_ids, update_post_fields, delete_post, \
+    READ_POSTS_LIMIT
+from populare_db_proxy.db_schema import Post, PostRow
+from populare_db_proxy.post_cache import serialize_post
+from populare_db_proxy.sessions import request_session
+from populare_db_proxy.feed import FeedFull, SocketRelay, feed_broker, \
+    stream_events
+from populare_db_proxy.admission import Overloaded, \
+    create_admission_limiter
+from populare_db_proxy.circuit import reset_stale, served_stale
+from populare_db_proxy.deadline import DeadlineExceeded, \
+    TransientDatabaseError, deadline_exceeded, deadline_scope, \
+    parse_timeout_header, retry_transient, transient_error_seen
+from populare_db_proxy import journal
+from populare_db_proxy.journal import create_post_durably
+from populare_db_proxy.encoding import JSON_MIMETYPE, binary_mimetypes, \
+    decode_binary, encode_binary, encode_json, negotiate_mimetype
+from populare_db_proxy.profiling import PROFILE_BODY_CHARS, \
+    PROFILE_HEADER, SERIALIZE, ProfiledBackend, create_profiler, \
+    profile_phase, profiling_active, token_matches
+from populare_db_proxy.memory import MEMORY_TOP_ALLOCATIONS, \
+    TRACEMALLOC_FRAMES, memory_report, register_cache, start_tracing, \
+    stop_tracing
+from populare_db_proxy.rate_limit import READ, WRITE, classify_operations, \
+    create_rate_limiter, get_client_identity, retry_after_header
+
+# The fields that REST requests may supply for a post.
+_POST_FIELDS = ("text", "author", "created_at")
+# Set by create_app; None if rate limiting is disabled.
+rate_limiter = None  # pylint: disable=invalid-name
+# Set by create_app; None if admission control is disabled.
+admission_limiter = None  # pylint: disable=invalid-name
+# Set by create_app; None if profiling is disabled.
+profiler = None  # pylint: disable=invalid-name
+
+
+class ProxyGraphQLView(GraphQLView):
+    """Serves GraphQL requests with one database session per HTTP request.
+
+    Clients may send a JSON array of operations in a single request; the
+    operations are executed in order and share the request's session, so each
+    HTTP request costs at most one connection checkout and one commit.
+    """
+
+    def encode(self, data: Any, pretty: bool = False) -> str | bytes:
+        """Encodes a GraphQL result in the request's response format.
+
+        The format is negotiated by _execute; see encoding.py. Encoding is
+        timed as the serialize phase.
+
+        :param data: The result.
+        :param pretty: Whether to indent JSON output; binary formats have no
+            indentation.
+        :return: The encoding of the result.
+        """
+        mimetype = getattr(request, "response_mimetype", JSON_MIMETYPE)
+        with profile_phase(SERIALIZE):
+            if mimetype == JSON_MIMETYPE:
+                return encode_json(data, pretty)
+            return encode_binary(data, mimetype)
+
+    def dispatch_request(self) -> Response:
+        """Executes the request's GraphQL operations in a request session.
+
+        Clients over their rate limit are rejected before any database work;
+        the rest of the request is run by run_database_request, and profiled
+        if it asks to be or is sampled; see profiling.py. Responses that
+        include stale feed pages are marked as such; see circuit.py.
+
+        :return: The response.
+        """
+        throttled = self._check_rate_limit()
+        if throttled is not None:
+            return throttled
+        return _run_profiled(self._execute)
+
+    def get_backend(self) -> GraphQLCoreBackend | None:
+        """Returns the GraphQL backend for the request.
+
+        :return: A backend that times each phase if the request is being
+            profiled; otherwise, the default backend.
+        """
+        return ProfiledBackend() if profiling_active() \
+            else super().get_backend()
+
+    def _execute(self) -> Response:
+        """Executes the request's GraphQL operations.
+
+        The response is encoded in the format negotiated from the request's
+        Accept header; see encoding.py.
+
+        :return: The response.
+        """
+        mimetype = negotiate_mimetype(request.accept_mimetypes)
+        request.response_mimetype = mimetype
+        if mimetype != JSON_MIMETYPE:
+            request.native_payloads = True
+        response = super().dispatch_request()
+        if response.mimetype == JSON_MIMETYPE and mimetype != JSON_MIMETYPE:
+            response.mimetype = mimetype
+        if served_stale() and response.mimetype in \
+                [JSON_MIMETYPE] + binary_mimetypes():
+            _add_stale_extension(response)
+        return response
+
+    def _check_rate_limit(self) -> Response | None:
+        """Charges the client for the request's operations.
+
+        :return: A 429 response if the client is over its rate limit;
+            otherwise, None.
+        """
+        if rate_limiter is None:
+            return None
+        try:
+            data = self.parse_body()
+        except HttpQueryError:
+            # Malformed bodies are rejected later, but still cost a read.
+            data = {}
+        if not data:
+            data = {"query": request.args.get("query", "")}
+        operations = data if isinstance(data, list) else [data]
+        documents = [
+            operation.get("query") or "" if isinstance(operation, dict)
+            else "" for operation in operations
+        ]
+        return _charge_client(classify_operations(documents))
+
+
+def run_database_request(work: Callable[[], Response]) -> Response:
+    """Runs a request's database work and returns its response.
+
+    The work is admitted by the admission limiter, if enabled, and shed with
+    503 if the database is overloaded. It runs in one request session under
+    the request's deadline, and is retried in a fresh session after transient
+    errors while the deadline allows; see deadline.py. Posts journaled by one
+    attempt are not journaled again by the next; see journal.py.
+
+    :param work: The function that does the request's database work and
+        returns its response; it is called once per attempt.
+    :return: The response, or an error response if the work was shed, ran out
+        of time, or kept failing.
+    """
+    timeout = parse_timeout_header(
+        request.headers.get(app.config["REQUEST_TIMEOUT_HEADER"]),
+        app.config["REQUEST_TIMEOUT_SECONDS"]
+    )
+    try:
+        with deadline_scope(timeout), journal.journal_scope():
+            return retry_transient(
+                lambda: _run_once(work),
+                attempts=app.config["REQUEST_RETRY_ATTEMPTS"]
+            )
+    except Overloaded as exc:
+        return _error_response(
+            f"Service overloaded: {exc.reason}",
+            503,
+            "1"
+        )
+    except DeadlineExceeded:
+        return _error_response("Request deadline exceeded", 504, "1")
+    except TransientDatabaseError:
+        return _error_response("Database temporarily unavailable", 503, "1")
+
+
+def _run_once(work: Callable[[], Response]) -> Response:
+    """Runs one attempt at a request's database work in one transaction.
+
+    GraphQL reports errors in the response, so the transaction is rolled back
+    here if any operation was cancelled by the deadline or hit a transient
+    error.
+
+    :param work: See run_database_request.
+    :return: The response.
+    """
+    reset_stale()
+    journal.start_attempt()
+    admission = admission_limiter.admit() \
+        if admission_limiter is not None else nullcontext()
+    with admission, request_session():
+        response = work()
+        if deadline_exceeded():
+            raise DeadlineExceeded("Request deadline exceeded")
+        if transient_error_seen():
+            raise TransientDatabaseError("Transient database error")
+    return response
+
+
+def _charge_client(counts: dict[str, int]) -> Response | None:
+    """Charges the client for a request's operations.
+
+    Write budgets are charged first, so that a rejected write does not also
+    spend the client's read budget.
+
+    :param counts: A mapping from READ and WRITE to the number of operations
+        of that kind in the request.
+    :return: A 429 response if the client is over its rate limit; otherwise,
+        None.
+    """
+    if rate_limiter is None:
+        return None
+    identity = get_client_identity(
+        request,
+        app.config["RATE_LIMIT_IDENTITY_HEADER"]
+    )
+    for kind in (WRITE, READ):
+        if not counts[kind]:
+            continue
+        retry_after = rate_limiter.take(identity, kind, counts[kind])
+        if retry_after:
+            return _error_response(
+                f"Too many {kind} requests",
+                429,
+                retry_after_header(retry_after)
+            )
+    return None
+
+
+def _add_stale_extension(response: Response) -> None:
+    """Marks each result in a GraphQL response as containing stale data.
+
+    Clients find {"stale": true} in the result's extensions.
+
+    :param response: The response, JSON or binary, which is modified in
+        place.
+    """
+    if response.mimetype == JSON_MIMETYPE:
+        content = json.loads(response.get_data(as_text=True))
+    else:
+        content = decode_binary(response.get_data(), response.mimetype)
+    for result in content if isinstance(content, list) else [content]:
+        result.setdefault("extensions", {})["stale"] = True
+    if response.mimetype == JSON_MIMETYPE:
+        response.set_data(json.dumps(content))
+    else:
+        response.set_data(encode_binary(content, response.mimetype))
+
+
+def _error_response(
+        message: str,
+        status: int,
+        retry_after: str | None = None
+) -> Response:
+    """Returns a GraphQL-style error response.
+
+    :param message: The error message.
+    :param status: The HTTP status code.
+    :param retry_after: If supplied, the value of the Retry-After header,
+        which asks the client to retry.
+    :return: The response.
+    """
+    return Response(
+        json.dumps({"errors": [{"message": message}]}),
+        status=status,
+        mimetype="application/json",
+        headers={"Retry-After": retry_after} if retry_after else None
+    )
 
 
 @app.route("/health")
@@ -16,16 +281,442 @@ def health() -> str:
     return "ok"
 
 
+@app.route("/feed/stream")
+def feed_stream() -> Response:
+    """Streams live post changes to the client as Server-Sent Events.
+
+    curl -N http://localhost:5000/feed/stream
+
+    Clients that reconnect with a Last-Event-ID header receive the events
+    they missed, if they are still in the broker's history. Each stream holds
+    a worker thread, so a worker with its maximum number of streams rejects
+    more with 503; see feed.py.
+
+    :return: The event stream, or 503 if the worker has too many streams.
+    """
+    last_event_id = request.headers.get("Last-Event-ID")
+    try:
+        subscription = feed_broker.subscribe(
+            int(last_event_id) if last_event_id and last_event_id.isdigit()
+            else None
+        )
+    except FeedFull as exc:
+        return _error_response(f"Live feed unavailable: {exc}", 503, "1")
+    response = Response(
+        stream_with_context(stream_events(feed_broker, subscription)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # A client that disconnects before the stream starts never runs the
+    # stream's cleanup, which would hold its place in the broker.
+    response.call_on_close(lambda: feed_broker.unsubscribe(subscription))
+    return response
+
+
+@app.route("/posts", methods=["GET"])
+def list_posts() -> Response:
+    """Returns a page of the feed, most recent first.
+
+    curl 'http://localhost:5000/posts?limit=10&before=2022-01-01T00:00:00'
+
+    The REST endpoints call db_ops directly, without parsing, validating, and
+    resolving a GraphQL document, and respond with cacheable JSON; see
+    _cacheable_response. The query parameters are as in readPosts.
+
+    :return: The response, a JSON array of posts.
+    """
+    try:
+        limit = int(request.args.get("limit", READ_POSTS_LIMIT))
+        before = _parse_datetime(request.args.get("before"))
+    except ValueError:
+        return _error_response("Invalid limit or before", 400)
+    if limit < 1:
+        return _error_response("Invalid limit or before", 400)
+    return _serve_rest(READ, lambda: _cacheable_response(
+        _encode_posts(read_posts(limit=limit, before=before))
+    ))
+
+
+@app.route("/posts/<int(signed=True):post_id>", methods=["GET"])
+def get_post(post_id: int) -> Response:
+    """Returns a post.
+
+    curl http://localhost:5000/posts/1
+
+    :param post_id: The id of the post.
+    :return: The response, the post; 404 if it does not exist.
+    """
+
+    def work() -> Response:
+        """Reads the post."""
+        post = read_posts_by_ids([post_id]).get(post_id)
+        if post is None:
+            return _error_response("Post not found", 404)
+        return _cacheable_response(serialize_post(post))
+
+    return _serve_rest(READ, work)
+
+
+@app.route("/posts", methods=["POST"])
+def post_post() -> Response:
+    """Creates a post.
+
+    curl -d '{"text": "my text", "author": "my author", "created_at":
+    "2006-01-02T15:04:05"}' -H "Content-Type: application/json"
+    http://localhost:5000/posts
+
+    :return: The response, the created post with 201 and its Location; 400 if
+        the body is not a post.
+    """
+    fields = _parse_post_fields(required=True)
+    if fields is None:
+        return _error_response("Invalid post", 400)
+
+    def work() -> Response:
+        """Creates the post."""
+        post = create_post_durably(Post(**fields))
+        return _uncacheable_response(
+            str(post),
+            201,
+            {"Location": url_for("get_post", post_id=post.id)}
+        )
+
+    return _serve_rest(WRITE, work)
+
+
+@app.route("/posts/<int(signed=True):post_id>", methods=["PATCH"])
+def patch_post(post_id: int) -> Response:
+    """Updates the supplied fields of a post.
+
+    curl -X PATCH -d '{"text": "new text"}' -H "Content-Type:
+    application/json" http://localhost:5000/posts/1
+
+    :param post_id: The id of the post.
+    :return: The response, the updated post; 404 if it does not exist, or 400
+        if the body is not a partial post.
+    """
+    fields = _parse_post_fields(required=False)
+    if fields is None:
+        return _error_response("Invalid post", 400)
+
+    def work() -> Response:
+        """Updates the post."""
+        post = update_post_fields(post_id, **fields)
+        if post is None:
+            return _error_response("Post not found", 404)
+        return _uncacheable_response(str(post))
+
+    return _serve_rest(WRITE, work)
+
+
+@app.route("/posts/<int(signed=True):post_id>", methods=["DELETE"])
+def remove_post(post_id: int) -> Response:
+    """Deletes a post; deleting a post that does not exist succeeds.
+
+    curl -X DELETE http://localhost:5000/posts/1
+
+    :param post_id: The id of the post.
+    :return: The response, 204.
+    """
+
+    def work() -> Response:
+        """Deletes the post."""
+        delete_post(post_id)
+        return _uncacheable_response("", 204)
+
+    return _serve_rest(WRITE, work)
+
+
+def _serve_rest(kind: str, work: Callable[[], Response]) -> Response:
+    """Charges the client for one operation and runs a REST request.
+
+    :param kind: READ or WRITE.
+    :param work: See run_database_request.
+    :return: The response.
+    """
+    throttled = _charge_client({READ: 0, WRITE: 0, kind: 1})
+    if throttled is not None:
+        return throttled
+    return _run_profiled(work)
+
+
+def _run_profiled(work: Callable[[], Response]) -> Response:
+    """Runs a request, profiling it if it asks to be or is sampled.
+
+    :param work: See run_database_request.
+    :return: The response.
+    """
+    trigger = profiler.trigger(request.headers.get(PROFILE_HEADER)) \
+        if profiler is not None else None
+    if trigger is None:
+        return run_database_request(work)
+    return profiler.run(
+        lambda: run_database_request(work),
+        trigger,
+        {
+            "method": request.method,
+            "path": request.full_path,
+            "body": request.get_data(as_text=True)[:PROFILE_BODY_CHARS]
+        }
+    )
+
+
+def _encode_posts(posts: list[PostRow]) -> str:
+    """Returns the JSON array of a page of posts.
+
+    Each post's serialization comes from the post payload cache, so a page is
+    encoded by joining cached strings; see post_cache.py.
+
+    :param posts: The posts.
+    :return: The JSON array of the posts.
+    """
+    with profile_phase(SERIALIZE):
+        return f"[{','.join(serialize_post(post) for post in posts)}]"
+
+
+def _cacheable_response(body: str) -> Response:
+    """Returns a JSON response that clients and proxies may cache briefly.
+
+    The response carries an ETag, so clients can revalidate with
+    If-None-Match and get 304 without the body. Stale feed pages (see
+    circuit.py) must be revalidated and carry a Warning header.
+
+    :param body: The JSON body.
+    :return: The response.
+    """
+    response = Response(body, mimetype="application/json")
+    if served_stale():
+        response.cache_control.no_cache = True
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    else:
+        response.cache_control.max_age = app.config["REST_MAX_AGE_SECONDS"]
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _uncacheable_response(
+        body: str,
+        status: int = 200,
+        headers: dict[str, str] | None = None
+) -> Response:
+    """Returns the JSON response to a write, which must not be cached.
+
+    :param body: The JSON body.
+    :param status: The HTTP status code.
+    :param headers: Any additional headers.
+    :return: The response.
+    """
+    response = Response(
+        body,
+        status=status,
+        mimetype="application/json",
+        headers=headers
+    )
+    response.cache_control.no_store = True
+    return response
+
+
+def _parse_post_fields(required: bool) -> dict[str, Any] | None:
+    """Returns the post fields in a REST request's JSON body.
+
+    :param required: Whether every field must be supplied, as for a new post.
+    :return: The supplied fields, keyed by Post attribute; None if the body is
+        not a JSON object of post fields.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not set(body) <= set(_POST_FIELDS) or (
+            required and set(body) != set(_POST_FIELDS)
+    ):
+        return None
+    if not all(isinstance(value, str) for value in body.values()):
+        return None
+    try:
+        created_at = _parse_datetime(body.get("created_at"))
+    except ValueError:
+        return None
+    if created_at is not None:
+        body["created_at"] = created_at
+    return body
+
+
+def _parse_datetime(value: str | None) -> datetime | None:
+    """Returns the datetime in an ISO string, if any.
+
+    :param value: The ISO string, if any.
+    :return: The datetime; None if value is empty.
+    :raises ValueError: If value is not an ISO datetime.
+    """
+    return datetime.fromisoformat(value) if value else None
+
+
+@app.route("/admin/profiles")
+def list_profiles() -> Response:
+    """Returns summaries of the stored request profiles, newest first.
+
+    curl -H "X-Profile-Token: $TOKEN" http://localhost:5000/admin/profiles
+
+    :return: The response; 404 if profiling is disabled, or 403 without the
+        profile token.
+    """
+    denied = _check_profile_token()
+    if denied is not None:
+        return denied
+    return Response(
+        json.dumps(profiler.list_profiles()),
+        mimetype="application/json"
+    )
+
+
+@app.route("/admin/profiles/<profile_id>")
+def get_profile(profile_id: str) -> Response:
+    """Returns a stored request profile, including its cProfile trace.
+
+    curl -H "X-Profile-Token: $TOKEN"
+    http://localhost:5000/admin/profiles/<profile_id>
+
+    :param profile_id: The id from the profiled response's X-Profile-Id
+        header.
+    :return: The response; 404 if profiling is disabled or the profile has
+        been evicted, or 403 without the profile token.
+    """
+    denied = _check_profile_token()
+    if denied is not None:
+        return denied
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        return _error_response("Profile not found", 404)
+    return Response(json.dumps(profile), mimetype="application/json")
+
+
+@app.route("/admin/memory")
+def get_memory_report() -> Response:
+    """Returns the memory report of the worker that serves the request.
+
+    curl -H "X-Profile-Token: $TOKEN"
+    'http://localhost:5000/admin/memory?limit=10'
+
+    Counting live objects walks the whole heap, so this should not be polled
+    frequently.
+
+    :return: The response; 404 if there is no profile token configured, or 403
+        without it.
+    """
+    denied = _check_admin_token()
+    if denied is not None:
+        return denied
+    limit = request.args.get("limit", MEMORY_TOP_ALLOCATIONS, type=int)
+    return Response(
+        json.dumps(memory_report({"Post": Post}, limit=max(0, limit))),
+        mimetype="application/json"
+    )
+
+
+@app.route("/admin/memory/tracing", methods=["POST"])
+def start_memory_tracing() -> Response:
+    """Starts tracing allocations in the worker that serves the request.
+
+    Later reports from the same worker list the allocations that grew since
+    this request. Requesting again resets the baseline.
+
+    curl -X POST -H "X-Profile-Token: $TOKEN"
+    http://localhost:5000/admin/memory/tracing?frames=1
+
+    :return: The response, with the worker's pid; 404 if there is no profile
+        token configured, or 403 without it.
+    """
+    denied = _check_admin_token()
+    if denied is not None:
+        return denied
+    frames = request.args.get("frames", TRACEMALLOC_FRAMES, type=int)
+    start_tracing(max(1, frames))
+    return Response(
+        json.dumps({"pid": os.getpid(), "tracing": True}),
+        mimetype="application/json"
+    )
+
+
+@app.route("/admin/memory/tracing", methods=["DELETE"])
+def stop_memory_tracing() -> Response:
+    """Stops tracing allocations in the worker that serves the request.
+
+    curl -X DELETE -H "X-Profile-Token: $TOKEN"
+    http://localhost:5000/admin/memory/tracing
+
+    :return: The response, with the worker's pid; 404 if there is no profile
+        token configured, or 403 without it.
+    """
+    denied = _check_admin_token()
+    if denied is not None:
+        return denied
+    stop_tracing()
+    return Response(
+        json.dumps({"pid": os.getpid(), "tracing": False}),
+        mimetype="application/json"
+    )
+
+
+def _check_admin_token() -> Response | None:
+    """Checks that an admin request carries the profile token.
+
+    Unlike _check_profile_token, this does not require profiling to be
+    enabled.
+
+    :return: An error response if no profile token is configured or the
+        request's token is missing or wrong; otherwise, None.
+    """
+    if not app.config["PROFILE_TOKEN"]:
+        return _error_response("Admin endpoints are disabled", 404)
+    if not token_matches(
+            request.headers.get(PROFILE_HEADER),
+            app.config["PROFILE_TOKEN"]
+    ):
+        return _error_response("Invalid profile token", 403)
+    return None
+
+
+def _check_profile_token() -> Response | None:
+    """Checks that an admin request carries the profile token.
+
+    :return: An error response if profiling is disabled or the token is
+        missing or wrong; otherwise, None.
+    """
+    if profiler is None or not profiler.token:
+        return _error_response("Profiling is disabled", 404)
+    if not profiler.authorized(request.headers.get(PROFILE_HEADER)):
+        return _error_response("Invalid profile token", 403)
+    return None
+
+
 def create_app() -> Flask:
     """Adds endpoints to the Flask app and returns it.
 
     :return: The Flask app.
     """
+    # pylint: disable=global-statement
+    global rate_limiter, admission_limiter, profiler
     init_db_schema()
-    app.add_url_rule("/graphql", view_func=GraphQLView.as_view(
+    sync_recent_posts()
+    if rate_limiter is None:
+        rate_limiter = create_rate_limiter(app.config)
+        if rate_limiter is not None:
+            register_cache("rate_limit_clients", rate_limiter.__len__)
+    if admission_limiter is None:
+        admission_limiter = create_admission_limiter(app.config)
+    if profiler is None:
+        profiler = create_profiler(app.config)
+    if journal.write_journal is None:
+        journal.write_journal = journal.create_write_journal(app.config)
+    feed_broker.max_subscriptions = app.config["FEED_MAX_SUBSCRIPTIONS"]
+    if app.config["FEED_RELAY_DIR"] and feed_broker.relay is None:
+        feed_broker.relay = SocketRelay(
+            feed_broker,
+            app.config["FEED_RELAY_DIR"]
+        )
+    app.add_url_rule("/graphql", view_func=ProxyGraphQLView.as_view(
         "graphql",
         schema=get_schema(),
         graphiql=True,
+        batch=True,
     ))
     return app
 
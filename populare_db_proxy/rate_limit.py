@@ -0,0 +1,324 @@
+"""Contains per-client token bucket rate limiting for the proxy.
+
+Each client gets one token bucket for reads and one for writes. A request
+spends one token per operation; if the bucket does not hold enough tokens, the
+request is rejected with 429 Too Many Requests and a Retry-After header giving
+the time until it would be admitted.
+
+Buckets are kept in process by default, so each gunicorn worker enforces the
+budget independently. To enforce one budget across the workers of a pod, point
+RATE_LIMIT_STORE at a file (ideally on tmpfs, e.g., /dev/shm) and the buckets
+are kept in a shared SQLite database instead.
+"""
+
+from __future__ import annotations
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import Config, Request
+from prometheus_client import Counter
+
+READ = "read"
+WRITE = "write"
+RATE_LIMIT_MAX_CLIENTS = 10000
+SHARED_STORE_TIMEOUT_SECONDS = 1.0
+WRITE_FIELDS = (
+    "initDb",
+    "createPost",
+    "updatePost",
+    "deletePost"
+)
+# A request is charged as a write if any write field appears in the document.
+# Matching text rather than parsing keeps the check cheap; a false positive
+# only charges the stricter budget.
+_WRITE_FIELD_PATTERN = re.compile(r"\b(?:" + "|".join(WRITE_FIELDS) + r")\b")
+THROTTLED_REQUESTS = Counter(
+    "populare_rate_limited_requests_total",
+    "Number of requests rejected by the rate limiter",
+    ["kind"]
+)
+
+
+class TokenBucket:
+    """A token bucket that refills continuously at a fixed rate."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Instantiates the object with a full bucket.
+
+        :param rate: The number of tokens added per second.
+        :param capacity: The maximum number of tokens, i.e., the burst size.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0, now: float | None = None) -> float:
+        """Removes tokens from the bucket if it holds enough.
+
+        :param cost: The number of tokens to remove.
+        :param now: The current monotonic time; defaults to time.monotonic().
+        :return: 0 if the tokens were removed; otherwise, the number of
+            seconds until the bucket will hold enough tokens.
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens, retry_after = _refill_and_take(
+            self.tokens,
+            now - self.updated,
+            self.rate,
+            self.capacity,
+            cost
+        )
+        self.updated = now
+        return retry_after
+
+
+def _refill_and_take(
+        tokens: float,
+        elapsed: float,
+        rate: float,
+        capacity: float,
+        cost: float
+) -> tuple[float, float]:
+    """Refills a bucket for the elapsed time and tries to remove tokens.
+
+    :param tokens: The number of tokens in the bucket at the last update.
+    :param elapsed: The number of seconds since the last update.
+    :param rate: The number of tokens added per second.
+    :param capacity: The maximum number of tokens.
+    :param cost: The number of tokens to remove.
+    :return: A 2-tuple of the new number of tokens and the retry delay, which
+        is 0 if the tokens were removed.
+    """
+    tokens = min(capacity, tokens + max(elapsed, 0.0) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class SharedBucketStore:
+    """Keeps token buckets in a SQLite database shared by worker processes."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, path: str) -> None:
+        """Instantiates the object, creating the database if necessary.
+
+        :param path: The path to the database file.
+        """
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection to the database.
+
+        :return: This thread's connection to the database.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=SHARED_STORE_TIMEOUT_SECONDS,
+                isolation_level=None
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(
+            self,
+            key: str,
+            rate: float,
+            capacity: float,
+            cost: float
+    ) -> float:
+        """Removes tokens from a shared bucket if it holds enough.
+
+        :param key: The bucket's key.
+        :param rate: The number of tokens added per second.
+        :param capacity: The maximum number of tokens.
+        :param cost: The number of tokens to remove.
+        :return: 0 if the tokens were removed; otherwise, the number of
+            seconds until the bucket will hold enough tokens.
+        """
+        # Wall-clock time, since monotonic clocks are not shared between
+        # processes.
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?",
+                (key,)
+            ).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens, retry_after = _refill_and_take(
+                tokens,
+                now - updated,
+                rate,
+                capacity,
+                cost
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    """Enforces separate read and write budgets for each client."""
+
+    def __init__(
+            self,
+            limits: dict[str, tuple[float, float]],
+            store: SharedBucketStore | None = None,
+            max_clients: int = RATE_LIMIT_MAX_CLIENTS
+    ) -> None:
+        """Instantiates the object.
+
+        :param limits: A mapping from READ and WRITE to the (rate, capacity)
+            of each client's bucket of that kind; both must be positive.
+        :param store: If supplied, buckets are kept in this shared store
+            instead of in process.
+        :param max_clients: The maximum number of in-process buckets; the
+            least recently used buckets are evicted beyond this.
+        """
+        for kind, (rate, capacity) in limits.items():
+            if rate <= 0 or capacity <= 0:
+                raise ValueError(
+                    f"Invalid {kind} rate limit: rate and burst must be "
+                    f"positive, got {rate} and {capacity}"
+                )
+        self.limits = limits
+        self.store = store
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, identity: str, kind: str, cost: float = 1.0) -> float:
+        """Charges a client for operations of the given kind.
+
+        :param identity: The client's identity.
+        :param kind: READ or WRITE.
+        :param cost: The number of operations.
+        :return: 0 if the client is within budget; otherwise, the number of
+            seconds after which the client may retry.
+        """
+        rate, capacity = self.limits[kind]
+        # A batch larger than the burst size could otherwise never be
+        # admitted.
+        cost = min(cost, capacity)
+        key = f"{kind}:{identity}"
+        if self.store is not None:
+            retry_after = self.store.take(key, rate, capacity, cost)
+        else:
+            with self._lock:
+                bucket = self._buckets.pop(key, None)
+                if bucket is None:
+                    bucket = TokenBucket(rate, capacity)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+                retry_after = bucket.take(cost)
+        if retry_after:
+            THROTTLED_REQUESTS.labels(kind=kind).inc()
+        return retry_after
+
+    def __len__(self) -> int:
+        """Returns the number of in-process buckets.
+
+        :return: The number of in-process buckets.
+        """
+        return len(self._buckets)
+
+
+def create_rate_limiter(config: Config) -> RateLimiter | None:
+    """Returns a rate limiter configured from the app's configuration.
+
+    :param config: The app's configuration.
+    :return: The rate limiter, or None if rate limiting is disabled.
+    """
+    if not config["RATE_LIMIT_ENABLED"]:
+        return None
+    store = SharedBucketStore(config["RATE_LIMIT_STORE"]) \
+        if config["RATE_LIMIT_STORE"] else None
+    return RateLimiter(
+        {
+            READ: (
+                config["RATE_LIMIT_READS_PER_SECOND"],
+                config["RATE_LIMIT_READ_BURST"]
+            ),
+            WRITE: (
+                config["RATE_LIMIT_WRITES_PER_SECOND"],
+                config["RATE_LIMIT_WRITE_BURST"]
+            )
+        },
+        store=store
+    )
+
+
+def get_client_identity(
+        flask_request: Request,
+        identity_header: str | None = None
+) -> str:
+    """Returns the identity by which a client is rate limited.
+
+    The identity is, in order of preference: the value of identity_header, if
+    configured; the client's API key; or the client's IP address. API keys
+    are hashed so that they are not kept in memory.
+
+    :param flask_request: The request.
+    :param identity_header: The name of a header, set by a trusted upstream
+        proxy, that identifies the client.
+    :return: The client's identity.
+    """
+    if identity_header and identity_header in flask_request.headers:
+        # For X-Forwarded-For, the first address is the original client.
+        value = flask_request.headers[identity_header].split(",")[0]
+        return f"header:{value.strip()}"
+    api_key = flask_request.headers.get("X-API-Key")
+    if api_key:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        return f"key:{digest}"
+    return f"ip:{flask_request.remote_addr}"
+
+
+def classify_operations(documents: list[str]) -> dict[str, int]:
+    """Returns the number of read and write operations in a request.
+
+    :param documents: The GraphQL documents in the request; more than one if
+        the request is a batch.
+    :return: A mapping from READ and WRITE to the number of operations of
+        that kind.
+    """
+    counts = {READ: 0, WRITE: 0}
+    for document in documents:
+        kind = WRITE if _WRITE_FIELD_PATTERN.search(document) else READ
+        counts[kind] += 1
+    return counts
+
+
+def retry_after_header(retry_after: float) -> str:
+    """Returns the value of the Retry-After header for a delay.
+
+    :param retry_after: The delay in seconds.
+    :return: The delay rounded up to whole seconds, as Retry-After requires.
+    """
+    return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,262 @@
+"""Contains the in-memory buffer of the most recent posts.
+
+Almost every feed read asks for the newest page of posts. Each worker keeps
+the most recent posts in memory, sorted by (created_at, id), and answers reads
+whose window lies inside the buffer without querying the database.
+
+The buffer is loaded from the database along with the change log cursor at
+the time of loading. Writes made by this worker are applied as soon as they
+commit; writes made by other workers are applied by reconciling against the
+change log, at most once per reconcile interval. Each write is applied in
+change log order: a local write is remembered until the cursor passes it, so
+that replaying an older change from the log cannot undo it. If the log has
+been pruned past the cursor, the buffer is reloaded.
+
+The buffer holds every post newer than its floor, the oldest post it has ever
+had to evict; a read is answered from memory only if the buffer holds enough
+posts newer than the floor. Like the other aggregates, the buffer does not see
+writes that bypass db_ops.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from datetime import datetime
+from typing import Optional
+from prometheus_client import Counter
+from populare_db_proxy.db_schema import PostRow
+from populare_db_proxy.app_data import app
+from populare_db_proxy.memory import register_cache
+
+RECENT_POSTS_SIZE = 1000
+RECENT_POSTS_RECONCILE_SECONDS = 1.0
+RECONCILE_BATCH_SIZE = 500
+RECENT_POSTS_READS = Counter(
+    "populare_recent_posts_reads_total",
+    "Number of feed reads, by whether the recent posts buffer answered them",
+    ["result"]
+)
+# A change to a post: (change log seq, post id, the post as written or None if
+# it was deleted).
+Change = tuple[int, int, Optional[PostRow]]
+ChangeReader = Callable[[int, int], tuple[list[Change], int, bool]]
+
+
+class RecentPostsBuffer:
+    """Keeps the most recent posts in memory, sorted by (created_at, id)."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+            self,
+            size: int = RECENT_POSTS_SIZE,
+            reconcile_seconds: float = RECENT_POSTS_RECONCILE_SECONDS
+    ) -> None:
+        """Instantiates the object, unloaded.
+
+        :param size: The maximum number of posts; 0 disables the buffer.
+        :param reconcile_seconds: The minimum number of seconds between
+            reconciliations against the change log.
+        """
+        self.size = size
+        self.reconcile_seconds = reconcile_seconds
+        self.loaded = False
+        # Parallel arrays, oldest first.
+        self._keys = []
+        self._rows = []
+        self._keys_by_id = {}
+        # Every post newer than the floor is in the buffer; None if the
+        # buffer holds every post.
+        self._floor = None
+        self._cursor = 0
+        self._local_seqs = {}
+        self._reconciled_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._hits = RECENT_POSTS_READS.labels(result="hit")
+        self._misses = RECENT_POSTS_READS.labels(result="miss")
+
+    def load(self, rows: Iterable[PostRow], cursor: int) -> None:
+        """Replaces the buffer's contents.
+
+        :param rows: The most recent posts, no more than size of them, read
+            after cursor.
+        :param cursor: The seq of the last change committed before the posts
+            were read.
+        """
+        rows = sorted(rows, key=_buffer_key)
+        with self._lock:
+            self._rows = rows
+            self._keys = [_buffer_key(row) for row in rows]
+            self._keys_by_id = {row.id: _buffer_key(row) for row in rows}
+            self._floor = self._keys[0] if len(rows) >= self.size else None
+            self._cursor = cursor
+            self._local_seqs = {
+                post_id: seq for post_id, seq in self._local_seqs.items()
+                if seq > cursor
+            }
+            self._reconciled_at = time.monotonic()
+            self.loaded = True
+
+    def clear(self) -> None:
+        """Empties the buffer and marks it unloaded."""
+        with self._lock:
+            self._rows = []
+            self._keys = []
+            self._keys_by_id = {}
+            self._floor = None
+            self._cursor = 0
+            self._local_seqs = {}
+            self.loaded = False
+
+    def read(
+            self,
+            limit: int,
+            before: datetime | None = None
+    ) -> list[PostRow] | None:
+        """Returns a page of the feed, if the buffer can answer it.
+
+        :param limit: The maximum number of posts to return.
+        :param before: If supplied, return posts created earlier than this
+            date; if None, return the most recent posts created before now.
+        :return: The no more than `limit` most recent posts created before
+            `before`, most recent first; or None if the buffer is not loaded
+            or does not hold the whole window.
+        """
+        before = before if before else datetime.now()
+        with self._lock:
+            end = bisect_left(self._keys, (before,)) if self.loaded else 0
+            if not self.loaded or \
+                    (end < limit and self._floor is not None):
+                self._misses.inc()
+                return None
+            page = self._rows[max(0, end - limit):end]
+        self._hits.inc()
+        page.reverse()
+        return page
+
+    def apply_local(self, changes: Iterable[Change]) -> None:
+        """Applies changes committed by this worker.
+
+        :param changes: The changes, in seq order.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            for seq, post_id, row in changes:
+                if seq > self._cursor:
+                    self._local_seqs[post_id] = seq
+                    self._apply(post_id, row)
+
+    def sync(
+            self,
+            load_rows: Callable[[int], tuple[int, list[PostRow]]],
+            read_changes: ChangeReader
+    ) -> None:
+        """Loads the buffer or reconciles it with the change log, if due.
+
+        Only one thread syncs at a time; other threads keep using the buffer
+        as it is. The buffer is also reloaded if deletes have left it less
+        than half full.
+
+        :param load_rows: A function that, given a number of posts, returns
+            the current change log cursor and then that many of the most
+            recent posts.
+        :param read_changes: A function that, given a cursor and a limit,
+            returns no more than that many changes after the cursor, the
+            cursor to pass next, and whether the log has been pruned past the
+            cursor; see db_ops.read_changes_since.
+        """
+        # pylint: disable=consider-using-with
+        if not self.size or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.loaded or (
+                    self._floor is not None and
+                    len(self._rows) < self.size // 2
+            ):
+                cursor, rows = load_rows(self.size)
+                self.load(rows, cursor)
+                return
+            if time.monotonic() - self._reconciled_at < \
+                    self.reconcile_seconds:
+                return
+            while True:
+                changes, cursor, reset = read_changes(
+                    self._cursor,
+                    RECONCILE_BATCH_SIZE
+                )
+                if reset:
+                    cursor, rows = load_rows(self.size)
+                    self.load(rows, cursor)
+                    return
+                self._apply_logged(changes, cursor)
+                if len(changes) < RECONCILE_BATCH_SIZE:
+                    return
+        finally:
+            self._sync_lock.release()
+
+    def __len__(self) -> int:
+        """Returns the number of buffered posts.
+
+        :return: The number of buffered posts.
+        """
+        return len(self._rows)
+
+    def _apply_logged(self, changes: list[Change], cursor: int) -> None:
+        """Applies changes read from the change log and advances the cursor.
+
+        :param changes: The changes, in seq order.
+        :param cursor: The seq of the last change read.
+        """
+        with self._lock:
+            for seq, post_id, row in changes:
+                if seq >= self._local_seqs.get(post_id, 0):
+                    self._apply(post_id, row)
+            self._cursor = cursor
+            self._local_seqs = {
+                post_id: seq for post_id, seq in self._local_seqs.items()
+                if seq > cursor
+            }
+            self._reconciled_at = time.monotonic()
+
+    def _apply(self, post_id: int, row: PostRow | None) -> None:
+        """Applies one change. The caller must hold the lock.
+
+        :param post_id: The id of the changed post.
+        :param row: The post as written, or None if it was deleted.
+        """
+        old_key = self._keys_by_id.pop(post_id, None)
+        if old_key is not None:
+            index = bisect_left(self._keys, old_key)
+            del self._keys[index]
+            del self._rows[index]
+        if row is None:
+            return
+        key = _buffer_key(row)
+        if self._floor is not None and key <= self._floor:
+            return
+        index = bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._rows.insert(index, row)
+        self._keys_by_id[post_id] = key
+        if len(self._rows) > self.size:
+            self._floor = self._keys.pop(0)
+            del self._keys_by_id[self._rows.pop(0).id]
+
+
+def _buffer_key(post: PostRow) -> tuple[datetime, int]:
+    """Returns the sort key of a post in the buffer.
+
+    :param post: The post.
+    :return: The post's (created_at, id).
+    """
+    return post.created_at, post.id
+
+
+recent_posts = RecentPostsBuffer(
+    app.config["RECENT_POSTS_SIZE"],
+    app.config["RECENT_POSTS_RECONCILE_SECONDS"]
+)
+register_cache("recent_posts", recent_posts.__len__)
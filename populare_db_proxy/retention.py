@@ -0,0 +1,273 @@
+"""Contains the retention job, which purges posts older than a window.
+
+A single DELETE of every expired post can lock the posts table for minutes, so
+the job instead deletes in small chunks ordered by id, each in its own short
+transaction, optionally sleeping between chunks to leave headroom for the
+foreground workload. After every chunk the job writes a checkpoint, so that an
+interrupted run resumes where it left off rather than rescanning from the
+beginning.
+
+The job also prunes the post change log, which has its own, usually much
+shorter, retention window.
+
+Run as a standalone job, e.g., from a Kubernetes CronJob:
+
+python -m populare_db_proxy.retention --retention-days 365
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from prometheus_client import Counter, Gauge
+from sqlalchemy import Table, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import delete_expired_posts, prune_post_changes
+from populare_db_proxy.archive import archived_tables
+from populare_db_proxy.sharding import (
+    shard_bind_keys,
+    shard_engines,
+    SHARD_POSTS_TABLE
+)
+from populare_db_proxy.app_data import db
+
+PURGE_CHUNK_SIZE = 500
+PURGE_SLEEP_SECONDS = 0.1
+PURGE_CHECKPOINT_PATH = "/tmp/populare-db-proxy/retention-checkpoint.json"
+CHANGE_LOG_RETENTION_DAYS = 7
+PURGED_POSTS = Counter(
+    "populare_retention_purged_posts_total",
+    "Number of posts deleted by the retention job"
+)
+PURGE_CHUNKS = Counter(
+    "populare_retention_chunks_total",
+    "Number of chunks processed by the retention job"
+)
+PURGE_LAST_CHUNK_SECONDS = Gauge(
+    "populare_retention_last_chunk_seconds",
+    "Duration of the retention job's most recent delete transaction",
+    multiprocess_mode="mostrecent"
+)
+
+
+@dataclass
+class PurgeProgress:
+    """Reports the progress of a retention job run.
+
+    :ivar cutoff: Posts created earlier than this datetime are purged.
+    :ivar table_name: The table currently being purged; a shard's posts
+        table is named after the shard, e.g., shard1.posts.
+    :ivar last_id: The largest post id examined in the current table.
+    :ivar num_chunks: The number of chunks processed in this run.
+    :ivar num_deleted: The number of posts deleted in this run.
+    :ivar done: Whether every table has been purged.
+    """
+
+    cutoff: datetime
+    table_name: str
+    last_id: int = 0
+    num_chunks: int = 0
+    num_deleted: int = 0
+    done: bool = False
+
+
+def _load_checkpoint(
+        checkpoint_path: str,
+        cutoff: datetime
+) -> PurgeProgress | None:
+    """Returns the progress saved by an interrupted run with the same cutoff.
+
+    :param checkpoint_path: The path to the checkpoint file.
+    :param cutoff: The cutoff of the current run.
+    :return: The saved progress, or None if there is no checkpoint or it was
+        written for a different cutoff.
+    """
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as infile:
+            checkpoint = json.load(infile)
+    except FileNotFoundError:
+        return None
+    if checkpoint["cutoff"] != cutoff.isoformat():
+        return None
+    return PurgeProgress(
+        cutoff=cutoff,
+        table_name=checkpoint["table_name"],
+        last_id=checkpoint["last_id"]
+    )
+
+
+def _save_checkpoint(checkpoint_path: str, progress: PurgeProgress) -> None:
+    """Atomically writes the job's progress to the checkpoint file.
+
+    :param checkpoint_path: The path to the checkpoint file.
+    :param progress: The progress to save.
+    """
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        json.dump({
+            "cutoff": progress.cutoff.isoformat(),
+            "table_name": progress.table_name,
+            "last_id": progress.last_id
+        }, outfile)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _next_chunk(
+        engine: Engine,
+        table: Table,
+        cutoff: datetime,
+        last_id: int,
+        chunk_size: int
+) -> list[int]:
+    """Returns the ids of the next chunk of expired posts in a table.
+
+    :param engine: The engine of the database that holds the table.
+    :param table: A shard's posts table or an archive partition.
+    :param cutoff: Posts created earlier than this datetime are expired.
+    :param last_id: Only ids greater than this are returned.
+    :param chunk_size: The maximum number of ids to return.
+    :return: The ids of the next chunk of expired posts, in ascending order.
+    """
+    with engine.begin() as connection:
+        return list(connection.execute(
+            select(table.c.id)
+                .where(table.c.id > last_id)
+                .where(table.c.created_at < cutoff)
+                .order_by(table.c.id)
+                .limit(chunk_size)
+        ).scalars())
+
+
+def _purged_tables() -> list[tuple[str, int, Table]]:
+    """Returns every table that holds posts, in the order they are purged.
+
+    :return: The posts table of every shard, then the archive partitions,
+        newest first; each with the name under which the checkpoint records
+        it and the index of the shard that holds it.
+    """
+    tables = [(Post.__tablename__, 0, Post.__table__)]
+    tables.extend(
+        (f"{key}.{Post.__tablename__}", shard, SHARD_POSTS_TABLE)
+        for shard, key in enumerate(shard_bind_keys(), start=1)
+    )
+    with Session(db.engine) as session:
+        with session.begin():
+            tables.extend(
+                (table.name, 0, table)
+                for table in archived_tables(session)
+            )
+    return tables
+
+
+def purge_expired_posts(
+        cutoff: datetime,
+        chunk_size: int = PURGE_CHUNK_SIZE,
+        sleep_seconds: float = PURGE_SLEEP_SECONDS,
+        max_chunks: int | None = None,
+        checkpoint_path: str = PURGE_CHECKPOINT_PATH
+) -> PurgeProgress:
+    """Deletes every post created before cutoff, a chunk at a time.
+
+    The hot posts table of every shard is purged first, then each archive
+    partition. Each chunk is deleted only from the table it was read from,
+    and only the posts in it that are still expired; post counts, activity
+    rollups, and the change log are updated from the posts actually deleted.
+
+    :param cutoff: Posts created earlier than this datetime are purged.
+    :param chunk_size: The maximum number of posts to delete per transaction.
+    :param sleep_seconds: The time to sleep between chunks.
+    :param max_chunks: If supplied, stop after this many chunks; a later run
+        with the same cutoff resumes from the checkpoint.
+    :param checkpoint_path: The path to the checkpoint file. The file is
+        removed once every table has been purged.
+    :return: The progress of this run.
+    """
+    # pylint: disable=too-many-arguments
+    tables = _purged_tables()
+    table_names = [name for name, _, _ in tables]
+    progress = _load_checkpoint(checkpoint_path, cutoff)
+    if progress is None or progress.table_name not in table_names:
+        progress = PurgeProgress(cutoff=cutoff, table_name=table_names[0])
+    engines = shard_engines()
+    for name, shard, table in tables[
+            table_names.index(progress.table_name):
+    ]:
+        if name != progress.table_name:
+            progress.table_name = name
+            progress.last_id = 0
+        while max_chunks is None or progress.num_chunks < max_chunks:
+            ids = _next_chunk(
+                engines[shard],
+                table,
+                cutoff,
+                progress.last_id,
+                chunk_size
+            )
+            if not ids:
+                break
+            start = time.perf_counter()
+            num_deleted = delete_expired_posts(table, shard, ids, cutoff)
+            PURGE_LAST_CHUNK_SECONDS.set(time.perf_counter() - start)
+            PURGED_POSTS.inc(num_deleted)
+            PURGE_CHUNKS.inc()
+            progress.last_id = ids[-1]
+            progress.num_chunks += 1
+            progress.num_deleted += num_deleted
+            _save_checkpoint(checkpoint_path, progress)
+            time.sleep(sleep_seconds)
+        else:
+            # The chunk budget ran out before the table was fully purged.
+            return progress
+    progress.done = True
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return progress
+
+
+def main() -> None:
+    """Runs the retention job."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--retention-days", type=int, required=True)
+    parser.add_argument("--chunk-size", type=int, default=PURGE_CHUNK_SIZE)
+    parser.add_argument(
+        "--sleep-seconds",
+        type=float,
+        default=PURGE_SLEEP_SECONDS
+    )
+    parser.add_argument("--max-chunks", type=int, default=None)
+    parser.add_argument("--checkpoint-path", default=PURGE_CHECKPOINT_PATH)
+    parser.add_argument(
+        "--change-log-retention-days",
+        type=int,
+        default=CHANGE_LOG_RETENTION_DAYS
+    )
+    args = parser.parse_args()
+    # Truncate to the day so that a resumed run computes the same cutoff.
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    progress = purge_expired_posts(
+        today - timedelta(days=args.retention_days),
+        chunk_size=args.chunk_size,
+        sleep_seconds=args.sleep_seconds,
+        max_chunks=args.max_chunks,
+        checkpoint_path=args.checkpoint_path
+    )
+    num_changes_pruned = prune_post_changes(
+        today - timedelta(days=args.change_log_retention_days)
+    )
+    print(json.dumps({
+        "cutoff": progress.cutoff.isoformat(),
+        "num_chunks": progress.num_chunks,
+        "num_deleted": progress.num_deleted,
+        "done": progress.done,
+        "num_changes_pruned": num_changes_pruned
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Contains the database session scoping used by db_ops.
+
+By default, every db_ops operation opens its own session, checks out its own
+connection, and commits its own transaction. Inside request_session(), every
+operation instead shares one session, connection, and transaction, which is
+committed when the block exits; each operation runs in a SAVEPOINT so that an
+operation that fails is rolled back without affecting the others. The proxy
+scopes a request session to each HTTP request, so a page view that sends
+several GraphQL operations costs one pool checkout and one commit.
+
+Side effects that must only happen once a write is durable, such as notifying
+live feed subscribers, are scheduled with after_commit(). By then the write
+cannot be undone, so a callback that fails is logged and counted rather than
+raised, and the remaining callbacks still run.
+"""
+
+from __future__ import annotations
+import logging
+from collections.abc import Iterator, Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter
+from sqlalchemy.orm import Session
+from populare_db_proxy.app_data import db
+
+AFTER_COMMIT_ERRORS = Counter(
+    "populare_after_commit_errors_total",
+    "Number of after_commit callbacks that raised an error"
+)
+_logger = logging.getLogger(__name__)
+
+_request_session: ContextVar[Session | None] = ContextVar(
+    "request_session",
+    default=None
+)
+_pending_callbacks: ContextVar[list[Callable[[], None]] | None] = ContextVar(
+    "pending_callbacks",
+    default=None
+)
+
+
+def get_request_session() -> Session | None:
+    """Returns the session scoped to the current request, if any.
+
+    :return: The session scoped to the current request, or None if there is
+        no active request session.
+    """
+    return _request_session.get()
+
+
+@contextmanager
+def request_session() -> Iterator[Session]:
+    """Scopes one session and transaction to the enclosed block.
+
+    The session connects lazily, so a request that does not touch the
+    database does not check out a connection. If the block raises an error,
+    the transaction is rolled back; otherwise, it is committed. If a request
+    session is already active, it is reused.
+
+    :return: The request session.
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+    callbacks = []
+    with Session(db.engine, expire_on_commit=False) as session:
+        token = _request_session.set(session)
+        callbacks_token = _pending_callbacks.set(callbacks)
+        try:
+            with session.begin():
+                yield session
+        finally:
+            _pending_callbacks.reset(callbacks_token)
+            _request_session.reset(token)
+    _run_callbacks(callbacks)
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """Returns a session in which to run one db_ops operation atomically.
+
+    Outside of a request session, the operation gets its own session and
+    transaction. Inside a request session, the operation runs in a SAVEPOINT
+    in the shared transaction.
+
+    :return: The session in which to run the operation.
+    """
+    session = _request_session.get()
+    outer_callbacks = _pending_callbacks.get()
+    callbacks = []
+    callbacks_token = _pending_callbacks.set(callbacks)
+    try:
+        if session is None:
+            with Session(db.engine, expire_on_commit=False) as session:
+                with session.begin():
+                    yield session
+        else:
+            with session.begin_nested():
+                yield session
+    finally:
+        _pending_callbacks.reset(callbacks_token)
+    # Only reached if the operation succeeded.
+    if outer_callbacks is None:
+        _run_callbacks(callbacks)
+    else:
+        outer_callbacks.extend(callbacks)
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """Schedules a callback to run once the current operation is committed.
+
+    If the operation (or, inside a request session, the request's
+    transaction) is rolled back, the callback is discarded. Outside of any
+    operation, the callback runs immediately.
+
+    :param callback: The function to call after commit.
+    """
+    callbacks = _pending_callbacks.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+def _run_callbacks(callbacks: list[Callable[[], None]]) -> None:
+    """Runs the callbacks scheduled by a committed transaction, in order.
+
+    :param callbacks: The callbacks to run. Errors that they raise are
+        logged, not raised, and do not stop the callbacks that follow.
+    """
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:  # pylint: disable=broad-exception-caught
+            AFTER_COMMIT_ERRORS.inc()
+            _logger.exception("after_commit callback failed")
@@ -0,0 +1,259 @@
+"""Contains the horizontal sharding of the posts table.
+
+A single database eventually cannot absorb the write rate of the feed, so the
+posts table can be split across several databases (shards). The database URI
+secret then lists one URI per line: the first is the primary, which holds
+shard 0 of the posts table and every other table (counters, aggregates, the
+change log, and the archive partitions); each further URI holds one more shard
+of the posts table only. The shards are registered as Flask-SQLAlchemy binds
+named shard1, shard2, and so on. With a single URI, the posts table is not
+sharded and nothing in this module changes db_ops' behavior.
+
+Post ids are the shard key: while sharded, ids are allocated from a counter on
+the primary rather than by each shard's autoincrement, and a post lives on
+shard id % N. Sequential ids spread writes evenly across shards, and every
+write by id touches exactly one shard. Reads of the feed query every shard in
+parallel and k-way merge the per-shard pages, which are each already sorted.
+Posts written before sharding was enabled are all on the primary, so enabling
+it for an existing database requires moving them to their shards once, with
+db_ops.migrate_posts_to_shards, before the sharded proxy serves traffic.
+
+Writes to a shard share the caller's session, so they commit or roll back with
+the aggregate and change log writes on the primary. The commit is not atomic
+across databases: a crash between the per-database commits can leave the
+aggregates out of step with the posts, which reconcile_post_counts repairs.
+Archiving and retention walk the posts table of every shard; the archive
+partitions are on the primary.
+
+Sharding spreads the storage and index maintenance of posts, not the
+serialization of writes. Every write, on whichever shard, also updates rows on
+the primary that all writers share and holds their locks until commit: the
+post id counter (creates), the change log sequence counter, which keeps seq
+order equal to commit order, and the total and per-author post counts.
+Concurrent writes therefore commit one at a time on the primary, and write
+throughput is bounded by the primary's commit rate however many shards there
+are; batching posts into one create_posts call is the way to write more. See
+benchmarks/sharded_writes.py, which measures the throughput reached with each
+number of shards.
+
+The authors table is also on the primary only, so the shards' posts tables do
+not declare the foreign key from author_id; authors are created on the primary
+before their posts are inserted into a shard.
+"""
+
+from __future__ import annotations
+import heapq
+import itertools
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextvars import Context, copy_context
+from datetime import datetime
+from typing import TypeVar
+from sqlalchemy import MetaData, Table
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from populare_db_proxy.db_schema import Post, PostRow
+from populare_db_proxy.deadline import DeadlineExceeded, cancel, remaining
+from populare_db_proxy.profiling import SQL, detach_phases, profile_phase
+from populare_db_proxy.app_data import db
+
+SHARD_BIND_PREFIX = "shard"
+SCATTER_MAX_WORKERS = 16
+_T = TypeVar("_T")
+_scatter_pool = ThreadPoolExecutor(
+    max_workers=SCATTER_MAX_WORKERS,
+    thread_name_prefix="shard-scatter"
+)
+
+
+def _without_foreign_keys(table: Table) -> Table:
+    """Returns a copy of a table that declares no foreign keys.
+
+    :param table: The table.
+    :return: The copy, in its own metadata.
+    """
+    copy = table.to_metadata(MetaData())
+    for constraint in list(copy.foreign_key_constraints):
+        copy.constraints.remove(constraint)
+    return copy
+
+
+# The posts table as created on the shards other than the primary.
+SHARD_POSTS_TABLE = _without_foreign_keys(Post.__table__)
+
+
+def shard_bind_keys() -> list[str]:
+    """Returns the Flask-SQLAlchemy bind keys of the non-primary shards.
+
+    :return: The bind keys, in shard order (shard1 first).
+    """
+    binds = db.get_app().config.get("SQLALCHEMY_BINDS") or {}
+    keys = [
+        key for key in binds
+        if key.startswith(SHARD_BIND_PREFIX) and
+        key[len(SHARD_BIND_PREFIX):].isdigit()
+    ]
+    return sorted(keys, key=lambda key: int(key[len(SHARD_BIND_PREFIX):]))
+
+
+def num_shards() -> int:
+    """Returns the number of shards of the posts table.
+
+    :return: The number of shards; 1 if the posts table is not sharded.
+    """
+    return 1 + len(shard_bind_keys())
+
+
+def is_sharded() -> bool:
+    """Returns whether the posts table is split across several databases.
+
+    :return: Whether the posts table is sharded.
+    """
+    return num_shards() > 1
+
+
+def shard_engines() -> list[Engine]:
+    """Returns the engines of every shard.
+
+    :return: The engines, indexed by shard; index 0 is the primary.
+    """
+    return [db.engine] + [
+        db.get_engine(bind=key) for key in shard_bind_keys()
+    ]
+
+
+def shard_for(post_id: int) -> int:
+    """Returns the shard on which a post lives.
+
+    :param post_id: The id of the post.
+    :return: The index of the post's shard.
+    """
+    return post_id % num_shards()
+
+
+def group_by_shard(
+        items: Iterable[_T],
+        key: Callable[[_T], int] = lambda item: item
+) -> dict[int, list[_T]]:
+    """Groups items by the shard of their post id.
+
+    :param items: The items, e.g., post ids or posts.
+    :param key: A function that returns an item's post id.
+    :return: A mapping from shard index to the items on that shard, in input
+        order. Shards with no items are omitted.
+    """
+    shards = num_shards()
+    groups = defaultdict(list)
+    for item in items:
+        groups[key(item) % shards].append(item)
+    return dict(groups)
+
+
+def shard_connection(session: Session, shard: int) -> Connection:
+    """Returns a shard's connection in the session's transaction.
+
+    :param session: The session in which the operation is taking place.
+    :param shard: The index of the shard.
+    :return: The connection, which commits or rolls back with the session.
+    """
+    if shard == 0:
+        return session.connection()
+    engine = db.get_engine(bind=shard_bind_keys()[shard - 1])
+    return session.connection(bind_arguments={"bind": engine})
+
+
+def _call_on_engine(
+        engine: Engine,
+        function: Callable[[Connection], _T]
+) -> _T:
+    """Calls function with a new connection to an engine.
+
+    :param engine: The engine.
+    :param function: The function to call.
+    :return: The function's result.
+    """
+    with engine.connect() as connection:
+        return function(connection)
+
+
+def scatter(
+        session: Session,
+        function: Callable[[Connection], _T],
+        parallel: bool = True
+) -> list[_T]:
+    """Calls function once per shard and gathers the results.
+
+    In parallel, the primary is read in the session's transaction and the
+    other shards are read concurrently on their own connections, which do not
+    see the session's uncommitted writes; callers that must see them pass
+    parallel=False to read every shard in the session's transaction. The
+    concurrent reads run in a copy of the caller's context, so they are bound
+    by the request's deadline, and the caller waits for them no longer than
+    the deadline; the wait is profiled as the request's SQL phase.
+
+    :param session: The session in which the operation is taking place.
+    :param function: The function to call with each shard's connection.
+    :param parallel: Whether to query the shards concurrently.
+    :return: The results, indexed by shard.
+    """
+    if not parallel or not is_sharded():
+        return [
+            function(shard_connection(session, shard))
+            for shard in range(num_shards())
+        ]
+    futures = [
+        _scatter_pool.submit(
+            _request_context().run,
+            _call_on_engine,
+            engine,
+            function
+        )
+        for engine in shard_engines()[1:]
+    ]
+    results = [function(session.connection())]
+    with profile_phase(SQL):
+        for future in futures:
+            budget = remaining()
+            try:
+                results.append(future.result(
+                    timeout=None if budget is None else max(budget, 0)
+                ))
+            except FutureTimeoutError as exc:
+                cancel()
+                raise DeadlineExceeded("Request deadline exceeded") from exc
+    return results
+
+
+def _request_context() -> Context:
+    """Returns a copy of the current context in which to read a shard.
+
+    :return: The copy, which keeps the request's deadline but does not time
+        profiling phases.
+    """
+    context = copy_context()
+    context.run(detach_phases)
+    return context
+
+
+def merge_pages(pages: Iterable[list[PostRow]], limit: int) -> list[PostRow]:
+    """K-way merges per-shard pages of the feed.
+
+    :param pages: The pages, each sorted by (created_at, id), most recent
+        first.
+    :param limit: The maximum number of posts to return.
+    :return: The no more than `limit` most recent posts of all pages, most
+        recent first. Only as many posts as are returned are compared.
+    """
+    merged = heapq.merge(*pages, key=_feed_order, reverse=True)
+    return list(itertools.islice(merged, limit))
+
+
+def _feed_order(post: PostRow) -> tuple[datetime, int]:
+    """Returns the sort key of a post in the feed.
+
+    :param post: The post.
+    :return: The post's (created_at, id).
+    """
+    return post.created_at, post.id
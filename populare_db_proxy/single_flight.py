@@ -0,0 +1,95 @@
+"""Contains single-flight coalescing of identical concurrent calls.
+
+During a traffic burst, many threads in a worker make the same read at the
+same moment, e.g., the first page of the feed. Rather than send one identical
+query per thread, the first caller for a key (the leader) runs the query and
+every caller that arrives while it is in flight (a follower) waits for and
+shares the leader's result. A follower that waits longer than the bound stops
+waiting and runs the call itself, so one stuck query cannot stall every
+request for the same key.
+"""
+
+from __future__ import annotations
+import threading
+from collections.abc import Callable, Hashable
+from typing import Any
+from prometheus_client import Counter
+
+SINGLE_FLIGHT_WAIT_SECONDS = 2.0
+LEADER = "leader"
+COALESCED = "coalesced"
+WAIT_TIMEOUT = "wait_timeout"
+SINGLE_FLIGHT_CALLS = Counter(
+    "populare_single_flight_calls_total",
+    "Number of coalescable calls, by whether they ran or shared a result",
+    ["name", "outcome"]
+)
+
+
+class _Call:
+    """A call in flight, whose outcome is shared with its followers."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one call."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(
+            self,
+            name: str,
+            wait_seconds: float = SINGLE_FLIGHT_WAIT_SECONDS
+    ) -> None:
+        """Instantiates the object.
+
+        :param name: The name of the coalesced operation, used in metrics.
+        :param wait_seconds: The maximum number of seconds a follower waits
+            for the leader before running the call itself.
+        """
+        self.name = name
+        self.wait_seconds = wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Calls function, or shares the result of an identical call.
+
+        Followers receive the leader's result object itself, so callers must
+        not modify it. If the leader's call raises, its followers raise the
+        same error.
+
+        :param key: The key that identifies identical calls.
+        :param function: The function to call.
+        :return: The result of the call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+        if not is_leader:
+            if not call.done.wait(self.wait_seconds):
+                SINGLE_FLIGHT_CALLS.labels(self.name, WAIT_TIMEOUT).inc()
+                return function()
+            SINGLE_FLIGHT_CALLS.labels(self.name, COALESCED).inc()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        SINGLE_FLIGHT_CALLS.labels(self.name, LEADER).inc()
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
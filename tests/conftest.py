@@ -5,6 +5,10 @@ import os
 os.environ["POPULARE_ALLOW_MISSING_SECRET"] = ""
 TEST_DATABASE_PATH = "/tmp/populare_test.db"
 os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{TEST_DATABASE_PATH}"
+# Tests that exercise rate limiting install their own limiter.
+os.environ["POPULARE_RATE_LIMIT_ENABLED"] = "0"
+# Tests that exercise the recent posts buffer install their own buffer.
+os.environ["POPULARE_RECENT_POSTS_SIZE"] = "0"
 from datetime import datetime
 import pytest
 import boto3
@@ -14,6 +18,7 @@ from sqlalchemy.engine import Engine
 from populare_db_proxy.db_schema import Post
 from populare_db_proxy.db_ops import init_db_schema, create_post
 from populare_db_proxy.app_data import db
+from populare_db_proxy.circuit import database_breaker, stale_feed_pages
 from populare_db_proxy.proxy import create_app
 
 TEST_REGION = "us-east-2"
@@ -73,6 +78,21 @@ def fixture_mocked_rds(aws_credentials: None) -> dict:
         yield db_instance
 
 
+@pytest.fixture(autouse=True)
+def reset_circuit() -> None:
+    """Closes the database circuit breaker and clears stale pages.
+
+    SQLite reports missing tables as operational errors, which count toward
+    opening the breaker, and stale pages would mask them, so each test starts
+    from a healthy database.
+    """
+    database_breaker.reset()
+    stale_feed_pages.clear()
+    yield
+    database_breaker.reset()
+    stale_feed_pages.clear()
+
+
 @pytest.fixture(name="uninitialized_local_db")
 def fixture_uninitialized_local_db() -> Engine:
     """Creates a schema-less local SQLite database for testing.
@@ -81,6 +101,8 @@ def fixture_uninitialized_local_db() -> Engine:
     """
     db.drop_all()
     yield db.engine
+    # Tests may leave the circuit breaker open.
+    database_breaker.reset()
     db.drop_all()
 
 
@@ -0,0 +1,102 @@
+"""Tests admission.py."""
+
+import threading
+import pytest
+from prometheus_client import REGISTRY
+from populare_db_proxy.admission import (
+    AdaptiveLimiter,
+    Overloaded,
+    QUEUE_FULL,
+    QUEUE_TIMEOUT
+)
+
+
+def _shed_count(reason: str) -> float:
+    """Returns the number of requests shed for a reason so far.
+
+    :param reason: The reason the requests were shed.
+    :return: The number of requests shed for the reason.
+    """
+    return REGISTRY.get_sample_value(
+        "populare_admission_shed_requests_total",
+        {"reason": reason}
+    ) or 0
+
+
+def test_acquire_admits_up_to_limit() -> None:
+    """Tests that requests are admitted without waiting up to the limit."""
+    limiter = AdaptiveLimiter(initial_limit=2, queue_size=0)
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.in_flight == 2
+    before = _shed_count(QUEUE_FULL)
+    with pytest.raises(Overloaded) as exc_info:
+        limiter.acquire()
+    assert exc_info.value.reason == QUEUE_FULL
+    assert _shed_count(QUEUE_FULL) == before + 1
+
+
+def test_acquire_sheds_after_queue_timeout() -> None:
+    """Tests that a queued request is shed if no slot frees in time."""
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=0.01)
+    limiter.acquire()
+    before = _shed_count(QUEUE_TIMEOUT)
+    with pytest.raises(Overloaded) as exc_info:
+        limiter.acquire()
+    assert exc_info.value.reason == QUEUE_TIMEOUT
+    assert _shed_count(QUEUE_TIMEOUT) == before + 1
+    assert limiter.waiting == 0
+
+
+def test_queued_request_is_admitted_on_release() -> None:
+    """Tests that a waiting request is admitted when a slot frees."""
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5)
+    limiter.acquire()
+    admitted = threading.Event()
+
+    def wait_for_admission() -> None:
+        """Acquires a slot and signals admission."""
+        limiter.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=wait_for_admission)
+    thread.start()
+    limiter.release(0.01)
+    thread.join(timeout=5)
+    assert admitted.is_set()
+    assert limiter.in_flight == 1
+
+
+def test_limit_grows_while_saturated_and_latency_is_low() -> None:
+    """Tests that the limit increases additively under healthy load."""
+    limiter = AdaptiveLimiter(initial_limit=2)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.acquire()
+        limiter.release(0.01)
+        limiter.release(0.01)
+    assert limiter.limit > 2
+
+
+def test_limit_does_not_grow_while_idle() -> None:
+    """Tests that the limit only grows when it is in use."""
+    limiter = AdaptiveLimiter(initial_limit=4)
+    for _ in range(10):
+        with limiter.admit():
+            pass
+    assert limiter.limit == 4
+
+
+def test_limit_shrinks_when_latency_rises() -> None:
+    """Tests that the limit decreases multiplicatively under congestion."""
+    limiter = AdaptiveLimiter(initial_limit=10, min_limit=2)
+    limiter.acquire()
+    limiter.release(0.01)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(1.0)
+    assert limiter.limit < 10 * 0.9 ** 4
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(1.0)
+    assert limiter.limit >= 2
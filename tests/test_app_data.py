@@ -3,7 +3,11 @@
 import os
 from unittest.mock import patch
 import pytest
-from populare_db_proxy.app_data import app, get_database_uri
+from populare_db_proxy.app_data import (
+    app,
+    get_database_uri,
+    get_database_uris
+)
 
 TEST_SECRET_FILENAME = "/tmp/populare-db-proxy/test_app_data/db-certs/db-uri"
 
@@ -30,3 +34,20 @@ def test_get_database_uri_reads_secret() -> None:
         outfile.write(test_uri)
     db_uri = get_database_uri(TEST_SECRET_FILENAME)
     assert db_uri == test_uri
+
+
+def test_get_database_uris_reads_one_uri_per_line() -> None:
+    """Tests that get_database_uris reads one shard URI per secret line."""
+    os.makedirs(os.path.dirname(TEST_SECRET_FILENAME), exist_ok=True)
+    with open(TEST_SECRET_FILENAME, "w", encoding="utf-8") as outfile:
+        outfile.write("mysql://primary/db\nmysql://shard1/db\n\n")
+    db_uris = get_database_uris(TEST_SECRET_FILENAME)
+    assert db_uris == ["mysql://primary/db", "mysql://shard1/db"]
+    assert get_database_uri(TEST_SECRET_FILENAME) == "mysql://primary/db"
+
+
+@patch.dict('os.environ', {"POPULARE_SHARD_DATABASE_URIS": "sqlite:///a.db"})
+def test_get_database_uris_reads_shards_from_environment() -> None:
+    """Tests that shard URIs are read from the environment without a secret."""
+    db_uris = get_database_uris("/tmp/populare-db-proxy/does-not-exist")
+    assert db_uris == [os.environ["SQLALCHEMY_DATABASE_URI"], "sqlite:///a.db"]
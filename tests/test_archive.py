@@ -0,0 +1,274 @@
+"""Tests archive.py."""
+
+from datetime import datetime
+from sqlalchemy import select, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import (
+    create_post,
+    read_posts,
+    update_post,
+    update_post_fields,
+    delete_post,
+    read_post_count,
+    read_author_stats,
+    reconcile_post_counts,
+    read_post_activity,
+    backfill_post_activity
+)
+from populare_db_proxy.archive import (
+    month_of,
+    archive_table,
+    archive_posts,
+    read_partitions
+)
+
+
+def _create_monthly_posts() -> list[Post]:
+    """Creates one post on the first day of each month in the first half of
+    2022.
+
+    :return: The created posts, oldest first.
+    """
+    posts = []
+    for month in range(1, 7):
+        post = Post(
+            text=str(month),
+            author=f"author{month % 2}",
+            created_at=datetime(2022, month, 1)
+        )
+        create_post(post)
+        posts.append(post)
+    return posts
+
+
+def _num_hot_posts(engine: Engine) -> int:
+    """Returns the number of posts in the hot posts table.
+
+    :param engine: A connection to the local database.
+    :return: The number of posts in the hot posts table.
+    """
+    with Session(engine) as session:
+        return session.execute(select(func.count()).select_from(Post)).scalar()
+
+
+def test_month_of_formats_partition_key() -> None:
+    """Tests that month_of returns the YYYY-MM partition key."""
+    assert month_of(datetime(2022, 3, 31, 23, 59)) == "2022-03"
+
+
+def test_archive_table_has_post_columns() -> None:
+    """Tests that archive tables mirror the posts table columns."""
+    table = archive_table("2022-01")
+    assert table.name == "posts_archive_2022_01"
+    assert set(table.c.keys()) == set(Post.__table__.c.keys())
+    assert archive_table("2022-01") is table
+
+
+def test_archive_posts_moves_cold_posts(empty_local_db: Engine) -> None:
+    """Tests that archive_posts moves only posts older than the cutoff, in
+    batches, into per-month partitions.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    _create_monthly_posts()
+    num_archived = archive_posts(datetime(2022, 4, 1), batch_size=2)
+    assert num_archived == 3
+    assert _num_hot_posts(empty_local_db) == 3
+    with Session(empty_local_db) as session:
+        partitions = read_partitions(session)
+    assert [partition.month for partition in partitions] == [
+        "2022-03",
+        "2022-02",
+        "2022-01"
+    ]
+    assert archive_posts(datetime(2022, 4, 1)) == 0
+
+
+def test_read_posts_merges_archive(empty_local_db: Engine) -> None:
+    """Tests that read_posts returns archived posts in order.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    posts = read_posts()
+    assert [post.text for post in posts] == ["6", "5", "4", "3", "2", "1"]
+    posts = read_posts(limit=4)
+    assert [post.text for post in posts] == ["6", "5", "4", "3"]
+    posts = read_posts(limit=2, before=datetime(2022, 3, 2))
+    assert [post.text for post in posts] == ["3", "2"]
+
+
+def test_read_posts_merges_old_hot_posts(empty_local_db: Engine) -> None:
+    """Tests that read_posts orders hot posts that are older than archived
+    posts correctly.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    create_post(Post(
+        text="old",
+        author="author",
+        created_at=datetime(2021, 12, 1)
+    ))
+    posts = read_posts(limit=10)
+    assert [post.text for post in posts] == [
+        "6", "5", "4", "3", "2", "1", "old"
+    ]
+
+
+def test_read_posts_breaks_archive_ties_by_id(empty_local_db: Engine) -> None:
+    """Tests that hot and archived posts created at the same time are
+    ordered by id.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    for idx in range(3):
+        create_post(Post(
+            text=str(idx),
+            author="author",
+            created_at=datetime(2022, 1, 1)
+        ))
+    archive_posts(datetime(2022, 4, 1))
+    # Updating an archived post moves it back into the hot table.
+    update_post_fields(1, text="edited")
+    assert [post.id for post in read_posts()] == [3, 2, 1]
+    assert [post.id for post in read_posts(limit=2)] == [3, 2]
+
+
+def test_archive_posts_keeps_ids_of_archived_posts(
+        empty_local_db: Engine
+) -> None:
+    """Tests that posts created after others were archived get new ids, so
+    that archiving them again keeps the earlier posts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    first = create_post(Post(
+        text="first",
+        author="author",
+        created_at=datetime(2020, 1, 5)
+    ))
+    archive_posts(datetime(2021, 1, 1))
+    second = create_post(Post(
+        text="second",
+        author="author",
+        created_at=datetime(2020, 1, 20)
+    ))
+    assert second.id != first.id
+    assert archive_posts(datetime(2021, 1, 1)) == 1
+    assert [post.text for post in read_posts()] == ["second", "first"]
+    assert read_post_count() == 2
+
+
+def test_archive_posts_skips_posts_with_archived_ids(
+        empty_local_db: Engine
+) -> None:
+    """Tests that a hot post whose id is already archived, as in databases
+    that reused ids, stays hot rather than replacing the archived post.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    first = create_post(Post(
+        text="first",
+        author="alice",
+        created_at=datetime(2020, 1, 5)
+    ))
+    archive_posts(datetime(2021, 1, 1))
+    create_post(Post(
+        id=first.id,
+        text="reused",
+        author="bob",
+        created_at=datetime(2020, 1, 20)
+    ))
+    create_post(Post(
+        text="other",
+        author="bob",
+        created_at=datetime(2020, 1, 25)
+    ))
+    assert archive_posts(datetime(2021, 1, 1)) == 1
+    assert _num_hot_posts(empty_local_db) == 1
+    with Session(empty_local_db) as session:
+        archived = session.execute(
+            select(archive_table("2020-01")).order_by("id")
+        ).all()
+    assert [post.text for post in archived] == ["first", "other"]
+    assert archive_posts(datetime(2021, 1, 1)) == 0
+
+
+def test_update_archived_post_moves_to_hot(empty_local_db: Engine) -> None:
+    """Tests that update_post on an archived post moves it back into the hot
+    table with the new content.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    posts = _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    update_post(Post(
+        text="new",
+        author="author1",
+        created_at=posts[0].created_at,
+        id=posts[0].id
+    ))
+    assert _num_hot_posts(empty_local_db) == 4
+    assert read_posts()[-1].text == "new"
+    assert read_post_count() == 6
+    assert reconcile_post_counts() == 0
+
+
+def test_delete_archived_post_removes_post(empty_local_db: Engine) -> None:
+    """Tests that delete_post removes archived posts and updates counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    posts = _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    delete_post(posts[0].id)
+    assert len(read_posts()) == 5
+    assert read_post_count() == 5
+    assert read_author_stats(author="author1")[0].post_count == 2
+    assert reconcile_post_counts() == 0
+
+
+def test_backfill_post_activity_includes_archive(
+        empty_local_db: Engine
+) -> None:
+    """Tests that backfill_post_activity counts archived posts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    backfill_post_activity()
+    days = read_post_activity(
+        "day",
+        datetime(2022, 1, 1),
+        datetime(2023, 1, 1)
+    )
+    assert len(days) == 6
+
+
+def test_partial_update_of_archived_post_keeps_other_fields(
+        empty_local_db: Engine
+) -> None:
+    """Tests that a partial update restores an archived post with its other
+    fields intact.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    posts = _create_monthly_posts()
+    archive_posts(datetime(2022, 4, 1))
+    updated = update_post_fields(posts[0].id, text="new")
+    assert updated.author == posts[0].author
+    assert updated.created_at == posts[0].created_at
+    assert _num_hot_posts(empty_local_db) == 4
+    assert reconcile_post_counts() == 0
@@ -0,0 +1,122 @@
+"""Tests author_cache.py."""
+
+from datetime import datetime
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from populare_db_proxy.app_data import db
+from populare_db_proxy.author_cache import AuthorCache, author_cache
+from populare_db_proxy.db_schema import Author, Post
+from populare_db_proxy.db_ops import create_posts, read_posts
+from populare_db_proxy.sessions import session_scope
+
+
+def _num_authors(engine: Engine) -> int:
+    """Returns the number of rows in the authors table.
+
+    :param engine: The engine of the database.
+    :return: The number of authors.
+    """
+    with Session(engine) as session:
+        return session.execute(select(func.count(Author.id))).scalar()
+
+
+def test_posts_share_author_rows(populated_local_db: Engine) -> None:
+    """Tests that each author is stored once, however many posts they write.
+
+    :param populated_local_db: The local database with 5 posts.
+    """
+    assert _num_authors(populated_local_db) == 5
+    create_posts([
+        Post(text=f"new{idx}", author="author0", created_at=datetime.now())
+        for idx in range(3)
+    ])
+    assert _num_authors(populated_local_db) == 5
+    assert [post.author for post in read_posts(limit=3)] == ["author0"] * 3
+
+
+def test_authors_are_cached_after_commit(empty_local_db: Engine) -> None:
+    """Tests that authors are cached in both directions once committed.
+
+    :param empty_local_db: The empty local database.
+    """
+    # pylint: disable=unused-argument
+    cache = AuthorCache()
+    with session_scope() as session:
+        ids = cache.ids(session.connection(), ["a", "b"])
+        assert not cache
+    assert len(cache) == 2
+    # Cached lookups do not use the connection.
+    assert cache.ids(None, ["a", "b"]) == ids
+    assert cache.names(None, ids.values()) == {ids["a"]: "a", ids["b"]: "b"}
+
+
+def test_rolled_back_authors_are_not_cached(empty_local_db: Engine) -> None:
+    """Tests that authors created by a rolled back transaction are not cached.
+
+    :param empty_local_db: The empty local database.
+    """
+    cache = AuthorCache()
+    with pytest.raises(ValueError):
+        with session_scope() as session:
+            cache.ids(session.connection(), ["a"])
+            raise ValueError("Rolled back")
+    assert not cache
+    assert _num_authors(empty_local_db) == 0
+
+
+def test_least_recently_used_authors_are_evicted(
+        empty_local_db: Engine
+) -> None:
+    """Tests that the cache holds no more than its size.
+
+    :param empty_local_db: The empty local database.
+    """
+    # pylint: disable=unused-argument
+    cache = AuthorCache(size=2)
+    with session_scope() as session:
+        ids = cache.ids(session.connection(), ["a", "b"])
+    with session_scope() as session:
+        cache.ids(None, ["a"])
+        cache.ids(session.connection(), ["c"])
+    assert len(cache) == 2
+    assert cache.ids(None, ["a"]) == {"a": ids["a"]}
+    with session_scope() as session:
+        assert cache.names(session.connection(), [ids["b"]]) == \
+            {ids["b"]: "b"}
+
+
+def test_orm_resolves_author_ids(empty_local_db: Engine) -> None:
+    """Tests that posts written through the ORM get their authors' ids.
+
+    :param empty_local_db: The empty local database.
+    """
+    with Session(empty_local_db) as session:
+        with session.begin():
+            session.add(Post(
+                text="text",
+                author="a",
+                created_at=datetime.now()
+            ))
+    with Session(empty_local_db) as session:
+        with session.begin():
+            post = session.execute(select(Post)).scalar_one()
+            assert post.author == "a"
+            post.author = "b"
+    with Session(empty_local_db) as session:
+        post = session.execute(select(Post)).scalar_one()
+        author = session.get(Author, post.author_id)
+        assert (post.author, author.name) == ("b", "b")
+
+
+def test_dropping_authors_clears_cache(populated_local_db: Engine) -> None:
+    """Tests that the cache is cleared when the authors table is dropped.
+
+    :param populated_local_db: The local database with 5 posts.
+    """
+    # pylint: disable=unused-argument
+    read_posts()
+    assert author_cache
+    db.drop_all()
+    assert not author_cache
@@ -0,0 +1,187 @@
+"""Tests circuit.py."""
+
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import read_posts, read_post_count, \
+    create_post
+from populare_db_proxy.circuit import (
+    CircuitBreaker,
+    CircuitOpenError,
+    StalePageCache,
+    database_breaker,
+    served_stale,
+    reset_stale,
+    CLOSED,
+    OPEN,
+    HALF_OPEN
+)
+from populare_db_proxy.deadline import deadline_scope
+
+
+def _open_breaker(breaker: CircuitBreaker) -> None:
+    """Records enough failures to open a breaker.
+
+    :param breaker: The breaker to open.
+    """
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures() -> None:
+    """Tests that the breaker opens only after consecutive failures."""
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success(0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_counts_latency_breaches_as_failures() -> None:
+    """Tests that slow statements open the breaker."""
+    breaker = CircuitBreaker(failure_threshold=2, latency_threshold=0.5)
+    breaker.record_success(1.0)
+    breaker.record_success(1.0)
+    assert breaker.state == OPEN
+
+
+def test_only_request_statements_are_held_to_latency_threshold(
+        empty_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that slow statements outside of a request's deadline, e.g., from
+    maintenance jobs, do not open the breaker.
+
+    :param empty_local_db: The empty local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    monkeypatch.setattr(database_breaker, "latency_threshold", -1.0)
+    for _ in range(database_breaker.failure_threshold):
+        read_post_count()
+    assert database_breaker.state == CLOSED
+    with deadline_scope(10):
+        with pytest.raises(CircuitOpenError):
+            for _ in range(database_breaker.failure_threshold):
+                read_post_count()
+    assert database_breaker.state == OPEN
+
+
+def test_breaker_allows_single_probe_when_half_open() -> None:
+    """Tests that only one probe is let through after the cool-down."""
+    breaker = CircuitBreaker(reset_seconds=0.01)
+    _open_breaker(breaker)
+    assert breaker.probe_due() is False
+    time.sleep(0.02)
+    assert breaker.probe_due()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_probe_fails() -> None:
+    """Tests that a failed probe opens the breaker for another cool-down."""
+    breaker = CircuitBreaker(reset_seconds=0.01)
+    _open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_stale_page_cache_evicts_least_recently_stored() -> None:
+    """Tests that the stale page cache is bounded."""
+    cache = StalePageCache(size=2)
+    cache.put((1, None), ["a"])
+    cache.put((2, None), ["b"])
+    cache.put((1, None), ["c"])
+    cache.put((3, None), ["d"])
+    assert cache.keys() == [(1, None), (3, None)]
+    assert cache.get((1, None)) == ["c"]
+
+
+def test_open_breaker_rejects_statements(empty_local_db: Engine) -> None:
+    """Tests that statements fail fast while the breaker is open.
+
+    :param empty_local_db: The empty local database.
+    """
+    # pylint: disable=unused-argument
+    _open_breaker(database_breaker)
+    with pytest.raises(CircuitOpenError):
+        read_post_count()
+
+
+def test_read_posts_serves_stale_page_while_open(
+        populated_local_db: Engine
+) -> None:
+    """Tests that read_posts serves the last good page while open.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    reset_stale()
+    posts = read_posts()
+    assert not served_stale()
+    _open_breaker(database_breaker)
+    assert read_posts() == posts
+    assert served_stale()
+    with pytest.raises(CircuitOpenError):
+        read_posts(limit=1)
+
+
+def test_read_posts_serves_stale_page_on_database_error(
+        populated_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that read_posts serves the last good page if the read fails.
+
+    :param populated_local_db: The populated local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    reset_stale()
+    posts = read_posts()
+
+    def fail(key: tuple) -> list[Post]:
+        """Fails like an unreachable database."""
+        raise OperationalError("SELECT", {}, Exception(str(key)))
+
+    monkeypatch.setattr("populare_db_proxy.db_ops._read_posts_page", fail)
+    assert read_posts() == posts
+    assert served_stale()
+
+
+def test_stale_pages_refresh_in_background_after_recovery(
+        populated_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a stale read probes the database and refreshes pages.
+
+    :param populated_local_db: The populated local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    read_posts()
+    create_post(Post(text="new", author="a", created_at=datetime.now()))
+    monkeypatch.setattr(database_breaker, "reset_seconds", 0)
+    _open_breaker(database_breaker)
+    assert len(read_posts()) == 5
+    deadline = time.monotonic() + 5
+    while database_breaker.state != CLOSED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert database_breaker.state == CLOSED
+    while len(read_posts()) != 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_posts()[0].text == "new"
@@ -1,20 +1,43 @@
 """Tests db_ops.py."""
+# pylint: disable=too-many-lines
 
+import threading
+import time
 from datetime import datetime
 from multiprocessing import Pool
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, select, delete, func, inspect
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, IntegrityError
-from populare_db_proxy.db_schema import Post
+from populare_db_proxy import db_ops
+from populare_db_proxy.db_schema import Author, Post, PostActivity, PostRow
 from populare_db_proxy.db_ops import (
     init_db_schema,
     create_post,
     read_posts,
     update_post,
-    delete_post
+    delete_post,
+    create_posts,
+    read_post_count,
+    read_author_stats,
+    reconcile_post_counts,
+    truncate_to_bucket,
+    read_post_activity,
+    backfill_post_activity,
+    read_posts_by_ids,
+    delete_posts,
+    read_changes_since,
+    prune_post_changes,
+    CHANGE_CREATE,
+    CHANGE_UPDATE,
+    CHANGE_DELETE,
+    READ_POSTS_LIMIT,
+    read_post_rows,
+    update_post_fields,
+    migrate_post_authors
 )
+from populare_db_proxy.sessions import request_session
 from tests.conftest import DB_NAME
 
 POOL_SIZE = 10
@@ -510,3 +533,688 @@ def test_read_posts_recovers_after_error(
     init_db_schema()
     posts = read_posts()
     assert posts is not None
+
+
+def test_create_post_increments_counts(empty_local_db: Engine) -> None:
+    """Tests that create_post increments the total and per-author counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    assert read_post_count() == 0
+    create_post(Post(text="text", author="a", created_at=datetime.now()))
+    create_post(Post(text="text", author="a", created_at=datetime.now()))
+    create_post(Post(text="text", author="b", created_at=datetime.now()))
+    assert read_post_count() == 3
+    stats = read_author_stats()
+    assert [(stat.author, stat.post_count) for stat in stats] == [
+        ("a", 2),
+        ("b", 1)
+    ]
+
+
+def test_create_post_twice_same_object_counts_once(
+        empty_local_db: Engine
+) -> None:
+    """Tests that create_post only counts the same post object once.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post = Post(text="text", author="author", created_at=datetime.now())
+    create_post(post)
+    create_post(post)
+    assert read_post_count() == 1
+
+
+def test_create_post_failure_does_not_count(empty_local_db: Engine) -> None:
+    """Tests that a failed create_post does not change the counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post1 = Post(text="text", author="author", created_at=datetime.now(), id=1)
+    post2 = Post(text="text", author="author", created_at=datetime.now(), id=1)
+    create_post(post1)
+    with pytest.raises(IntegrityError):
+        create_post(post2)
+    assert read_post_count() == 1
+    assert read_author_stats()[0].post_count == 1
+
+
+def test_create_posts_adds_all_posts(empty_local_db: Engine) -> None:
+    """Tests that create_posts adds every post and updates the counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    posts = [
+        Post(text=str(idx), author=f"author{idx % 2}",
+             created_at=datetime.now())
+        for idx in range(5)
+    ]
+    create_posts(posts)
+    assert all(post.id for post in posts)
+    assert len(read_posts()) == 5
+    assert read_post_count() == 5
+    assert read_author_stats(author="author0")[0].post_count == 3
+
+
+def test_update_post_author_change_moves_count(
+        empty_local_db: Engine
+) -> None:
+    """Tests that update_post moves the post between author counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post = Post(text="text", author="old", created_at=datetime.now())
+    create_post(post)
+    update_post(Post(
+        text="text",
+        author="new",
+        created_at=post.created_at,
+        id=post.id
+    ))
+    assert read_post_count() == 1
+    stats = read_author_stats()
+    assert [(stat.author, stat.post_count) for stat in stats] == [("new", 1)]
+
+
+def test_update_post_invalid_id_does_not_count(
+        empty_local_db: Engine
+) -> None:
+    """Tests that update_post on a missing id does not change the counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    update_post(Post(
+        text="new",
+        author="new",
+        created_at=datetime.now(),
+        id=9
+    ))
+    assert read_post_count() == 0
+    assert not read_author_stats()
+
+
+def test_delete_post_decrements_counts(empty_local_db: Engine) -> None:
+    """Tests that delete_post decrements the counts exactly once.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post = Post(text="text", author="author", created_at=datetime.now())
+    create_post(post)
+    delete_post(post.id)
+    delete_post(post.id)
+    assert read_post_count() == 0
+    assert not read_author_stats()
+
+
+def test_delete_post_lost_to_concurrent_delete_keeps_counts(
+        empty_local_db: Engine
+) -> None:
+    """Tests that delete_post leaves the counts alone if another delete
+    removes the post between its read and its delete.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    post = create_post(
+        Post(text="text", author="author", created_at=datetime.now())
+    )
+    raced = []
+
+    def delete_first(conn, cursor, statement, *args) -> None:
+        """Deletes the post just before delete_post's own delete."""
+        # pylint: disable=unused-argument
+        if statement.startswith("DELETE FROM posts") and not raced:
+            raced.append(statement)
+            cursor.execute("DELETE FROM posts WHERE id = ?", (post.id,))
+
+    event.listen(empty_local_db, "before_cursor_execute", delete_first)
+    try:
+        delete_post(post.id)
+    finally:
+        event.remove(empty_local_db, "before_cursor_execute", delete_first)
+    assert raced
+    assert read_post_count() == 1
+    assert [change.operation for change in read_changes_since()[0]] == \
+        [CHANGE_CREATE]
+
+
+def test_counter_row_created_concurrently_is_incremented(
+        empty_local_db: Engine
+) -> None:
+    """Tests that a write whose counter row is created by another transaction
+    just before its own insert increments that row rather than failing on its
+    primary key.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    raced = []
+
+    def create_first(conn, cursor, statement, *args) -> None:
+        """Creates the author's stats row just before the write does."""
+        # pylint: disable=unused-argument
+        if statement.startswith("INSERT INTO author_stats") and not raced:
+            raced.append(statement)
+            cursor.execute(
+                "INSERT INTO author_stats (author, post_count) VALUES (?, ?)",
+                ("author", 5)
+            )
+
+    event.listen(empty_local_db, "before_cursor_execute", create_first)
+    try:
+        create_post(
+            Post(text="text", author="author", created_at=datetime.now())
+        )
+    finally:
+        event.remove(empty_local_db, "before_cursor_execute", create_first)
+    assert raced
+    assert read_author_stats()[0].post_count == 6
+
+
+def test_read_author_stats_observes_limit(populated_local_db: Engine) -> None:
+    """Tests that read_author_stats observes the limit argument.
+
+    :param populated_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    assert len(read_author_stats(limit=2)) == 2
+
+
+def test_reconcile_post_counts_repairs_drift(
+        populated_local_db: Engine
+) -> None:
+    """Tests that reconcile_post_counts repairs counters after writes that
+    bypass db_ops.
+
+    :param populated_local_db: A connection to the local database.
+    """
+    with Session(populated_local_db) as session:
+        with session.begin():
+            session.execute(
+                delete(Post.__table__).where(Post.author == "author0")
+            )
+            session.add(Post(
+                text="text",
+                author="author1",
+                created_at=datetime.now()
+            ))
+    assert read_post_count() == 5
+    assert reconcile_post_counts() == 2
+    assert read_post_count() == 5
+    assert not read_author_stats(author="author0")
+    assert read_author_stats(author="author1")[0].post_count == 2
+    assert reconcile_post_counts() == 0
+
+
+def test_truncate_to_bucket_truncates() -> None:
+    """Tests that truncate_to_bucket returns the start of each bucket."""
+    timestamp = datetime(2022, 1, 2, 3, 4, 5, 6)
+    assert truncate_to_bucket(timestamp, "minute") == datetime(
+        2022, 1, 2, 3, 4)
+    assert truncate_to_bucket(timestamp, "hour") == datetime(2022, 1, 2, 3)
+    assert truncate_to_bucket(timestamp, "day") == datetime(2022, 1, 2)
+
+
+def test_truncate_to_bucket_invalid_granularity_raises_error() -> None:
+    """Tests that truncate_to_bucket rejects unknown granularities."""
+    with pytest.raises(ValueError):
+        truncate_to_bucket(datetime.now(), "week")
+
+
+def test_create_post_updates_activity(empty_local_db: Engine) -> None:
+    """Tests that create_post increments the activity rollups.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    for minute in (0, 0, 30):
+        create_post(Post(
+            text="text",
+            author="author",
+            created_at=datetime(2022, 1, 1, 12, minute)
+        ))
+    start = datetime(2022, 1, 1)
+    end = datetime(2022, 1, 2)
+    minutes = read_post_activity("minute", start, end)
+    assert [(bucket.bucket_start.minute, bucket.post_count)
+            for bucket in minutes] == [(0, 2), (30, 1)]
+    hours = read_post_activity("hour", start, end)
+    assert [bucket.post_count for bucket in hours] == [3]
+    days = read_post_activity("day", start, end)
+    assert [bucket.bucket_start for bucket in days] == [start]
+
+
+def test_update_and_delete_post_update_activity(
+        empty_local_db: Engine
+) -> None:
+    """Tests that update_post moves posts between buckets and delete_post
+    removes them.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post1 = Post(text="1", author="author", created_at=datetime(2022, 1, 1))
+    post2 = Post(text="2", author="author", created_at=datetime(2022, 1, 1))
+    create_posts([post1, post2])
+    update_post(Post(
+        text="1",
+        author="author",
+        created_at=datetime(2022, 1, 3),
+        id=post1.id
+    ))
+    delete_post(post2.id)
+    days = read_post_activity(
+        "day",
+        datetime(2022, 1, 1),
+        datetime(2022, 2, 1)
+    )
+    assert [(bucket.bucket_start.day, bucket.post_count)
+            for bucket in days] == [(3, 1)]
+
+
+def test_read_post_activity_observes_range(empty_local_db: Engine) -> None:
+    """Tests that read_post_activity only returns buckets in range.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    for day in range(1, 6):
+        create_post(Post(
+            text="text",
+            author="author",
+            created_at=datetime(2022, 1, day, 12)
+        ))
+    days = read_post_activity(
+        "day",
+        datetime(2022, 1, 2, 6),
+        datetime(2022, 1, 4)
+    )
+    assert [bucket.bucket_start.day for bucket in days] == [2, 3]
+
+
+def test_backfill_post_activity_matches_incremental(
+        empty_local_db: Engine
+) -> None:
+    """Tests that backfill_post_activity rebuilds the same rollups that the
+    write path maintains incrementally, across several batches.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    create_posts([
+        Post(
+            text=str(idx),
+            author="author",
+            created_at=datetime(2022, 1, 1 + idx % 3, idx % 24, idx % 60)
+        )
+        for idx in range(50)
+    ])
+    start = datetime(2022, 1, 1)
+    end = datetime(2022, 2, 1)
+
+    def snapshot() -> dict:
+        """Returns the current rollups for every granularity."""
+        return {
+            granularity: [
+                (bucket.bucket_start, bucket.post_count)
+                for bucket in read_post_activity(granularity, start, end)
+            ]
+            for granularity in ("minute", "hour", "day")
+        }
+
+    expected = snapshot()
+    with Session(empty_local_db) as session:
+        with session.begin():
+            session.execute(delete(PostActivity))
+    assert not read_post_activity("day", start, end)
+    num_rows = backfill_post_activity(batch_size=7)
+    assert snapshot() == expected
+    assert num_rows == sum(len(buckets) for buckets in expected.values())
+
+
+def test_backfill_post_activity_counts_concurrent_write_once(
+        empty_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a post written while the backfill scans is counted once.
+
+    :param empty_local_db: A connection to the local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument,protected-access
+    create_posts([
+        Post(text=str(idx), author="author", created_at=datetime(2022, 1, 1))
+        for idx in range(3)
+    ])
+    aggregate = db_ops._aggregate_post_activity
+    writers = []
+
+    def aggregate_then_write(*args: object) -> object:
+        """Aggregates a table, then writes a post after the scan of it."""
+        totals = aggregate(*args)
+        writer = threading.Thread(target=create_post, args=(Post(
+            text="concurrent",
+            author="author",
+            created_at=datetime(2022, 1, 1)
+        ),))
+        writer.start()
+        writer.join(0.2)
+        writers.append(writer)
+        return totals
+
+    monkeypatch.setattr(
+        db_ops,
+        "_aggregate_post_activity",
+        aggregate_then_write
+    )
+    backfill_post_activity()
+    for writer in writers:
+        writer.join()
+    days = read_post_activity(
+        "day",
+        datetime(2022, 1, 1),
+        datetime(2022, 1, 2)
+    )
+    assert [bucket.post_count for bucket in days] == [4]
+    assert read_post_count() == 4
+
+
+def test_read_posts_by_ids_returns_existing_posts(
+        populated_local_db: Engine
+) -> None:
+    """Tests that read_posts_by_ids returns only the posts that exist.
+
+    :param populated_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    posts = read_posts_by_ids([1, 3, 99])
+    assert set(posts) == {1, 3}
+    assert posts[3].text == "text2"
+    assert not read_posts_by_ids([])
+
+
+def test_writes_are_logged_in_commit_order(empty_local_db: Engine) -> None:
+    """Tests that every write is recorded in the change log in order, with
+    tombstones for deletes.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    post1 = Post(text="1", author="author", created_at=datetime.now())
+    post2 = Post(text="2", author="author", created_at=datetime.now())
+    create_post(post1)
+    create_posts([post2])
+    update_post(Post(
+        text="new",
+        author="author",
+        created_at=post1.created_at,
+        id=post1.id
+    ))
+    delete_post(post2.id)
+    delete_posts([post1.id])
+    changes, cursor, reset = read_changes_since()
+    assert [(change.operation, change.post_id) for change in changes] == [
+        (CHANGE_CREATE, post1.id),
+        (CHANGE_CREATE, post2.id),
+        (CHANGE_UPDATE, post1.id),
+        (CHANGE_DELETE, post2.id),
+        (CHANGE_DELETE, post1.id)
+    ]
+    assert changes[2].text == "new"
+    assert changes[3].text is None
+    assert cursor == changes[-1].seq
+    assert not reset
+
+
+def test_failed_write_is_not_logged(empty_local_db: Engine) -> None:
+    """Tests that a write that fails leaves no trace in the change log.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    create_post(Post(text="1", author="a", created_at=datetime.now(), id=1))
+    with pytest.raises(IntegrityError):
+        create_post(Post(text="2", author="a", created_at=datetime.now(),
+                         id=1))
+    delete_post(99)
+    changes, _, _ = read_changes_since()
+    assert len(changes) == 1
+
+
+def test_read_changes_since_pages_with_cursor(
+        populated_local_db: Engine
+) -> None:
+    """Tests that read_changes_since returns changes after the cursor.
+
+    :param populated_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    changes, cursor, _ = read_changes_since(limit=3)
+    assert len(changes) == 3
+    changes, next_cursor, _ = read_changes_since(cursor=cursor, limit=3)
+    assert len(changes) == 2
+    assert changes[0].seq > cursor
+    changes, final_cursor, _ = read_changes_since(cursor=next_cursor)
+    assert not changes
+    assert final_cursor == next_cursor
+
+
+def test_prune_post_changes_requires_reset(
+        populated_local_db: Engine
+) -> None:
+    """Tests that pruning the change log tells stale clients to reset.
+
+    :param populated_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    _, cursor, _ = read_changes_since(limit=1)
+    assert prune_post_changes(datetime.now(), batch_size=2) == 5
+    changes, _, reset = read_changes_since(cursor=cursor)
+    assert not changes
+    assert reset
+    create_post(Post(text="new", author="author", created_at=datetime.now()))
+    _, cursor, _ = read_changes_since()
+    changes, _, reset = read_changes_since(cursor=cursor)
+    assert not reset
+
+
+def test_read_posts_coalesces_concurrent_reads(
+        populated_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that concurrent identical read_posts calls share one query.
+
+    :param populated_local_db: The populated local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    release = threading.Event()
+    keys = []
+    results = []
+
+    def read_page(key: tuple) -> list[Post]:
+        """Records the query and blocks until released."""
+        keys.append(key)
+        release.wait(5)
+        return [Post(text="shared", author="a", created_at=datetime.now())]
+
+    monkeypatch.setattr("populare_db_proxy.db_ops._read_posts_page", read_page)
+    threads = [
+        threading.Thread(target=lambda: results.append(read_posts()))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert keys == [(READ_POSTS_LIMIT, None)]
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_read_posts_does_not_coalesce_after_writes(
+        empty_local_db: Engine,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a request that wrote posts reads its own writes rather than
+    sharing another request's query.
+
+    :param empty_local_db: The empty local database.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+
+    def fail(key: tuple, function: object) -> None:
+        """Fails if the read is coalesced."""
+        raise AssertionError(f"Coalesced {key} {function}")
+
+    monkeypatch.setattr("populare_db_proxy.db_ops._read_posts_flight.do", fail)
+    with request_session():
+        create_post(Post(text="mine", author="a", created_at=datetime.now()))
+        assert [post.text for post in read_posts()] == ["mine"]
+
+
+def test_migration_adds_version_and_author_id_to_existing_tables(
+        uninitialized_local_db: Engine
+) -> None:
+    """Tests that init_db_schema adds the version column, and
+    migrate_post_authors the author_id column, to posts tables that were
+    created before they existed.
+
+    :param uninitialized_local_db: The uninitialized local database.
+    """
+    with uninitialized_local_db.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, text VARCHAR(255), "
+            "author VARCHAR(255), created_at DATETIME)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO posts VALUES (1, 'text', 'author', "
+            "'2022-01-01 00:00:00.000000')"
+        )
+    init_db_schema()
+    init_db_schema()
+    assert migrate_post_authors() == 1
+    post = read_posts_by_ids([1])[1]
+    assert post.version == 1
+    assert post.author == "author"
+
+
+def test_migrate_post_authors_normalizes_authors_in_batches(
+        uninitialized_local_db: Engine
+) -> None:
+    """Tests that migrate_post_authors moves authors' names out of a legacy
+    posts table, one row per author.
+
+    :param uninitialized_local_db: The uninitialized local database.
+    """
+    with uninitialized_local_db.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE posts (id INTEGER PRIMARY KEY, text VARCHAR(255), "
+            "author VARCHAR(255), created_at DATETIME)"
+        )
+        for idx in range(1, 6):
+            connection.exec_driver_sql(
+                f"INSERT INTO posts VALUES ({idx}, 'text{idx}', "
+                f"'author{idx % 2}', '2022-01-0{idx} 00:00:00.000000')"
+            )
+    assert migrate_post_authors(batch_size=2) == 5
+    columns = {
+        column["name"]
+        for column in inspect(uninitialized_local_db).get_columns("posts")
+    }
+    assert "author" not in columns
+    with Session(uninitialized_local_db) as session:
+        assert session.execute(select(func.count(Author.id))).scalar() == 2
+    posts = read_posts()
+    assert [post.author for post in posts] == \
+        ["author1", "author0", "author1", "author0", "author1"]
+    create_post(Post(text="new", author="author0", created_at=datetime.now()))
+    # The legacy posts were written without updating the aggregates.
+    reconcile_post_counts()
+    assert read_author_stats(author="author0")[0].post_count == 3
+    assert migrate_post_authors() == 0
+
+
+def test_read_post_rows_returns_rows_most_recent_first(
+        populated_local_db: Engine
+) -> None:
+    """Tests that the Core read path returns PostRow tuples in order.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    rows = read_post_rows(limit=3)
+    assert all(isinstance(row, PostRow) for row in rows)
+    assert [row.text for row in rows] == ["text4", "text3", "text2"]
+    assert rows[1:] == read_post_rows(limit=2, before=rows[0].created_at)
+
+
+def test_update_post_fields_updates_only_supplied_fields(
+        populated_local_db: Engine
+) -> None:
+    """Tests that a partial update leaves the other fields unchanged.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    old = read_posts_by_ids([1])[1]
+    updated = update_post_fields(1, text="fixed")
+    assert updated.text == "fixed"
+    assert updated.author == old.author
+    assert updated.created_at == old.created_at
+    assert updated.version == old.version + 1
+    assert read_posts_by_ids([1])[1].text == "fixed"
+    assert read_author_stats(author=old.author)[0].post_count == 1
+    assert reconcile_post_counts() == 0
+
+
+def test_update_post_fields_author_change_updates_aggregates(
+        populated_local_db: Engine
+) -> None:
+    """Tests that a partial author update moves the post between authors.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    updated = update_post_fields(1, author="author1")
+    assert updated.text == "text0"
+    assert read_author_stats(author="author1")[0].post_count == 2
+    assert not read_author_stats(author="author0")
+    assert reconcile_post_counts() == 0
+
+
+def test_update_post_fields_without_fields_writes_nothing(
+        populated_local_db: Engine
+) -> None:
+    """Tests that a partial update with no fields returns the post unchanged
+    and records no change.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    old = read_posts_by_ids([1])[1]
+    last_seq = read_changes_since(0)[0][-1].seq
+    assert update_post_fields(1) == old
+    assert read_posts_by_ids([1])[1].version == old.version
+    assert read_changes_since(0)[0][-1].seq == last_seq
+    assert update_post_fields(99) is None
+
+
+def test_update_post_fields_missing_id_returns_none(
+        populated_local_db: Engine
+) -> None:
+    """Tests that a partial update of a missing post reports no match.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    assert update_post_fields(99, text="new") is None
+    assert update_post_fields(99, author="new") is None
+    assert read_changes_since(0)[0][-1].operation == CHANGE_CREATE
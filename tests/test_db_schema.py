@@ -6,7 +6,7 @@ import pytest
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.engine import Engine
 from populare_db_proxy.db_ops import create_post
-from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_schema import Post, PostRow, AuthorStats, PostChange
 
 
 def test_post_fields_not_nullable(empty_local_db: Engine) -> None:
@@ -49,3 +49,36 @@ def test_post_repr_is_json_serialization() -> None:
     )
     assert deserialized_post.text == post.text
     assert deserialized_post.created_at == post.created_at
+
+
+def test_author_stats_repr_is_json_serialization() -> None:
+    """Tests that the AuthorStats __repr__ string is a valid JSON
+    serialization."""
+    stats = AuthorStats(author="world", post_count=3)
+    assert json.loads(str(stats)) == {"author": "world", "post_count": 3}
+
+
+def test_post_change_repr_is_json_serialization() -> None:
+    """Tests that the PostChange __repr__ string is a valid JSON
+    serialization, with no post for tombstones."""
+    change = PostChange(
+        seq=3,
+        operation="update",
+        post_id=7,
+        text="hello",
+        author="world",
+        created_at=datetime(2022, 1, 2)
+    )
+    change_json = json.loads(str(change))
+    assert change_json["seq"] == 3
+    assert change_json["post"]["text"] == "hello"
+    tombstone = PostChange(seq=4, operation="delete", post_id=7)
+    assert json.loads(str(tombstone))["post"] is None
+
+
+def test_post_row_serializes_like_post() -> None:
+    """Tests that PostRow and Post have the same JSON serialization."""
+    created_at = datetime(2022, 1, 1, 12)
+    post = Post(id=1, text="text", author="author", created_at=created_at)
+    row = PostRow(1, "text", "author", created_at, 1)
+    assert str(row) == str(post)
@@ -0,0 +1,138 @@
+"""Tests deadline.py."""
+
+import time
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from populare_db_proxy import deadline
+from populare_db_proxy.circuit import database_breaker, CLOSED
+from populare_db_proxy.db_ops import read_post_count
+from populare_db_proxy.deadline import (
+    DeadlineExceeded,
+    TransientDatabaseError,
+    deadline_scope,
+    deadline_exceeded,
+    parse_timeout_header,
+    remaining,
+    retry_transient,
+    transient_error_seen
+)
+
+# Counts to a number large enough to run well past any test deadline.
+SLOW_QUERY = """
+WITH RECURSIVE counter(n) AS (
+    SELECT 1 UNION ALL SELECT n + 1 FROM counter WHERE n < 100000000
+)
+SELECT count(*) FROM counter
+"""
+
+
+def _transient_failure() -> None:
+    """Records a transient error for the current deadline and raises."""
+    # pylint: disable=protected-access
+    deadline._deadline.get().transient_error = True
+    raise TransientDatabaseError("Transient database error")
+
+
+def test_parse_timeout_header_only_shortens_timeout() -> None:
+    """Tests that the timeout header can shorten but not extend the default."""
+    assert parse_timeout_header(None, 10) == 10
+    assert parse_timeout_header("2.5", 10) == 2.5
+    assert parse_timeout_header("60", 10) == 10
+    assert parse_timeout_header("0", 10) == 10
+    assert parse_timeout_header("-1", 10) == 10
+    assert parse_timeout_header("soon", 10) == 10
+
+
+def test_deadline_scope_sets_remaining() -> None:
+    """Tests that the deadline applies only inside its scope."""
+    assert remaining() is None
+    with deadline_scope(5):
+        assert 0 < remaining() <= 5
+        with deadline_scope(1):
+            assert remaining() <= 1
+        assert remaining() > 1
+    assert remaining() is None
+
+
+def test_statement_after_deadline_is_not_sent(
+        empty_local_db: Engine
+) -> None:
+    """Tests that statements past the deadline raise DeadlineExceeded.
+
+    :param empty_local_db: The empty local database.
+    """
+    # pylint: disable=unused-argument
+    with deadline_scope(0):
+        assert not deadline_exceeded()
+        with pytest.raises(DeadlineExceeded):
+            read_post_count()
+        assert deadline_exceeded()
+    assert read_post_count() == 0
+
+
+def test_sqlite_statement_interrupted_at_deadline(
+        empty_local_db: Engine
+) -> None:
+    """Tests that long-running SQLite statements are interrupted.
+
+    :param empty_local_db: The empty local database.
+    """
+    start = time.monotonic()
+    with deadline_scope(0.05), empty_local_db.connect() as connection:
+        with pytest.raises(OperationalError, match="interrupted"):
+            connection.execute(text(SLOW_QUERY))
+        assert deadline_exceeded()
+    assert time.monotonic() - start < 5
+    # Requests running out of time do not count against the database.
+    assert database_breaker.state == CLOSED
+    assert database_breaker.failures == 0
+
+
+def test_mysql_selects_get_execution_time_hint() -> None:
+    """Tests that only SELECT statements get the MAX_EXECUTION_TIME hint."""
+    # pylint: disable=protected-access
+    assert deadline._add_mysql_timeout("  select * from posts", 250) == \
+        "  select /*+ MAX_EXECUTION_TIME(250) */ * from posts"
+    assert deadline._add_mysql_timeout("UPDATE posts SET text = ''", 250) == \
+        "UPDATE posts SET text = ''"
+
+
+def test_retry_transient_retries_while_budget_remains() -> None:
+    """Tests that transient errors are retried within the deadline."""
+    calls = []
+
+    def flaky() -> str:
+        """Fails transiently on the first call."""
+        calls.append(1)
+        if len(calls) == 1:
+            _transient_failure()
+        return "ok"
+
+    with deadline_scope(5):
+        assert retry_transient(flaky, base_delay=0.001) == "ok"
+        assert not transient_error_seen()
+    assert len(calls) == 2
+    # Without budget left for the backoff, the error is raised.
+    calls.clear()
+    with deadline_scope(0.0001), pytest.raises(TransientDatabaseError):
+        retry_transient(flaky, base_delay=1)
+    assert len(calls) == 1
+    # Attempts are bounded.
+    with deadline_scope(5), pytest.raises(TransientDatabaseError):
+        retry_transient(_transient_failure, attempts=2, base_delay=0.001)
+
+
+def test_retry_transient_does_not_retry_other_errors() -> None:
+    """Tests that errors not marked transient are raised immediately."""
+    calls = []
+
+    def failing() -> None:
+        """Fails without a transient error."""
+        calls.append(1)
+        raise TransientDatabaseError("not actually marked transient")
+
+    with deadline_scope(5), pytest.raises(TransientDatabaseError):
+        retry_transient(failing, base_delay=0.001)
+    assert len(calls) == 1
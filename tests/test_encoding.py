@@ -0,0 +1,109 @@
+"""Tests encoding.py."""
+
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from werkzeug.datastructures import MIMEAccept
+from populare_db_proxy.db_schema import PostRow
+from populare_db_proxy.encoding import (
+    CBOR_MIMETYPE,
+    JSON_MIMETYPE,
+    MSGPACK_MIMETYPE,
+    PostPayload,
+    decode_binary,
+    encode_binary,
+    encode_json,
+    native_post,
+    negotiate_mimetype,
+    timestamp_micros
+)
+
+RESULT = {"data": {"readPosts": ['{"id": 1, "text": "caf\\u00e9"}']}}
+
+
+def test_encode_json_round_trips() -> None:
+    """Tests that encoded results decode to the original data."""
+    assert json.loads(encode_json(RESULT)) == RESULT
+
+
+def test_encode_json_without_orjson(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the standard library is used if orjson is absent.
+
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr("populare_db_proxy.encoding.orjson", None)
+    assert encode_json(RESULT) == json.dumps(RESULT, separators=(",", ":"))
+
+
+def test_encode_json_pretty_is_indented() -> None:
+    """Tests that pretty output is indented."""
+    assert "\n  " in encode_json(RESULT, pretty=True)
+
+
+def test_negotiate_mimetype_prefers_json() -> None:
+    """Tests that JSON is used unless the client prefers a binary format."""
+    assert negotiate_mimetype(MIMEAccept()) == JSON_MIMETYPE
+    assert negotiate_mimetype(MIMEAccept([("*/*", 1)])) == JSON_MIMETYPE
+    assert negotiate_mimetype(
+        MIMEAccept([(MSGPACK_MIMETYPE, 1), (JSON_MIMETYPE, 0.5)])
+    ) == MSGPACK_MIMETYPE
+    assert negotiate_mimetype(MIMEAccept([("text/html", 1)])) == \
+        JSON_MIMETYPE
+
+
+def test_negotiate_mimetype_without_encoders(
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that binary formats are not offered if not installed.
+
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr("populare_db_proxy.encoding.msgpack", None)
+    monkeypatch.setattr("populare_db_proxy.encoding.cbor2", None)
+    assert negotiate_mimetype(MIMEAccept([(MSGPACK_MIMETYPE, 1)])) == \
+        JSON_MIMETYPE
+
+
+@pytest.mark.parametrize("mimetype", [MSGPACK_MIMETYPE, CBOR_MIMETYPE])
+def test_encode_binary_round_trips(mimetype: str) -> None:
+    """Tests that binary encodings decode to the original data.
+
+    :param mimetype: The binary format.
+    """
+    post = native_post(PostRow(1, "café", "author", datetime(2022, 1, 1), 1))
+    data = {"data": {"readPosts": [post]}}
+    payload = encode_binary(data, mimetype)
+    assert decode_binary(payload, mimetype) == data
+    assert len(payload) < len(encode_json(data))
+
+
+@pytest.mark.parametrize("mimetype", [MSGPACK_MIMETYPE, CBOR_MIMETYPE])
+def test_encode_binary_replaces_post_payloads(
+        mimetype: str
+) -> None:
+    """Tests that post payloads are encoded as native maps, and that they
+    are JSON strings otherwise.
+
+    :param mimetype: The binary format.
+    """
+    row = PostRow(1, "text", "author", datetime(2022, 1, 1), 1)
+    payload = PostPayload(str(row), row)
+    assert str(payload) is payload
+    data = {"data": {"readPosts": [payload, None], "post": payload}}
+    assert decode_binary(encode_binary(data, mimetype), mimetype) == {
+        "data": {
+            "readPosts": [native_post(row), None],
+            "post": native_post(row)
+        }
+    }
+    assert data["data"]["post"] is payload
+    assert json.loads(encode_json(data))["data"]["post"] == str(row)
+
+
+def test_timestamp_micros_is_utc() -> None:
+    """Tests that timestamps count microseconds since the Unix epoch."""
+    assert timestamp_micros(datetime(1970, 1, 1, 0, 0, 1, 5)) == 1000005
+    aware = datetime(1970, 1, 1, 1, tzinfo=timezone(timedelta(hours=1)))
+    assert timestamp_micros(aware) == 0
+    now = datetime.now(timezone.utc)
+    assert timestamp_micros(now) == round(now.timestamp() * 1e6)
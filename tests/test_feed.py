@@ -0,0 +1,207 @@
+"""Tests feed.py."""
+
+import json
+import os
+import socket
+import time
+from datetime import datetime
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.engine import Engine
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import create_post, update_post, delete_post
+from populare_db_proxy.sessions import request_session
+from populare_db_proxy.feed import (
+    FeedBroker,
+    FeedEvent,
+    FeedFull,
+    SocketRelay,
+    stream_events,
+    feed_broker,
+    POST_CREATED,
+    POST_UPDATED,
+    POST_DELETED,
+    RESET
+)
+
+TEST_RELAY_DIR = "/tmp/populare-db-proxy/test_feed/relay"
+
+
+def test_feed_event_to_sse_formats_message() -> None:
+    """Tests that to_sse returns a Server-Sent Events message."""
+    event = FeedEvent(7, POST_CREATED, '{"id": 1}')
+    assert event.to_sse() == \
+           'id: 7\nevent: post_created\ndata: {"id": 1}\n\n'
+
+
+def test_publish_delivers_to_subscribers() -> None:
+    """Tests that published events reach every subscriber in order."""
+    broker = FeedBroker()
+    subscription1 = broker.subscribe()
+    subscription2 = broker.subscribe()
+    event1 = broker.publish(POST_CREATED, "1")
+    event2 = broker.publish(POST_CREATED, "2")
+    assert event2.event_id > event1.event_id
+    for subscription in (subscription1, subscription2):
+        assert subscription.get(timeout=0) == event1
+        assert subscription.get(timeout=0) == event2
+        assert subscription.get(timeout=0) is None
+
+
+def test_subscribe_resumes_after_last_event_id() -> None:
+    """Tests that a subscription with a last event id replays newer history."""
+    broker = FeedBroker()
+    event1 = broker.publish(POST_CREATED, "1")
+    event2 = broker.publish(POST_CREATED, "2")
+    subscription = broker.subscribe(last_event_id=event1.event_id)
+    assert subscription.get(timeout=0) == event2
+    assert subscription.get(timeout=0) is None
+
+
+def test_subscribe_rejects_subscribers_past_maximum() -> None:
+    """Tests that a full broker rejects new subscribers until one leaves."""
+    broker = FeedBroker(max_subscriptions=2)
+    subscription = broker.subscribe()
+    broker.subscribe()
+    with pytest.raises(FeedFull):
+        broker.subscribe()
+    broker.unsubscribe(subscription)
+    broker.subscribe()
+    assert broker.num_subscriptions == 2
+
+
+def test_slow_subscriber_overflows() -> None:
+    """Tests that a subscriber whose buffer fills up is marked overflowed and
+    sent a reset event."""
+    broker = FeedBroker(buffer_size=2)
+    subscription = broker.subscribe()
+    for idx in range(3):
+        broker.publish(POST_CREATED, str(idx))
+    assert subscription.overflowed
+    assert len(subscription) == 0
+    messages = list(stream_events(broker, subscription, heartbeat_seconds=0))
+    assert messages[-1].startswith(f"event: {RESET}")
+    assert broker.num_subscriptions == 0
+
+
+def test_stream_events_sends_heartbeats() -> None:
+    """Tests that stream_events sends a heartbeat when idle and events as they
+    arrive."""
+    broker = FeedBroker()
+    subscription = broker.subscribe()
+    stream = stream_events(broker, subscription, heartbeat_seconds=0.01)
+    assert next(stream).startswith("retry:")
+    assert next(stream) == ": heartbeat\n\n"
+    event = broker.publish(POST_CREATED, "1")
+    assert next(stream) == event.to_sse()
+    stream.close()
+    assert broker.num_subscriptions == 0
+
+
+def test_socket_relay_forwards_events() -> None:
+    """Tests that events published on one broker are relayed to another, and
+    that sockets of exited workers are removed."""
+    sender = FeedBroker()
+    receiver = FeedBroker()
+    sender.relay = SocketRelay(sender, TEST_RELAY_DIR, name="sender")
+    receiver.relay = SocketRelay(receiver, TEST_RELAY_DIR, name="receiver")
+    # An exited worker leaves a bound socket file with no listener.
+    stale_path = os.path.join(TEST_RELAY_DIR, "stale.sock")
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as stale_socket:
+        stale_socket.bind(stale_path)
+    try:
+        subscription = receiver.subscribe()
+        event = sender.publish(POST_CREATED, "1")
+        received = None
+        deadline = time.monotonic() + 5
+        while received is None and time.monotonic() < deadline:
+            received = subscription.get(timeout=0.1)
+        assert received == event
+        assert not os.path.exists(stale_path)
+    finally:
+        sender.relay.close()
+        receiver.relay.close()
+
+
+def test_socket_relay_survives_malformed_datagrams() -> None:
+    """Tests that malformed datagrams are dropped and counted, and that
+    events relayed after them are still delivered."""
+    sender = FeedBroker()
+    receiver = FeedBroker()
+    sender.relay = SocketRelay(sender, TEST_RELAY_DIR, name="sender")
+    receiver.relay = SocketRelay(receiver, TEST_RELAY_DIR, name="receiver")
+    labels = {"reason": "malformed"}
+    before = REGISTRY.get_sample_value(
+        "populare_feed_relay_dropped_total",
+        labels
+    ) or 0
+    try:
+        subscription = receiver.subscribe()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as raw_socket:
+            for datagram in (b"not json", b"[1, 2]", b"\xff", b"7"):
+                raw_socket.sendto(datagram, receiver.relay.path)
+        event = sender.publish(POST_CREATED, "1")
+        received = None
+        deadline = time.monotonic() + 5
+        while received is None and time.monotonic() < deadline:
+            received = subscription.get(timeout=0.1)
+        assert received == event
+        assert REGISTRY.get_sample_value(
+            "populare_feed_relay_dropped_total",
+            labels
+        ) == before + 4
+    finally:
+        sender.relay.close()
+        receiver.relay.close()
+
+
+def test_db_ops_publish_after_commit(empty_local_db: Engine) -> None:
+    """Tests that db_ops writes publish feed events once committed.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    subscription = feed_broker.subscribe()
+    try:
+        post = Post(text="text", author="author", created_at=datetime.now())
+        with request_session():
+            create_post(post)
+            assert subscription.get(timeout=0) is None
+        created = subscription.get(timeout=0)
+        assert created.event_type == POST_CREATED
+        assert json.loads(created.data)["id"] == post.id
+        update_post(Post(
+            text="new",
+            author="author",
+            created_at=post.created_at,
+            id=post.id
+        ))
+        updated = subscription.get(timeout=0)
+        assert updated.event_type == POST_UPDATED
+        assert json.loads(updated.data)["text"] == "new"
+        delete_post(post.id)
+        deleted = subscription.get(timeout=0)
+        assert deleted.event_type == POST_DELETED
+        assert json.loads(deleted.data) == {"id": post.id}
+        delete_post(post.id)
+        assert subscription.get(timeout=0) is None
+    finally:
+        feed_broker.unsubscribe(subscription)
+
+
+def test_socket_relay_drops_events_it_cannot_send() -> None:
+    """Tests that an event too large to relay is dropped, not raised."""
+    sender = FeedBroker()
+    receiver = FeedBroker()
+    sender.relay = SocketRelay(sender, TEST_RELAY_DIR, name="sender")
+    receiver.relay = SocketRelay(receiver, TEST_RELAY_DIR, name="receiver")
+    try:
+        subscription = sender.subscribe()
+        event = sender.publish(POST_CREATED, "x" * (1 << 22))
+        assert subscription.get(timeout=0) == event
+        assert os.path.exists(receiver.relay.path)
+    finally:
+        sender.relay.close()
+        receiver.relay.close()
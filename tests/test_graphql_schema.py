@@ -5,8 +5,11 @@ tests that issue POST requests on the graphql endpoint directly.
 """
 
 from datetime import datetime
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
 from populare_db_proxy.app_data import db
-from populare_db_proxy.db_ops import READ_POSTS_LIMIT
+from populare_db_proxy.db_ops import READ_POSTS_LIMIT, read_posts_by_ids
 from populare_db_proxy.graphql_schema import get_schema
 
 
@@ -255,3 +258,239 @@ def test_resolve_delete_post_deletes_post() -> None:
     assert len(posts) == 4
     assert "text2" in posts[-1]
     assert "text5" in posts[0]
+
+
+def test_resolve_post_count_counts_posts() -> None:
+    """Tests that resolve_post_count returns the number of posts."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    for idx in range(3):
+        _ = schema.execute(f"""
+        {{
+            createPost
+            (
+                text: "text{idx + 1}",
+                author: "author",
+                createdAt: "{datetime.now().isoformat()}"
+            )
+        }}
+        """)
+    result = schema.execute("""
+    {
+        postCount
+    }
+    """)
+    assert result.data["postCount"] == 3
+
+
+def test_resolve_author_stats_returns_stats() -> None:
+    """Tests that resolve_author_stats returns per-author post counts."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    for idx in range(3):
+        _ = schema.execute(f"""
+        {{
+            createPost
+            (
+                text: "text{idx + 1}",
+                author: "author{idx % 2}",
+                createdAt: "{datetime.now().isoformat()}"
+            )
+        }}
+        """)
+    result = schema.execute("""
+    {
+        authorStats
+    }
+    """)
+    stats = [json.loads(stat) for stat in result.data["authorStats"]]
+    assert stats == [
+        {"author": "author0", "post_count": 2},
+        {"author": "author1", "post_count": 1}
+    ]
+
+
+def test_maintenance_jobs_are_not_queries() -> None:
+    """Tests that maintenance jobs, which scan or move every post, are run
+    from make targets rather than exposed as queries."""
+    schema = get_schema()
+    result = schema.execute("""
+    {
+        __type(name: "Query") {
+            fields { name }
+        }
+    }
+    """)
+    names = {field["name"] for field in result.data["__type"]["fields"]}
+    assert "postActivity" in names
+    assert not names & {
+        "reconcilePostCounts",
+        "backfillPostActivity",
+        "archivePosts"
+    }
+
+
+def test_resolve_post_activity_returns_buckets() -> None:
+    """Tests that resolve_post_activity returns bucketed post counts."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    for hour in (1, 1, 2):
+        _ = schema.execute(f"""
+        {{
+            createPost
+            (
+                text: "text",
+                author: "author",
+                createdAt: "2022-01-01T0{hour}:15:00"
+            )
+        }}
+        """)
+    result = schema.execute("""
+    {
+        postActivity
+        (
+            granularity: "hour",
+            from: "2022-01-01T00:00:00",
+            to: "2022-01-02T00:00:00"
+        )
+    }
+    """)
+    buckets = [json.loads(bucket) for bucket in result.data["postActivity"]]
+    assert buckets == [
+        {"bucket_start": "2022-01-01T01:00:00", "post_count": 2},
+        {"bucket_start": "2022-01-01T02:00:00", "post_count": 1}
+    ]
+
+
+def test_resolve_post_and_posts_batch_into_one_query() -> None:
+    """Tests that post and posts fields, including aliases, are resolved with
+    a single database query per request."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    for idx in range(3):
+        _ = schema.execute(f"""
+        {{
+            createPost
+            (
+                text: "text{idx + 1}",
+                author: "author",
+                createdAt: "{datetime.now().isoformat()}"
+            )
+        }}
+        """)
+    with patch(
+            "populare_db_proxy.graphql_schema.db_read_posts_by_ids",
+            wraps=read_posts_by_ids
+    ) as mock_read:
+        result = schema.execute("""
+        {
+            first: post(id: 1)
+            second: post(id: 2)
+            missing: post(id: 99)
+            posts(ids: [3, 1, 99])
+        }
+        """, context_value=SimpleNamespace())
+    assert mock_read.call_count == 1
+    assert json.loads(result.data["first"])["text"] == "text1"
+    assert json.loads(result.data["second"])["text"] == "text2"
+    assert result.data["missing"] is None
+    posts = result.data["posts"]
+    assert json.loads(posts[0])["text"] == "text3"
+    assert json.loads(posts[1])["text"] == "text1"
+    assert posts[2] is None
+
+
+def test_resolve_changes_since_returns_changes() -> None:
+    """Tests that resolve_changes_since returns changes and a cursor."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    _ = schema.execute("""
+    {
+        createPost
+        (
+            text: "text",
+            author: "author",
+            createdAt: "2022-01-01T00:00:00"
+        )
+    }
+    """)
+    _ = schema.execute("""
+    {
+        deletePost(postId: 1)
+    }
+    """)
+    result = schema.execute("""
+    {
+        changesSince(cursor: 0)
+        {
+            changes
+            cursor
+            reset
+        }
+    }
+    """)
+    change_set = result.data["changesSince"]
+    changes = [json.loads(change) for change in change_set["changes"]]
+    assert [change["operation"] for change in changes] == ["create", "delete"]
+    assert changes[0]["post"]["text"] == "text"
+    assert change_set["cursor"] == changes[-1]["seq"]
+    assert not change_set["reset"]
+
+
+def test_resolve_update_post_updates_only_supplied_fields() -> None:
+    """Tests that resolve_update_post accepts a subset of the fields and
+    returns null when no post matches."""
+    db.drop_all()
+    schema = get_schema()
+    _ = schema.execute("""
+    {
+        initDb
+    }
+    """)
+    _ = schema.execute("""
+    {
+        createPost(text: "text", author: "author",
+                   createdAt: "2006-01-02T15:04:05")
+    }
+    """)
+    result = schema.execute("""
+    {
+        updatePost(postId: 1, text: "fixed")
+    }
+    """)
+    post = json.loads(result.data["updatePost"])
+    assert post["text"] == "fixed"
+    assert post["author"] == "author"
+    assert post["created_at"] == "2006-01-02T15:04:05"
+    result = schema.execute("""
+    {
+        updatePost(postId: 2, text: "fixed")
+    }
+    """)
+    assert result.errors is None
+    assert result.data["updatePost"] is None
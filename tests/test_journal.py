@@ -0,0 +1,288 @@
+"""Tests journal.py."""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch
+import pytest
+from sqlalchemy.engine import Engine
+from populare_db_proxy import journal
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import (
+    create_journaled_posts,
+    reserve_journal_ids,
+    read_posts,
+    read_post_count
+)
+from populare_db_proxy.circuit import database_breaker
+from populare_db_proxy.graphql_schema import get_schema
+from populare_db_proxy.journal import (
+    WriteJournal,
+    JournalUnavailable,
+    create_post_durably,
+    create_write_journal,
+    journal_scope,
+    start_attempt
+)
+
+CREATED_AT = datetime(2022, 1, 1)
+
+
+def _post(text: str = "text") -> Post:
+    """Returns a new post.
+
+    :param text: The post's text.
+    :return: The post.
+    """
+    return Post(text=text, author="author", created_at=CREATED_AT)
+
+
+def _open_breaker() -> None:
+    """Opens the database circuit breaker."""
+    for _ in range(database_breaker.failure_threshold):
+        database_breaker.record_failure()
+
+
+def test_append_requires_reserved_ids(tmp_path: str) -> None:
+    """Tests that posts are assigned ids from the reserved block.
+
+    :param tmp_path: A temporary directory.
+    """
+    write_journal = WriteJournal(str(tmp_path))
+    with pytest.raises(JournalUnavailable):
+        write_journal.append(_post())
+    write_journal.add_ids(-1, -2)
+    assert write_journal.append(_post()).id == -1
+    assert write_journal.append(_post()).id == -2
+    with pytest.raises(JournalUnavailable):
+        write_journal.append(_post())
+    assert write_journal.backlog == 2
+    write_journal.close()
+
+
+def test_concurrent_appends_share_fsyncs(tmp_path: str) -> None:
+    """Tests that appends waiting on a sync are made durable together.
+
+    :param tmp_path: A temporary directory.
+    """
+    write_journal = WriteJournal(str(tmp_path))
+    write_journal.add_ids(-1, -100)
+    fsyncs = []
+
+    def slow_fsync(fileno: int) -> None:
+        """Records an fsync that takes a while."""
+        fsyncs.append(fileno)
+        time.sleep(0.05)
+
+    with patch("populare_db_proxy.journal.os.fsync", slow_fsync):
+        threads = [
+            threading.Thread(target=write_journal.append, args=(_post(),))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert write_journal.backlog == 8
+    assert len(fsyncs) < 8
+    write_journal.close()
+
+
+def test_reopen_recovers_backlog_and_ids(tmp_path: str) -> None:
+    """Tests that a reopened journal resumes where it left off.
+
+    :param tmp_path: A temporary directory.
+    """
+    write_journal = WriteJournal(str(tmp_path))
+    write_journal.add_ids(-1, -10)
+    write_journal.append(_post())
+    write_journal.append(_post())
+    write_journal.close()
+    # Simulate a crash in the middle of an append.
+    segment = os.path.join(str(tmp_path), "segment-0000000000.log")
+    with open(segment, "ab") as outfile:
+        outfile.write(b"0000 {\"post\"")
+    reopened = WriteJournal(str(tmp_path))
+    assert reopened.backlog == 2
+    assert reopened.remaining_ids == 8
+    assert reopened.append(_post()).id == -3
+    replayed = []
+    assert reopened.replay(replayed.extend) == 3
+    assert [post.id for post in replayed] == [-1, -2, -3]
+    reopened.close()
+
+
+def test_replay_rotates_and_checkpoints(tmp_path: str) -> None:
+    """Tests that replay resumes from its checkpoint across segments.
+
+    :param tmp_path: A temporary directory.
+    """
+    write_journal = WriteJournal(str(tmp_path), segment_bytes=200)
+    write_journal.add_ids(-1, -100)
+    for idx in range(10):
+        write_journal.append(_post(f"text{idx}"))
+    assert len(os.listdir(str(tmp_path))) > 3
+    replayed = []
+    assert write_journal.replay(replayed.extend, batch_size=4) == 10
+    assert [post.text for post in replayed] == \
+        [f"text{idx}" for idx in range(10)]
+    assert write_journal.backlog == 0
+    # Replayed segments are deleted, and nothing is replayed twice.
+    assert len(os.listdir(str(tmp_path))) <= 3
+    assert write_journal.replay(replayed.extend) == 0
+    write_journal.append(_post("after"))
+    write_journal.close()
+    reopened = WriteJournal(str(tmp_path), segment_bytes=200)
+    assert reopened.replay(replayed.extend) == 1
+    assert replayed[-1].text == "after"
+    reopened.close()
+
+
+def test_reserve_journal_ids_reserves_disjoint_blocks(
+        empty_local_db: Engine
+) -> None:
+    """Tests that reserved id blocks are negative and never overlap.
+
+    :param empty_local_db: The empty local database.
+    """
+    # pylint: disable=unused-argument
+    assert reserve_journal_ids(3) == (-1, -3)
+    assert reserve_journal_ids(2) == (-4, -5)
+
+
+def test_journal_accepts_posts_while_breaker_open(
+        empty_local_db: Engine,
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that posts are journaled during an outage and replayed after.
+
+    :param empty_local_db: The empty local database.
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    write_journal = WriteJournal(str(tmp_path))
+    write_journal.add_ids(*reserve_journal_ids(10))
+    monkeypatch.setattr(journal, "write_journal", write_journal)
+    assert create_post_durably(_post("healthy")).id == 1
+    _open_breaker()
+    post = create_post_durably(_post("outage"))
+    assert post.id == -1
+    database_breaker.reset()
+    assert read_post_count() == 1
+    assert write_journal.replay(create_journaled_posts) == 1
+    assert read_post_count() == 2
+    assert {row.id for row in read_posts()} == {1, -1}
+    # Replaying a batch again does not duplicate its posts.
+    duplicate = _post("outage")
+    duplicate.id = -1
+    assert create_journaled_posts([duplicate]) == 0
+    write_journal.close()
+
+
+def test_retried_request_journals_post_once(
+        empty_local_db: Engine,
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a retry of a request that journaled a post returns the
+    journaled post instead of adding it again, even once the breaker closes.
+
+    :param empty_local_db: The empty local database.
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    write_journal = WriteJournal(str(tmp_path))
+    write_journal.add_ids(*reserve_journal_ids(10))
+    monkeypatch.setattr(journal, "write_journal", write_journal)
+    _open_breaker()
+    with journal_scope():
+        for attempt in range(3):
+            start_attempt()
+            assert create_post_durably(_post("first")).id == -1
+            assert create_post_durably(_post("second")).id == -2
+            if attempt == 1:
+                database_breaker.reset()
+    assert write_journal.backlog == 2
+    assert read_post_count() == 0
+    assert write_journal.replay(create_journaled_posts) == 2
+    assert sorted(post.text for post in read_posts()) == ["first", "second"]
+    write_journal.close()
+
+
+def test_journaled_posts_keep_negative_ids(
+        empty_local_db: Engine,
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that the schema documents journaled posts' negative ids, and
+    that replayed posts are read by them.
+
+    :param empty_local_db: The empty local database.
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    write_journal = WriteJournal(str(tmp_path))
+    write_journal.add_ids(*reserve_journal_ids(10))
+    monkeypatch.setattr(journal, "write_journal", write_journal)
+    schema = get_schema()
+    result = schema.execute("""
+        {
+            __type(name: "Query") {
+                fields { name description }
+            }
+        }
+        """)
+    descriptions = {
+        field["name"]: field["description"]
+        for field in result.data["__type"]["fields"]
+    }
+    assert "negative ids" in descriptions["createPost"]
+    _open_breaker()
+    result = schema.execute("""
+        {
+            createPost(text: "outage", author: "author",
+                createdAt: "2022-01-01T00:00:00")
+        }
+        """)
+    assert json.loads(result.data["createPost"])["id"] == -1
+    database_breaker.reset()
+    write_journal.replay(create_journaled_posts)
+    result = schema.execute("{ post(id: -1) }")
+    assert json.loads(result.data["post"])["text"] == "outage"
+    write_journal.close()
+
+
+def test_create_write_journal_claims_separate_directories(
+        empty_local_db: Engine,
+        tmp_path: str
+) -> None:
+    """Tests that each worker's journal gets its own directory.
+
+    :param empty_local_db: The empty local database.
+    :param tmp_path: A temporary directory.
+    """
+    # pylint: disable=unused-argument
+    config = {
+        "JOURNAL_DIR": str(tmp_path),
+        "JOURNAL_SEGMENT_BYTES": 1024,
+        "JOURNAL_ID_BLOCK_SIZE": 10
+    }
+    assert create_write_journal({"JOURNAL_DIR": None}) is None
+    first = create_write_journal(config)
+    second = create_write_journal(config)
+    assert first.directory != second.directory
+    for write_journal in (first, second):
+        # The replayer reserves ids in the background.
+        for _ in range(100):
+            if write_journal.remaining_ids:
+                break
+            time.sleep(0.01)
+        assert write_journal.remaining_ids == 10
+        write_journal.close()
+        write_journal.lock_file.close()
@@ -0,0 +1,70 @@
+"""Tests memory.py."""
+
+from collections.abc import Iterator
+import pytest
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.memory import allocation_diffs, cache_sizes, \
+    live_instances, memory_report, register_cache, start_tracing, \
+    stop_tracing
+
+
+@pytest.fixture(name="tracing")
+def fixture_tracing() -> Iterator[None]:
+    """Traces allocations for the duration of a test."""
+    start_tracing()
+    yield
+    stop_tracing()
+
+
+def test_allocation_diffs_find_growth(tracing: None) -> None:
+    """Tests that allocations since the baseline are attributed to lines.
+
+    :param tracing: The tracing fixture.
+    """
+    # pylint: disable=unused-argument
+    retained = [bytearray(1024) for _ in range(1000)]
+    diffs = allocation_diffs(limit=3)
+    assert len(diffs) <= 3
+    assert "test_memory.py:" in diffs[0]["location"]
+    assert diffs[0]["size_diff_bytes"] >= 1024 * 1000
+    assert diffs[0]["count_diff"] >= 1000
+    assert len(retained) == 1000
+
+
+def test_restarting_resets_baseline(tracing: None) -> None:
+    """Tests that starting to trace again takes a new baseline.
+
+    :param tracing: The tracing fixture.
+    """
+    # pylint: disable=unused-argument
+    retained = [bytearray(1024) for _ in range(1000)]
+    start_tracing()
+    diffs = allocation_diffs()
+    assert all(diff["size_diff_bytes"] < 1024 * 1000 for diff in diffs)
+    assert len(retained) == 1000
+
+
+def test_no_diffs_without_tracing() -> None:
+    """Tests that reports omit allocations when not tracing."""
+    assert allocation_diffs() == []
+    report = memory_report({})
+    assert not report["tracing"]
+    assert report["traced_bytes"] == 0
+    assert report["max_rss_bytes"] > 0
+
+
+def test_live_instances_are_counted() -> None:
+    """Tests that live instances of each type are counted."""
+    before = live_instances({"Post": Post})["Post"]
+    posts = [Post(text="text", author="author") for _ in range(3)]
+    assert live_instances({"Post": Post}) == {"Post": before + 3}
+    assert len(posts) == 3
+
+
+def test_registered_caches_are_reported() -> None:
+    """Tests that registered caches report their sizes."""
+    entries = {"a": 1, "b": 2}
+    register_cache("test_cache", entries.__len__)
+    assert cache_sizes()["test_cache"] == 2
+    entries.clear()
+    assert memory_report({})["caches"]["test_cache"] == 0
@@ -0,0 +1,62 @@
+"""Tests multiprocess_metrics.py."""
+
+import os
+import subprocess
+import sys
+from populare_db_proxy.multiprocess_metrics import (
+    MULTIPROC_DIR_ENV,
+    build_registry,
+    mark_worker_dead,
+    reset_metrics_directory
+)
+
+# Records metrics as a worker would; prometheus_client must be imported after
+# the environment is set, so each worker is a separate interpreter.
+WORKER_SCRIPT = """
+import os
+import sys
+from prometheus_client import Counter, Gauge
+Counter("test_requests", "Requests").inc(int(sys.argv[1]))
+Gauge(
+    "test_in_flight", "In flight", multiprocess_mode="livesum"
+).set(int(sys.argv[1]))
+print(os.getpid())
+"""
+
+
+def _run_worker(directory: str, value: int) -> int:
+    """Records metrics in a separate process.
+
+    :param directory: The shared metrics directory.
+    :param value: The value to add to the counter and set on the gauge.
+    :return: The process's pid.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER_SCRIPT, str(value)],
+        env={**os.environ, MULTIPROC_DIR_ENV: directory},
+        capture_output=True,
+        check=True,
+        text=True
+    )
+    return int(result.stdout)
+
+
+def test_registry_merges_worker_metrics(tmp_path: str) -> None:
+    """Tests that metrics from all workers are merged, and that exited
+    workers' live gauges are dropped.
+
+    :param tmp_path: A temporary directory.
+    """
+    directory = os.path.join(str(tmp_path), "metrics")
+    reset_metrics_directory(directory)
+    first_pid = _run_worker(directory, 2)
+    _run_worker(directory, 3)
+    registry = build_registry(directory)
+    assert registry.get_sample_value("test_requests_total") == 5
+    assert registry.get_sample_value("test_in_flight") == 5
+    mark_worker_dead(first_pid, directory)
+    registry = build_registry(directory)
+    assert registry.get_sample_value("test_requests_total") == 5
+    assert registry.get_sample_value("test_in_flight") == 3
+    reset_metrics_directory(directory)
+    assert not os.listdir(directory)
@@ -0,0 +1,107 @@
+"""Tests post_cache.py."""
+
+from datetime import datetime
+from sqlalchemy.engine import Engine
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import read_posts, update_post, delete_post
+from populare_db_proxy.post_cache import PostPayloadCache, post_payloads
+
+
+def test_serialize_matches_repr_and_caches() -> None:
+    """Tests that serialize returns str(post) and reuses the payload."""
+    cache = PostPayloadCache()
+    post = Post(
+        id=1,
+        text="text",
+        author="author",
+        created_at=datetime(2022, 1, 1),
+        version=1
+    )
+    payload = cache.serialize(post)
+    assert payload == str(post)
+    post.text = "changed without a version bump"
+    assert cache.serialize(post) is payload
+
+
+def test_serialize_misses_on_new_version() -> None:
+    """Tests that a new version replaces the cached payload."""
+    cache = PostPayloadCache()
+    post = Post(id=1, text="old", author="a", created_at=datetime.now(),
+                version=1)
+    cache.serialize(post)
+    post.text = "new"
+    post.version = 2
+    assert '"new"' in cache.serialize(post)
+    assert len(cache) == 1
+
+
+def test_serialize_misses_on_reused_id() -> None:
+    """Tests that a new post that reuses a deleted post's id, at the same
+    version, does not get the deleted post's payload."""
+    cache = PostPayloadCache()
+    cache.serialize(Post(id=1, text="deleted", author="a",
+                         created_at=datetime(2022, 1, 1), version=1))
+    post = Post(id=1, text="new", author="a",
+                created_at=datetime(2022, 1, 2), version=1)
+    assert cache.serialize(post) == str(post)
+    assert len(cache) == 1
+
+
+def test_serialize_skips_posts_without_version() -> None:
+    """Tests that unsaved posts are serialized but not cached."""
+    cache = PostPayloadCache()
+    post = Post(text="text", author="a", created_at=datetime.now())
+    assert cache.serialize(post) == str(post)
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    """Tests that the cache is bounded."""
+    cache = PostPayloadCache(size=2)
+    posts = [
+        Post(id=idx, text="t", author="a", created_at=datetime.now(),
+             version=1)
+        for idx in range(3)
+    ]
+    cache.serialize(posts[0])
+    cache.serialize(posts[1])
+    cache.serialize(posts[0])
+    cache.serialize(posts[2])
+    assert len(cache) == 2
+    # pylint: disable=protected-access
+    assert list(cache._payloads) == [0, 2]
+
+
+def test_updates_invalidate_cached_payloads(
+        populated_local_db: Engine
+) -> None:
+    """Tests that an update is visible through the cache.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    post = read_posts(limit=1)[0]
+    post_payloads.serialize(post)
+    update_post(Post(
+        id=post.id,
+        text="new text",
+        author=post.author,
+        created_at=post.created_at
+    ))
+    updated = read_posts(limit=1)[0]
+    assert updated.version == post.version + 1
+    assert '"new text"' in post_payloads.serialize(updated)
+
+
+def test_deletes_discard_cached_payloads(populated_local_db: Engine) -> None:
+    """Tests that a deleted post's payload is discarded.
+
+    :param populated_local_db: The populated local database.
+    """
+    # pylint: disable=unused-argument
+    post_payloads.clear()
+    post = read_posts(limit=1)[0]
+    post_payloads.serialize(post)
+    delete_post(post.id)
+    # pylint: disable=protected-access
+    assert post.id not in post_payloads._payloads
@@ -0,0 +1,107 @@
+"""Tests profiling.py."""
+
+import os
+import time
+import pytest
+from flask import Response
+from populare_db_proxy.profiling import (
+    Profiler,
+    PROFILE_ID_HEADER,
+    RESOLVE,
+    SQL,
+    OTHER,
+    create_profiler,
+    profile_phase,
+    profiling_active
+)
+
+
+def test_phases_are_exclusive(tmp_path: str) -> None:
+    """Tests that time in a nested phase is not counted in the outer one.
+
+    :param tmp_path: A temporary directory.
+    """
+    profiler = Profiler(str(tmp_path))
+
+    def serve() -> Response:
+        """Spends time in a phase nested in another."""
+        assert profiling_active()
+        with profile_phase(RESOLVE):
+            time.sleep(0.02)
+            with profile_phase(SQL):
+                time.sleep(0.05)
+        return Response("ok")
+
+    response = profiler.run(serve, "header", {"path": "/test"})
+    profile = profiler.get_profile(response.headers[PROFILE_ID_HEADER])
+    phases = profile["phases_ms"]
+    assert 50 <= phases[SQL] < 70
+    assert 20 <= phases[RESOLVE] < 40
+    assert phases[OTHER] < 20
+    assert profile["path"] == "/test"
+    assert profile["status"] == 200
+    assert "serve" in profile["stats"]
+    assert not profiling_active()
+
+
+def test_ring_keeps_newest_profiles(tmp_path: str) -> None:
+    """Tests that the oldest profiles are evicted beyond the ring size.
+
+    :param tmp_path: A temporary directory.
+    """
+    profiler = Profiler(str(tmp_path), ring_size=3)
+    ids = [
+        profiler.run(lambda: Response("ok"), "sample", {}).headers[
+            PROFILE_ID_HEADER
+        ]
+        for _ in range(5)
+    ]
+    assert len(os.listdir(str(tmp_path))) == 3
+    assert [profile["id"] for profile in profiler.list_profiles()] == \
+        list(reversed(ids[2:]))
+    assert "stats" not in profiler.list_profiles()[0]
+    assert profiler.get_profile(ids[0]) is None
+    assert profiler.get_profile("../../etc/passwd") is None
+
+
+def test_trigger_requires_token_or_sample(
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that requests are profiled only with the token or by sampling.
+
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    profiler = Profiler(str(tmp_path), token="secret")
+    assert profiler.trigger("secret") == "header"
+    assert profiler.trigger("guess") is None
+    assert profiler.trigger(None) is None
+    assert not Profiler(str(tmp_path)).authorized("")
+    sampled = Profiler(str(tmp_path), sample_rate=0.5)
+    monkeypatch.setattr(
+        "populare_db_proxy.profiling.random.random",
+        lambda: 0.4
+    )
+    assert sampled.trigger(None) == "sample"
+    monkeypatch.setattr(
+        "populare_db_proxy.profiling.random.random",
+        lambda: 0.6
+    )
+    assert sampled.trigger(None) is None
+
+
+def test_create_profiler_requires_directory(tmp_path: str) -> None:
+    """Tests that profiling is disabled without a profile directory.
+
+    :param tmp_path: A temporary directory.
+    """
+    config = {
+        "PROFILE_DIR": None,
+        "PROFILE_RING_SIZE": 10,
+        "PROFILE_TOKEN": "secret",
+        "PROFILE_SAMPLE_RATE": 0.0
+    }
+    assert create_profiler(config) is None
+    config["PROFILE_DIR"] = str(tmp_path)
+    assert create_profiler(config).ring_size == 10
@@ -5,9 +5,22 @@ schema, are tested in isolation of Flask.
 """
 
 import json
+import os
+import pytest
 from flask import url_for
 from flask.testing import FlaskClient
-from populare_db_proxy.app_data import db
+from populare_db_proxy.app_data import app, db
+from populare_db_proxy.graphql_schema import get_schema
+from populare_db_proxy import journal
+from populare_db_proxy.feed import feed_broker, POST_CREATED
+from populare_db_proxy.admission import AdaptiveLimiter
+from populare_db_proxy.circuit import database_breaker
+from populare_db_proxy.rate_limit import RateLimiter, READ, WRITE
+from populare_db_proxy.profiling import Profiler
+from populare_db_proxy.encoding import CBOR_MIMETYPE, MSGPACK_MIMETYPE, \
+    decode_binary
+from populare_db_proxy.db_ops import create_journaled_posts, \
+    read_post_count, reserve_journal_ids
 
 
 def test_proxy_uses_cors_headers(client: FlaskClient) -> None:
@@ -258,3 +271,658 @@ def test_resolve_delete_post_returns_ok(client: FlaskClient) -> None:
     assert response.status_code == 200
     content = json.loads(response.text)
     assert content["data"]["deletePost"] == "ok"
+
+
+def test_resolve_posts_returns_posts(client: FlaskClient) -> None:
+    """Tests that a POST request on post and posts returns posts by id.
+
+    :param client: The flask client.
+    """
+    db.drop_all()
+    _ = client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    _ = client.post(
+        url_for('graphql'),
+        data="""
+        {
+            createPost
+            (
+                text: "my text",
+                author: "my author",
+                createdAt: "2006-01-02T15:04:05"
+            )
+        }
+        """,
+        content_type="application/graphql"
+    )
+    response = client.post(
+        url_for('graphql'),
+        data="{ post(id: 1) posts(ids: [1, 2]) }",
+        content_type="application/graphql"
+    )
+    assert response.status_code == 200
+    content = json.loads(response.text)
+    assert json.loads(content["data"]["post"])["text"] == "my text"
+    assert content["data"]["posts"][1] is None
+
+
+def test_batched_operations_execute_in_order(client: FlaskClient) -> None:
+    """Tests that a JSON array of operations is executed in order in one
+    request.
+
+    :param client: The flask client.
+    """
+    db.drop_all()
+    response = client.post(
+        url_for('graphql'),
+        data=json.dumps([
+            {"query": "{ initDb }"},
+            {"query": """
+            {
+                createPost
+                (
+                    text: "my text",
+                    author: "my author",
+                    createdAt: "2006-01-02T15:04:05"
+                )
+            }
+            """},
+            {"query": "{ readPosts }"},
+            {"query": "{ postCount }"}
+        ]),
+        content_type="application/json"
+    )
+    assert response.status_code == 200
+    content = json.loads(response.text)
+    assert len(content) == 4
+    assert content[0]["data"]["initDb"] == "ok"
+    posts = [json.loads(post) for post in content[2]["data"]["readPosts"]]
+    assert posts[0]["text"] == "my text"
+    assert content[3]["data"]["postCount"] == 1
+
+
+def test_feed_stream_sends_events(client: FlaskClient) -> None:
+    """Tests that the feed stream endpoint streams published events.
+
+    :param client: The flask client.
+    """
+    response = client.get(url_for('feed_stream'), buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    stream = iter(response.response)
+    assert next(stream).startswith(b"retry:")
+    event = feed_broker.publish(POST_CREATED, "{}")
+    assert next(stream) == event.to_sse().encode("utf-8")
+    response.close()
+
+
+def test_feed_stream_resumes_from_last_event_id(client: FlaskClient) -> None:
+    """Tests that the feed stream replays events after Last-Event-ID.
+
+    :param client: The flask client.
+    """
+    event1 = feed_broker.publish(POST_CREATED, "{}")
+    event2 = feed_broker.publish(POST_CREATED, "{}")
+    response = client.get(
+        url_for('feed_stream'),
+        headers={"Last-Event-ID": str(event1.event_id)},
+        buffered=False
+    )
+    stream = iter(response.response)
+    next(stream)
+    assert next(stream) == event2.to_sse().encode("utf-8")
+    response.close()
+
+
+def test_feed_stream_rejects_streams_past_maximum(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a worker with its maximum number of streams responds 503.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr(feed_broker, "max_subscriptions", 1)
+    response = client.get(url_for('feed_stream'), buffered=False)
+    assert response.status_code == 200
+    rejected = client.get(url_for('feed_stream'))
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    # The stream's place is freed once it closes, even if it never started.
+    response.close()
+    assert feed_broker.num_subscriptions == 0
+
+
+def test_rate_limited_client_gets_429_with_retry_after(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a client over its read budget is rejected with 429.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr(
+        "populare_db_proxy.proxy.rate_limiter",
+        RateLimiter({READ: (0.1, 2), WRITE: (0.1, 1)})
+    )
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    responses = [client.post(
+        url_for('graphql'),
+        data="{ postCount }",
+        content_type="application/graphql"
+    ) for _ in range(3)]
+    assert [response.status_code for response in responses] == \
+           [200, 200, 429]
+    assert responses[2].headers["Retry-After"] == "10"
+    assert "errors" in json.loads(responses[2].text)
+
+
+def test_rate_limit_charges_writes_separately(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that exhausting the write budget does not block reads.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr(
+        "populare_db_proxy.proxy.rate_limiter",
+        RateLimiter({READ: (0.1, 5), WRITE: (0.1, 1)})
+    )
+    statuses = [client.post(
+        url_for('graphql'),
+        data=query,
+        content_type="application/graphql"
+    ).status_code for query in ("{ initDb }", "{ initDb }", "{ postCount }")]
+    assert statuses == [200, 429, 200]
+
+
+def test_rate_limit_charges_each_batched_operation(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a batch is charged for each of its operations.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    monkeypatch.setattr(
+        "populare_db_proxy.proxy.rate_limiter",
+        RateLimiter({READ: (0.1, 3), WRITE: (0.1, 3)})
+    )
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    batch = json.dumps([{"query": "{ postCount }"}] * 2)
+    statuses = [client.post(
+        url_for('graphql'),
+        data=batch,
+        content_type="application/json"
+    ).status_code for _ in range(2)]
+    assert statuses == [200, 429]
+
+
+def test_overloaded_request_is_shed_with_503(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that requests over the admission limit are shed with 503.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    limiter = AdaptiveLimiter(initial_limit=1, queue_size=0)
+    monkeypatch.setattr("populare_db_proxy.proxy.admission_limiter", limiter)
+    limiter.acquire()
+    response = client.post(
+        url_for('graphql'),
+        data="{ postCount }",
+        content_type="application/graphql"
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    limiter.release(0.01)
+    assert client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    ).status_code == 200
+    assert limiter.in_flight == 0
+
+
+def test_stale_response_is_marked_in_extensions(client: FlaskClient) -> None:
+    """Tests that responses served from stale pages say so.
+
+    :param client: The flask client.
+    """
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    fresh = json.loads(client.post(
+        url_for('graphql'),
+        data="{ readPosts }",
+        content_type="application/graphql"
+    ).text)
+    assert "extensions" not in fresh
+    for _ in range(database_breaker.failure_threshold):
+        database_breaker.record_failure()
+    stale = json.loads(client.post(
+        url_for('graphql'),
+        data="{ readPosts }",
+        content_type="application/graphql"
+    ).text)
+    assert stale["data"] == fresh["data"]
+    assert stale["extensions"] == {"stale": True}
+
+
+def test_retried_request_journals_post_once(
+        client: FlaskClient,
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a request retried after a transient error does not journal
+    its post again.
+
+    :param client: The flask client.
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    db.drop_all()
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    write_journal = journal.WriteJournal(str(tmp_path))
+    write_journal.add_ids(*reserve_journal_ids(10))
+    monkeypatch.setattr(journal, "write_journal", write_journal)
+    calls = []
+
+    def transient_once() -> bool:
+        """Reports a transient error for the first attempt only."""
+        calls.append(None)
+        return len(calls) <= 2
+
+    monkeypatch.setattr(
+        "populare_db_proxy.proxy.transient_error_seen",
+        transient_once
+    )
+    monkeypatch.setattr(
+        "populare_db_proxy.deadline.transient_error_seen",
+        transient_once
+    )
+    for _ in range(database_breaker.failure_threshold):
+        database_breaker.record_failure()
+    response = client.post("/posts", json={
+        "text": "my text",
+        "author": "my author",
+        "created_at": "2022-01-01T00:00:00"
+    })
+    assert response.status_code == 201
+    assert json.loads(response.text)["id"] == -1
+    assert len(calls) == 3
+    assert write_journal.backlog == 1
+    database_breaker.reset()
+    assert write_journal.replay(create_journaled_posts) == 1
+    assert read_post_count() == 1
+    write_journal.close()
+
+
+def test_request_past_deadline_gets_504(client: FlaskClient) -> None:
+    """Tests that a request whose timeout header has passed gets 504.
+
+    :param client: The flask client.
+    """
+    db.drop_all()
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    response = client.post(
+        url_for('graphql'),
+        data="""
+        {
+            createPost
+            (
+                text: "my text",
+                author: "my author",
+                createdAt: "2006-01-02T15:04:05"
+            )
+        }
+        """,
+        content_type="application/graphql",
+        headers={"X-Request-Timeout": "0.000001"}
+    )
+    assert response.status_code == 504
+    assert json.loads(client.post(
+        url_for('graphql'),
+        data="{ postCount }",
+        content_type="application/graphql",
+        headers={"X-Request-Timeout": "not a number"}
+    ).text)["data"]["postCount"] == 0
+
+
+def test_rest_posts_crud(client: FlaskClient) -> None:
+    """Tests creating, reading, updating, and deleting posts through REST.
+
+    :param client: The flask client.
+    """
+    db.drop_all()
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    response = client.post("/posts", json={
+        "text": "my text",
+        "author": "my author",
+        "created_at": "2006-01-02T15:04:05"
+    })
+    assert response.status_code == 201
+    post = response.get_json()
+    assert post["text"] == "my text"
+    assert response.headers["Location"].endswith(f"/posts/{post['id']}")
+    assert "no-store" in response.headers["Cache-Control"]
+    assert client.get(f"/posts/{post['id']}").get_json() == post
+    response = client.patch(f"/posts/{post['id']}", json={"text": "new"})
+    assert response.status_code == 200
+    assert response.get_json()["text"] == "new"
+    assert response.get_json()["author"] == "my author"
+    assert client.delete(f"/posts/{post['id']}").status_code == 204
+    assert client.get(f"/posts/{post['id']}").status_code == 404
+    assert client.patch(f"/posts/{post['id']}", json={}).status_code == 404
+
+
+def test_rest_list_posts_matches_graphql(client: FlaskClient) -> None:
+    """Tests that the REST feed returns the same posts as readPosts.
+
+    :param client: The flask client.
+    """
+    db.drop_all()
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    for idx in range(3):
+        client.post("/posts", json={
+            "text": f"text{idx}",
+            "author": "author",
+            "created_at": f"2006-01-0{idx + 1}T00:00:00"
+        })
+    graphql_posts = [json.loads(post) for post in json.loads(client.post(
+        url_for('graphql'),
+        data="{ readPosts(limit: 2) }",
+        content_type="application/graphql"
+    ).text)["data"]["readPosts"]]
+    assert client.get("/posts?limit=2").get_json() == graphql_posts
+    older = client.get("/posts?before=2006-01-03T00:00:00").get_json()
+    assert [post["text"] for post in older] == ["text1", "text0"]
+
+
+def test_rest_list_posts_is_cacheable(client: FlaskClient) -> None:
+    """Tests that feed pages carry an ETag and revalidate with 304.
+
+    :param client: The flask client.
+    """
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    response = client.get("/posts")
+    assert response.status_code == 200
+    assert "max-age=1" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+    revalidated = client.get("/posts", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert not revalidated.data
+
+
+def test_rest_rejects_invalid_requests(client: FlaskClient) -> None:
+    """Tests that malformed REST requests get 400.
+
+    :param client: The flask client.
+    """
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    assert client.get("/posts?limit=many").status_code == 400
+    assert client.get("/posts?limit=0").status_code == 400
+    assert client.get("/posts?before=yesterday").status_code == 400
+    assert client.post("/posts", json={"text": "text"}).status_code == 400
+    assert client.post("/posts", json={
+        "text": "text",
+        "author": "author",
+        "created_at": "not a date"
+    }).status_code == 400
+    assert client.patch("/posts/1", json={"id": 2}).status_code == 400
+    assert client.patch("/posts/1", data="text").status_code == 400
+
+
+def test_rest_requests_are_rate_limited(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that REST requests spend the client's rate limit budgets.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    limiter = RateLimiter({READ: (0.1, 1), WRITE: (0.1, 1)})
+    monkeypatch.setattr("populare_db_proxy.proxy.rate_limiter", limiter)
+    assert client.get("/posts").status_code == 200
+    assert client.get("/posts").status_code == 429
+    assert client.delete("/posts/1").status_code == 204
+    assert client.delete("/posts/1").status_code == 429
+
+
+@pytest.mark.parametrize("mimetype", [MSGPACK_MIMETYPE, CBOR_MIMETYPE])
+def test_graphql_binary_response_has_native_posts(
+        client: FlaskClient,
+        mimetype: str
+) -> None:
+    """Tests that binary responses encode posts as maps.
+
+    :param client: The flask client.
+    :param mimetype: The binary format.
+    """
+    db.drop_all()
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    client.post("/posts", json={
+        "text": "my text",
+        "author": "my author",
+        "created_at": "1970-01-02T00:00:00"
+    })
+    response = client.post(
+        url_for('graphql'),
+        data="{ readPosts post(id: 1) }",
+        content_type="application/graphql",
+        headers={"Accept": mimetype}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    post = {
+        "id": 1,
+        "text": "my text",
+        "author": "my author",
+        "created_at": 86400 * 1000000
+    }
+    assert decode_binary(response.data, mimetype) == \
+        {"data": {"readPosts": [post], "post": post}}
+    errors = client.post(
+        url_for('graphql'),
+        data="{ noSuchField }",
+        content_type="application/graphql",
+        headers={"Accept": mimetype}
+    )
+    assert errors.mimetype == mimetype
+    assert "errors" in decode_binary(errors.data, mimetype)
+    schema = client.post(
+        url_for('graphql'),
+        data='{ __type(name: "Query") { fields { name type { name } } } }',
+        content_type="application/graphql",
+        headers={"Accept": mimetype}
+    )
+    field_types = {
+        field["name"]: field["type"]["name"]
+        for field in decode_binary(schema.data, mimetype)["data"]["__type"][
+            "fields"
+        ]
+    }
+    assert field_types["post"] == "String"
+    assert field_types["createPost"] == "String"
+
+
+def test_graphql_view_is_not_changed_by_requests(client: FlaskClient) -> None:
+    """Tests that a view instance serves each request in its own format,
+    without keeping state from earlier requests.
+
+    :param client: The flask client.
+    """
+    # pylint: disable=unused-argument
+    view = app.view_functions["graphql"].view_class(schema=get_schema())
+    results = []
+    for accept in (MSGPACK_MIMETYPE, "application/json"):
+        with app.test_request_context(
+                url_for('graphql'),
+                method="POST",
+                data="{ postCount }",
+                content_type="application/graphql",
+                headers={"Accept": accept}
+        ):
+            response = view.dispatch_request()
+        assert response.mimetype == accept
+        assert "encode" not in vars(view)
+        results.append(response.get_data())
+    assert decode_binary(results[0], MSGPACK_MIMETYPE) == \
+        json.loads(results[1])
+
+
+def test_profiled_request_is_fetched_from_admin_endpoint(
+        client: FlaskClient,
+        tmp_path: str,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that requests with the profile token are profiled by phase.
+
+    :param client: The flask client.
+    :param tmp_path: A temporary directory.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    assert client.get("/admin/profiles").status_code == 404
+    monkeypatch.setattr(
+        "populare_db_proxy.proxy.profiler",
+        Profiler(str(tmp_path), token="secret")
+    )
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    client.post("/posts", json={
+        "text": "my text",
+        "author": "my author",
+        "created_at": "2006-01-02T15:04:05"
+    })
+    unprofiled = client.post(
+        url_for('graphql'),
+        data="{ readPosts }",
+        content_type="application/graphql"
+    )
+    assert "X-Profile-Id" not in unprofiled.headers
+    response = client.post(
+        url_for('graphql'),
+        data="{ readPosts }",
+        content_type="application/graphql",
+        headers={"X-Profile-Token": "secret"}
+    )
+    assert response.text == unprofiled.text
+    profile_id = response.headers["X-Profile-Id"]
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get(
+        "/admin/profiles",
+        headers={"X-Profile-Token": "wrong"}
+    ).status_code == 403
+    summaries = client.get(
+        "/admin/profiles",
+        headers={"X-Profile-Token": "secret"}
+    ).get_json()
+    assert [summary["id"] for summary in summaries] == [profile_id]
+    profile = client.get(
+        f"/admin/profiles/{profile_id}",
+        headers={"X-Profile-Token": "secret"}
+    ).get_json()
+    assert profile["body"] == "{ readPosts }"
+    assert set(profile["phases_ms"]) == \
+        {"parse", "validate", "resolve", "sql", "serialize", "other"}
+    assert "execute" in profile["stats"]
+    assert client.get(
+        "/admin/profiles/00000000000000000000-1",
+        headers={"X-Profile-Token": "secret"}
+    ).status_code == 404
+
+
+def test_memory_endpoints_trace_allocations(
+        client: FlaskClient,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that the memory endpoints trace and report allocations.
+
+    :param client: The flask client.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    assert client.get("/admin/memory").status_code == 404
+    monkeypatch.setitem(app.config, "PROFILE_TOKEN", "secret")
+    headers = {"X-Profile-Token": "secret"}
+    assert client.get("/admin/memory").status_code == 403
+    client.post(
+        url_for('graphql'),
+        data="{ initDb }",
+        content_type="application/graphql"
+    )
+    started = client.post("/admin/memory/tracing", headers=headers)
+    try:
+        assert started.get_json() == {"pid": os.getpid(), "tracing": True}
+        client.post("/posts", json={
+            "text": "my text",
+            "author": "my author",
+            "created_at": "2006-01-02T15:04:05"
+        })
+        client.get("/posts", headers=headers)
+        report = client.get(
+            "/admin/memory?limit=5",
+            headers=headers
+        ).get_json()
+        assert report["tracing"]
+        assert 0 < len(report["top_allocation_diffs"]) <= 5
+        assert report["live_objects"]["Post"] >= 0
+        assert "post_payloads" in report["caches"]
+        assert "stale_feed_pages" in report["caches"]
+    finally:
+        stopped = client.delete("/admin/memory/tracing", headers=headers)
+    assert not stopped.get_json()["tracing"]
+    report = client.get("/admin/memory", headers=headers).get_json()
+    assert not report["tracing"]
+    assert report["top_allocation_diffs"] == []
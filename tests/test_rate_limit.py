@@ -0,0 +1,131 @@
+"""Tests rate_limit.py."""
+
+import os
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+from populare_db_proxy.rate_limit import (
+    TokenBucket,
+    SharedBucketStore,
+    RateLimiter,
+    classify_operations,
+    get_client_identity,
+    retry_after_header,
+    READ,
+    WRITE
+)
+
+TEST_STORE_PATH = "/tmp/populare-db-proxy/test_rate_limit/buckets.db"
+
+
+def test_token_bucket_admits_burst_then_throttles() -> None:
+    """Tests that a bucket admits its capacity, then gives a retry delay."""
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    assert [bucket.take(now=now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now=now) == 0.5
+
+
+def test_token_bucket_refills_over_time() -> None:
+    """Tests that a bucket refills at its rate, up to its capacity."""
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        bucket.take(now=now)
+    assert bucket.take(now=now + 0.5) == 0
+    assert bucket.take(now=now + 0.5) > 0
+    bucket.take(now=now + 100)
+    assert bucket.tokens == 2
+
+
+def test_rate_limiter_separates_clients_and_kinds() -> None:
+    """Tests that each client has independent read and write budgets."""
+    limiter = RateLimiter({READ: (0.001, 2), WRITE: (0.001, 1)})
+    assert limiter.take("alice", WRITE) == 0
+    assert limiter.take("alice", WRITE) > 0
+    assert limiter.take("alice", READ) == 0
+    assert limiter.take("bob", WRITE) == 0
+
+
+def test_rate_limiter_counts_throttled_requests() -> None:
+    """Tests that rejected requests are counted by kind."""
+    limiter = RateLimiter({READ: (0.001, 1), WRITE: (0.001, 1)})
+    labels = {"kind": READ}
+    before = REGISTRY.get_sample_value(
+        "populare_rate_limited_requests_total", labels) or 0
+    limiter.take("alice", READ)
+    limiter.take("alice", READ)
+    assert REGISTRY.get_sample_value(
+        "populare_rate_limited_requests_total", labels) == before + 1
+
+
+def test_rate_limiter_evicts_least_recent_clients() -> None:
+    """Tests that the number of in-process buckets is bounded."""
+    limiter = RateLimiter({READ: (1, 1), WRITE: (1, 1)}, max_clients=2)
+    for client in ("alice", "bob", "carol"):
+        limiter.take(client, READ)
+    assert len(limiter) == 2
+
+
+def test_rate_limiter_admits_batch_larger_than_burst() -> None:
+    """Tests that a batch larger than the burst size can be admitted."""
+    limiter = RateLimiter({READ: (1, 2), WRITE: (1, 2)})
+    assert limiter.take("alice", READ, cost=5) == 0
+
+
+def test_rate_limiter_rejects_non_positive_limits() -> None:
+    """Tests that a zero rate or burst, which would never refill or admit
+    a request, is rejected when the limiter is configured."""
+    with pytest.raises(ValueError):
+        RateLimiter({READ: (1, 1), WRITE: (0, 1)})
+    with pytest.raises(ValueError):
+        RateLimiter({READ: (1, 0), WRITE: (1, 1)})
+
+
+def test_shared_store_is_shared_between_limiters() -> None:
+    """Tests that limiters using the same store share budgets."""
+    if os.path.exists(TEST_STORE_PATH):
+        os.remove(TEST_STORE_PATH)
+    limits = {READ: (0.001, 2), WRITE: (0.001, 2)}
+    limiter1 = RateLimiter(limits, store=SharedBucketStore(TEST_STORE_PATH))
+    limiter2 = RateLimiter(limits, store=SharedBucketStore(TEST_STORE_PATH))
+    assert limiter1.take("alice", READ) == 0
+    assert limiter2.take("alice", READ) == 0
+    assert limiter1.take("alice", READ) > 0
+    assert limiter2.take("bob", READ) == 0
+
+
+def test_classify_operations_counts_reads_and_writes() -> None:
+    """Tests that documents with write fields are classified as writes."""
+    assert classify_operations([
+        "{ readPosts }",
+        '{ createPost(text: "t", author: "a", createdAt: "2022") }',
+        "mutation { deletePost(postId: 1) }",
+        "{ postCount }"
+    ]) == {READ: 2, WRITE: 2}
+
+
+def test_get_client_identity_prefers_header_then_key_then_ip() -> None:
+    """Tests the precedence of client identities."""
+    app = Flask(__name__)
+    with app.test_request_context(
+            headers={"X-Forwarded-For": "1.2.3.4, 10.0.0.1",
+                     "X-API-Key": "secret"},
+            environ_base={"REMOTE_ADDR": "10.0.0.2"}
+    ) as context:
+        identity = get_client_identity(context.request, "X-Forwarded-For")
+        assert identity == "header:1.2.3.4"
+        identity = get_client_identity(context.request)
+        assert identity.startswith("key:")
+        assert "secret" not in identity
+    with app.test_request_context(
+            environ_base={"REMOTE_ADDR": "10.0.0.2"}
+    ) as context:
+        identity = get_client_identity(context.request, "X-Forwarded-For")
+        assert identity == "ip:10.0.0.2"
+
+
+def test_retry_after_header_rounds_up_to_whole_seconds() -> None:
+    """Tests that Retry-After is a positive whole number of seconds."""
+    assert retry_after_header(0.01) == "1"
+    assert retry_after_header(2.5) == "3"
@@ -0,0 +1,182 @@
+"""Tests recent_posts.py."""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+from populare_db_proxy import db_ops
+from populare_db_proxy.db_schema import Author, Post, PostRow
+from populare_db_proxy.db_ops import (
+    create_post,
+    read_posts,
+    update_post_fields,
+    delete_post
+)
+from populare_db_proxy.recent_posts import RecentPostsBuffer
+from populare_db_proxy.sessions import request_session
+
+START = datetime(2022, 1, 1)
+
+
+def _row(post_id: int, minutes: int = 0) -> PostRow:
+    """Returns a post created some minutes after START.
+
+    :param post_id: The post's id.
+    :param minutes: The number of minutes after START the post was created;
+        defaults to the post's id.
+    :return: The post.
+    """
+    created_at = START + timedelta(minutes=minutes or post_id)
+    return PostRow(post_id, f"text{post_id}", "author", created_at, 1)
+
+
+@pytest.fixture(name="buffer")
+def fixture_buffer(monkeypatch: pytest.MonkeyPatch) -> RecentPostsBuffer:
+    """Installs a small recent posts buffer that reconciles on every read.
+
+    :param monkeypatch: The pytest monkeypatch fixture.
+    :return: The buffer.
+    """
+    buffer = RecentPostsBuffer(size=5, reconcile_seconds=0)
+    monkeypatch.setattr(db_ops, "recent_posts", buffer)
+    return buffer
+
+
+def test_read_requires_load() -> None:
+    """Tests that an unloaded buffer answers no reads."""
+    buffer = RecentPostsBuffer(size=3)
+    assert buffer.read(limit=1) is None
+    buffer.load([_row(1), _row(2)], cursor=0)
+    assert [post.id for post in buffer.read(limit=5)] == [2, 1]
+    older = buffer.read(limit=5, before=_row(2).created_at)
+    assert [post.id for post in older] == [1]
+
+
+def test_read_outside_full_buffer_misses() -> None:
+    """Tests that reads reaching past the oldest buffered post miss."""
+    buffer = RecentPostsBuffer(size=3)
+    buffer.load([_row(3), _row(2), _row(1)], cursor=0)
+    assert [post.id for post in buffer.read(limit=3)] == [3, 2, 1]
+    assert buffer.read(limit=4) is None
+    assert [post.id for post in buffer.read(2, _row(3).created_at)] == [2, 1]
+    assert buffer.read(3, _row(3).created_at) is None
+
+
+def test_apply_local_inserts_and_evicts() -> None:
+    """Tests that local writes are applied in (created_at, id) order."""
+    buffer = RecentPostsBuffer(size=3)
+    buffer.load([_row(1), _row(2), _row(3)], cursor=10)
+    buffer.apply_local([
+        (11, 4, _row(4)),
+        (12, 5, _row(5, minutes=4)),
+        (13, 2, None),
+        # Older than the floor, so it is not buffered.
+        (14, 6, _row(6, minutes=-1))
+    ])
+    assert [post.id for post in buffer.read(limit=3)] == [5, 4, 3]
+    assert buffer.read(limit=4) is None
+
+
+def test_sync_reconciles_in_change_log_order() -> None:
+    """Tests that logged changes older than a local write do not undo it."""
+    buffer = RecentPostsBuffer(size=3, reconcile_seconds=0)
+    loads = []
+
+    def load_rows(size: int) -> tuple[int, list[PostRow]]:
+        """Returns the cursor and posts to load."""
+        loads.append(size)
+        return 5, [_row(1)]
+
+    buffer.sync(load_rows, lambda cursor, limit: ([], cursor, False))
+    assert loads == [3]
+    buffer.apply_local([(8, 1, _row(1)._replace(text="newest"))])
+    logged = [
+        (6, 2, _row(2)),
+        (7, 1, _row(1)._replace(text="older"))
+    ]
+    buffer.sync(load_rows, lambda cursor, limit: (logged, 7, False))
+    assert [post.text for post in buffer.read(limit=3)] == ["text2", "newest"]
+    buffer.sync(load_rows, lambda cursor, limit: ([], cursor, True))
+    assert loads == [3, 3]
+    assert [post.id for post in buffer.read(limit=3)] == [1]
+
+
+def test_read_posts_served_from_buffer(
+        populated_local_db: Engine,
+        buffer: RecentPostsBuffer
+) -> None:
+    """Tests that read_posts answers from memory once the buffer is loaded.
+
+    :param populated_local_db: The local database with 5 posts.
+    :param buffer: The recent posts buffer.
+    """
+    assert len(read_posts(limit=3)) == 3
+    assert buffer.loaded
+    # Writes that bypass db_ops are not seen.
+    with populated_local_db.begin() as connection:
+        connection.execute(insert(Post.__table__).values(
+            text="bypass",
+            author_id=select(Author.id)
+                .where(Author.name == "author0")
+                .scalar_subquery(),
+            created_at=datetime.now() - timedelta(seconds=1)
+        ))
+    assert "bypass" not in [post.text for post in read_posts(limit=3)]
+    # Writes through db_ops are seen immediately.
+    post = create_post(Post(
+        text="new",
+        author="author",
+        created_at=datetime.now()
+    ))
+    assert read_posts(limit=1)[0].id == post.id
+    update_post_fields(post.id, text="edited")
+    assert read_posts(limit=1)[0].text == "edited"
+    delete_post(post.id)
+    assert post.id not in [row.id for row in read_posts(limit=5)]
+
+
+def test_read_posts_reconciles_other_workers_writes(
+        empty_local_db: Engine,
+        buffer: RecentPostsBuffer,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that writes by other workers are applied from the change log.
+
+    :param empty_local_db: The empty local database.
+    :param buffer: The recent posts buffer.
+    :param monkeypatch: The pytest monkeypatch fixture.
+    """
+    # pylint: disable=unused-argument
+    assert not read_posts()
+    assert buffer.loaded
+    # Another worker does not apply its writes to this worker's buffer.
+    with monkeypatch.context() as other_worker:
+        other_worker.setattr(db_ops, "recent_posts", RecentPostsBuffer(0))
+        post = create_post(Post(
+            text="elsewhere",
+            author="author",
+            created_at=datetime.now() - timedelta(seconds=1)
+        ))
+    assert [row.id for row in read_posts()] == [post.id]
+
+
+def test_request_with_writes_bypasses_buffer(
+        empty_local_db: Engine,
+        buffer: RecentPostsBuffer
+) -> None:
+    """Tests that a request sees its uncommitted writes.
+
+    :param empty_local_db: The empty local database.
+    :param buffer: The recent posts buffer.
+    """
+    # pylint: disable=unused-argument
+    assert not read_posts()
+    with request_session():
+        create_post(Post(
+            text="uncommitted",
+            author="author",
+            created_at=datetime.now() - timedelta(seconds=1)
+        ))
+        assert len(read_posts()) == 1
+        assert len(buffer.read(limit=5)) == 0
+    assert len(buffer.read(limit=5)) == 1
@@ -0,0 +1,177 @@
+"""Tests retention.py."""
+
+import os
+from datetime import datetime
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.engine import Engine
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import (
+    create_posts,
+    delete_posts,
+    read_posts,
+    read_post_count,
+    reconcile_post_counts
+)
+from populare_db_proxy.archive import archive_posts
+from populare_db_proxy.retention import purge_expired_posts
+
+TEST_CHECKPOINT_PATH = "/tmp/populare-db-proxy/test_retention/checkpoint.json"
+CUTOFF = datetime(2022, 1, 11)
+PURGED_POSTS_METRIC = "populare_retention_purged_posts_total"
+
+
+@pytest.fixture(name="checkpoint_path")
+def fixture_checkpoint_path() -> str:
+    """Returns a checkpoint path with no existing checkpoint.
+
+    :return: The checkpoint path.
+    """
+    if os.path.exists(TEST_CHECKPOINT_PATH):
+        os.remove(TEST_CHECKPOINT_PATH)
+    yield TEST_CHECKPOINT_PATH
+    if os.path.exists(TEST_CHECKPOINT_PATH):
+        os.remove(TEST_CHECKPOINT_PATH)
+
+
+@pytest.fixture(name="dated_local_db")
+def fixture_dated_local_db(empty_local_db: Engine) -> Engine:
+    """Creates a local database with one post per day in January 2022.
+
+    :return: A connection to the local database.
+    """
+    create_posts([
+        Post(text=str(day), author="author", created_at=datetime(2022, 1, day))
+        for day in range(1, 32)
+    ])
+    yield empty_local_db
+
+
+def test_delete_posts_deletes_posts(empty_local_db: Engine) -> None:
+    """Tests that delete_posts deletes only existing posts and updates the
+    counts.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    posts = create_posts([
+        Post(text=str(idx), author="author", created_at=datetime.now())
+        for idx in range(3)
+    ])
+    assert delete_posts([posts[0].id, posts[1].id, 999]) == 2
+    assert [post.text for post in read_posts()] == ["2"]
+    assert read_post_count() == 1
+
+
+def test_purge_deletes_expired_posts(
+        dated_local_db: Engine,
+        checkpoint_path: str
+) -> None:
+    """Tests that purge_expired_posts deletes exactly the expired posts, in
+    chunks.
+
+    :param dated_local_db: A connection to the local database.
+    :param checkpoint_path: The checkpoint path.
+    """
+    # pylint: disable=unused-argument
+    purged_before = REGISTRY.get_sample_value(PURGED_POSTS_METRIC)
+    progress = purge_expired_posts(
+        CUTOFF,
+        chunk_size=3,
+        sleep_seconds=0,
+        checkpoint_path=checkpoint_path
+    )
+    assert progress.done
+    assert progress.num_deleted == 10
+    assert progress.num_chunks == 4
+    assert REGISTRY.get_sample_value(PURGED_POSTS_METRIC) - purged_before == 10
+    posts = read_posts(limit=100)
+    assert len(posts) == 21
+    assert min(post.created_at for post in posts) == CUTOFF
+    assert read_post_count() == 21
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_purge_resumes_from_checkpoint(
+        dated_local_db: Engine,
+        checkpoint_path: str
+) -> None:
+    """Tests that an interrupted purge resumes from its checkpoint.
+
+    :param dated_local_db: A connection to the local database.
+    :param checkpoint_path: The checkpoint path.
+    """
+    # pylint: disable=unused-argument
+    progress = purge_expired_posts(
+        CUTOFF,
+        chunk_size=3,
+        sleep_seconds=0,
+        max_chunks=2,
+        checkpoint_path=checkpoint_path
+    )
+    assert not progress.done
+    assert progress.num_deleted == 6
+    assert os.path.exists(checkpoint_path)
+    progress = purge_expired_posts(
+        CUTOFF,
+        chunk_size=3,
+        sleep_seconds=0,
+        checkpoint_path=checkpoint_path
+    )
+    assert progress.done
+    assert progress.num_deleted == 4
+    assert len(read_posts(limit=100)) == 21
+
+
+def test_purge_includes_archive(
+        dated_local_db: Engine,
+        checkpoint_path: str
+) -> None:
+    """Tests that purge_expired_posts deletes expired archived posts.
+
+    :param dated_local_db: A connection to the local database.
+    :param checkpoint_path: The checkpoint path.
+    """
+    # pylint: disable=unused-argument
+    archive_posts(datetime(2022, 1, 6))
+    progress = purge_expired_posts(
+        CUTOFF,
+        sleep_seconds=0,
+        checkpoint_path=checkpoint_path
+    )
+    assert progress.num_deleted == 10
+    assert len(read_posts(limit=100)) == 21
+    assert reconcile_post_counts() == 0
+
+
+def test_purge_deletes_only_from_purged_table(
+        empty_local_db: Engine,
+        checkpoint_path: str
+) -> None:
+    """Tests that purge_expired_posts leaves a hot post that is not expired,
+    even if an expired archived post has its id.
+
+    :param empty_local_db: A connection to the local database.
+    :param checkpoint_path: The checkpoint path.
+    """
+    # pylint: disable=unused-argument
+    create_posts([
+        Post(text="old", author="author", created_at=datetime(2022, 1, 1))
+    ])
+    archive_posts(CUTOFF)
+    # Databases that reused ids can hold a hot post with an archived id.
+    create_posts([Post(
+        id=1,
+        text="new",
+        author="author",
+        created_at=datetime(2022, 1, 20)
+    )])
+    progress = purge_expired_posts(
+        CUTOFF,
+        sleep_seconds=0,
+        checkpoint_path=checkpoint_path
+    )
+    assert progress.num_deleted == 1
+    assert [post.text for post in read_posts()] == ["new"]
+    assert read_post_count() == 1
+    assert reconcile_post_counts() == 0
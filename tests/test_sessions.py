@@ -0,0 +1,144 @@
+"""Tests sessions.py."""
+
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from populare_db_proxy.db_schema import Post
+from populare_db_proxy.db_ops import create_post, read_posts, read_post_count
+from populare_db_proxy.sessions import (
+    request_session,
+    get_request_session,
+    session_scope,
+    after_commit
+)
+
+
+def test_request_session_is_scoped_to_block() -> None:
+    """Tests that the request session is only visible inside the block."""
+    assert get_request_session() is None
+    with request_session() as session:
+        assert get_request_session() is session
+        with request_session() as inner_session:
+            assert inner_session is session
+    assert get_request_session() is None
+
+
+def test_request_session_uses_one_connection(empty_local_db: Engine) -> None:
+    """Tests that operations inside a request session share one connection
+    checkout.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    checkouts = []
+
+    def on_checkout(*args) -> None:
+        """Records a connection checkout."""
+        checkouts.append(args)
+
+    event.listen(empty_local_db, "checkout", on_checkout)
+    try:
+        with request_session():
+            for idx in range(3):
+                create_post(Post(
+                    text=str(idx),
+                    author="author",
+                    created_at=datetime.now()
+                ))
+            assert len(read_posts()) == 3
+    finally:
+        event.remove(empty_local_db, "checkout", on_checkout)
+    assert len(checkouts) == 1
+    assert len(read_posts()) == 3
+
+
+def test_request_session_failed_operation_is_isolated(
+        empty_local_db: Engine
+) -> None:
+    """Tests that a failed operation inside a request session does not roll
+    back the other operations.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    with request_session():
+        create_post(Post(
+            text="first",
+            author="author",
+            created_at=datetime.now(),
+            id=1
+        ))
+        with pytest.raises(IntegrityError):
+            create_post(Post(
+                text="duplicate",
+                author="author",
+                created_at=datetime.now(),
+                id=1
+            ))
+        create_post(Post(text="second", author="author",
+                         created_at=datetime.now()))
+    assert [post.text for post in read_posts()] == ["second", "first"]
+    assert read_post_count() == 2
+
+
+def test_request_session_rolls_back_on_error(empty_local_db: Engine) -> None:
+    """Tests that a request session is rolled back if the block raises.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    with pytest.raises(ValueError):
+        with request_session():
+            create_post(Post(text="text", author="author",
+                             created_at=datetime.now()))
+            raise ValueError
+    assert not read_posts()
+
+
+def test_after_commit_runs_only_after_commit(empty_local_db: Engine) -> None:
+    """Tests that after_commit callbacks run once the transaction commits and
+    are discarded if it rolls back.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    calls = []
+    with session_scope():
+        after_commit(lambda: calls.append("op"))
+        assert not calls
+    assert calls == ["op"]
+    with request_session():
+        with session_scope():
+            after_commit(lambda: calls.append("request"))
+        with pytest.raises(ValueError):
+            with session_scope():
+                after_commit(lambda: calls.append("failed"))
+                raise ValueError
+        assert calls == ["op"]
+    assert calls == ["op", "request"]
+    after_commit(lambda: calls.append("immediate"))
+    assert calls == ["op", "request", "immediate"]
+
+
+def test_failed_after_commit_callback_is_isolated(
+        empty_local_db: Engine
+) -> None:
+    """Tests that a callback that raises neither fails the committed write
+    nor stops the callbacks that follow it.
+
+    :param empty_local_db: A connection to the local database.
+    """
+    # pylint: disable=unused-argument
+    calls = []
+
+    def fail() -> None:
+        """Raises an error."""
+        raise OSError("No buffer space available")
+
+    with request_session():
+        create_post(Post(text="text", author="a", created_at=datetime.now()))
+        after_commit(fail)
+        after_commit(lambda: calls.append("after"))
+    assert calls == ["after"]
+    assert read_post_count() == 1
@@ -0,0 +1,368 @@
+"""Tests sharding.py."""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import Engine
+from populare_db_proxy.app_data import app
+from populare_db_proxy.db_schema import Author, Post, PostRow
+from populare_db_proxy.db_ops import (
+    init_db_schema,
+    create_post,
+    create_posts,
+    read_posts,
+    read_posts_by_ids,
+    update_post_fields,
+    delete_post,
+    delete_posts,
+    read_post_count,
+    read_author_stats,
+    reconcile_post_counts,
+    backfill_post_activity,
+    read_post_activity,
+    migrate_posts_to_shards
+)
+from populare_db_proxy.archive import archive_posts
+from populare_db_proxy.deadline import (
+    DeadlineExceeded,
+    deadline_exceeded,
+    deadline_scope,
+    remaining
+)
+from populare_db_proxy.retention import purge_expired_posts
+from populare_db_proxy.sessions import request_session
+from populare_db_proxy.sharding import (
+    num_shards,
+    shard_engines,
+    shard_for,
+    group_by_shard,
+    scatter,
+    merge_pages
+)
+
+SHARD_DATABASE_PATHS = [
+    "/tmp/populare_test_shard1.db",
+    "/tmp/populare_test_shard2.db"
+]
+
+
+def _remove_shard_databases() -> None:
+    """Deletes the shard database files."""
+    for path in SHARD_DATABASE_PATHS:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.fixture(name="unsharded_binds")
+def fixture_unsharded_binds(uninitialized_local_db: Engine) -> Engine:
+    """Configures two shards beyond the primary, but does not create them.
+
+    :return: A connection to the primary database.
+    """
+    _remove_shard_databases()
+    yield uninitialized_local_db
+    for engine in shard_engines()[1:]:
+        engine.dispose()
+    app.config["SQLALCHEMY_BINDS"] = {}
+    _remove_shard_databases()
+
+
+def _enable_shards() -> None:
+    """Adds the shard databases to the configuration."""
+    app.config["SQLALCHEMY_BINDS"] = {
+        f"shard{idx}": f"sqlite:///{path}"
+        for idx, path in enumerate(SHARD_DATABASE_PATHS, 1)
+    }
+
+
+@pytest.fixture(name="sharded_local_db")
+def fixture_sharded_local_db(unsharded_binds: Engine) -> Engine:
+    """Creates an empty local database with three shards of posts.
+
+    :return: A connection to the primary database.
+    """
+    _enable_shards()
+    init_db_schema()
+    yield unsharded_binds
+
+
+def _shard_post_ids(shard: int) -> list[int]:
+    """Returns the ids of the posts stored on a shard.
+
+    :param shard: The index of the shard.
+    :return: The ids of the posts on the shard, in ascending order.
+    """
+    with shard_engines()[shard].connect() as connection:
+        return list(connection.execute(
+            select(Post.__table__.c.id).order_by(Post.__table__.c.id)
+        ).scalars())
+
+
+def _posts(count: int, start: datetime) -> list[Post]:
+    """Returns new posts created one minute apart.
+
+    :param count: The number of posts.
+    :param start: The creation datetime of the first post.
+    :return: The posts, oldest first.
+    """
+    return [
+        Post(
+            text=f"text{idx}",
+            author=f"author{idx % 2}",
+            created_at=start + timedelta(minutes=idx)
+        )
+        for idx in range(count)
+    ]
+
+
+def test_num_shards_counts_primary_and_binds(
+        sharded_local_db: Engine
+) -> None:
+    """Tests that the primary and each shard bind are counted.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    assert num_shards() == 3
+    assert shard_for(7) == 1
+    assert group_by_shard([1, 2, 3, 4]) == {1: [1, 4], 2: [2], 0: [3]}
+
+
+def test_merge_pages_orders_by_created_at_then_id() -> None:
+    """Tests that merge_pages k-way merges pages and stops at the limit."""
+    now = datetime(2022, 1, 1)
+    first = [
+        PostRow(4, "d", "a", now, 1),
+        PostRow(1, "a", "a", now - timedelta(minutes=2), 1)
+    ]
+    second = [
+        PostRow(5, "e", "a", now, 1),
+        PostRow(2, "b", "a", now - timedelta(minutes=1), 1)
+    ]
+    merged = merge_pages([first, second, []], limit=3)
+    assert [post.id for post in merged] == [5, 4, 2]
+
+
+def test_create_posts_routes_by_id(sharded_local_db: Engine) -> None:
+    """Tests that each post is stored only on the shard of its id.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    posts = create_posts(_posts(6, datetime(2022, 1, 1)))
+    create_post(Post(text="x", author="y", created_at=datetime(2022, 1, 2)))
+    assert [post.id for post in posts] == [1, 2, 3, 4, 5, 6]
+    assert _shard_post_ids(0) == [3, 6]
+    assert _shard_post_ids(1) == [1, 4, 7]
+    assert _shard_post_ids(2) == [2, 5]
+    assert read_post_count() == 7
+
+
+def test_authors_are_stored_on_the_primary(
+        sharded_local_db: Engine
+) -> None:
+    """Tests that only the primary holds authors, which posts on every shard
+    reference by id.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    create_posts(_posts(6, datetime(2022, 1, 1)))
+    for engine in shard_engines()[1:]:
+        assert not inspect(engine).has_table(Author.__tablename__)
+        assert not inspect(engine).get_foreign_keys(Post.__tablename__)
+    assert inspect(sharded_local_db).get_foreign_keys(Post.__tablename__)
+    assert {post.author for post in read_posts()} == {"author0", "author1"}
+
+
+def test_create_post_twice_adds_once(sharded_local_db: Engine) -> None:
+    """Tests that creating the same post object again does not re-add it.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    post = Post(text="x", author="y", created_at=datetime.now())
+    create_post(post)
+    create_post(post)
+    assert read_post_count() == 1
+    assert len(read_posts()) == 1
+
+
+def test_read_posts_merges_shards(sharded_local_db: Engine) -> None:
+    """Tests that read_posts returns the most recent posts of every shard.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    start = datetime(2022, 1, 1)
+    create_posts(_posts(10, start))
+    # Ties on created_at are broken by id.
+    create_post(Post(text="tie", author="a", created_at=start))
+    page = read_posts(limit=4)
+    assert [post.id for post in page] == [10, 9, 8, 7]
+    older = read_posts(limit=3, before=start + timedelta(minutes=1))
+    assert [post.id for post in older] == [11, 1]
+
+
+def test_request_reads_its_own_shard_writes(sharded_local_db: Engine) -> None:
+    """Tests that a request that writes sees its writes on every shard.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    with request_session():
+        create_posts(_posts(3, datetime.now() - timedelta(hours=1)))
+        assert len(read_posts()) == 3
+    assert len(read_posts()) == 3
+
+
+def test_request_rollback_undoes_shard_writes(
+        sharded_local_db: Engine
+) -> None:
+    """Tests that shard writes roll back with the request's transaction.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    with pytest.raises(RuntimeError):
+        with request_session():
+            create_posts(_posts(3, datetime(2022, 1, 1)))
+            raise RuntimeError
+    for shard in range(num_shards()):
+        assert not _shard_post_ids(shard)
+    assert read_post_count() == 0
+
+
+def test_update_and_delete_route_by_id(sharded_local_db: Engine) -> None:
+    """Tests that updates and deletes reach the shard of the post's id.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    create_posts(_posts(6, datetime(2022, 1, 1)))
+    updated = update_post_fields(5, text="edited", author="author9")
+    assert updated.text == "edited"
+    assert read_posts_by_ids([5])[5].author == "author9"
+    assert update_post_fields(99, text="missing") is None
+    delete_post(4)
+    assert delete_posts([1, 2, 99]) == 2
+    assert set(read_posts_by_ids(range(1, 7))) == {3, 5, 6}
+    assert read_post_count() == 3
+    stats = {stat.author: stat.post_count for stat in read_author_stats()}
+    assert stats == {"author0": 1, "author1": 1, "author9": 1}
+
+
+def test_reconcile_and_backfill_scan_every_shard(
+        sharded_local_db: Engine
+) -> None:
+    """Tests that maintenance jobs count the posts on every shard.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    start = datetime(2022, 1, 1)
+    create_posts(_posts(6, start))
+    assert reconcile_post_counts() == 0
+    assert read_post_count() == 6
+    backfill_post_activity(batch_size=2)
+    activity = read_post_activity("day", start, start + timedelta(days=1))
+    assert [bucket.post_count for bucket in activity] == [6]
+
+
+def test_enabling_shards_continues_post_ids(unsharded_binds: Engine) -> None:
+    """Tests that ids allocated after sharding continue from existing posts.
+
+    :param unsharded_binds: The local database with shards configured but
+        not yet enabled.
+    """
+    # pylint: disable=unused-argument
+    init_db_schema()
+    create_posts(_posts(4, datetime(2022, 1, 1)))
+    _enable_shards()
+    init_db_schema()
+    post = create_post(
+        Post(text="x", author="y", created_at=datetime(2022, 1, 2))
+    )
+    assert post.id == 5
+    assert _shard_post_ids(2) == [5]
+    assert len(read_posts()) == 5
+
+
+def test_migrated_posts_are_routed_by_id(unsharded_binds: Engine) -> None:
+    """Tests that posts written before sharding was enabled can be updated
+    and deleted by id once they are moved to their shards.
+
+    :param unsharded_binds: The local database with shards configured but
+        not yet enabled.
+    """
+    # pylint: disable=unused-argument
+    init_db_schema()
+    create_posts(_posts(6, datetime(2022, 1, 1)))
+    assert migrate_posts_to_shards() == 0
+    _enable_shards()
+    init_db_schema()
+    assert migrate_posts_to_shards(batch_size=4) == 4
+    assert migrate_posts_to_shards() == 0
+    assert [_shard_post_ids(shard) for shard in range(3)] == \
+        [[3, 6], [1, 4], [2, 5]]
+    assert update_post_fields(2, text="edited").text == "edited"
+    assert read_posts_by_ids([2])[2].text == "edited"
+    delete_post(4)
+    assert delete_posts([1, 5]) == 2
+    assert set(read_posts_by_ids(range(1, 7))) == {2, 3, 6}
+    assert read_post_count() == 3
+    assert reconcile_post_counts() == 0
+
+
+def test_archive_and_purge_reach_every_shard(
+        sharded_local_db: Engine,
+        tmp_path: Path
+) -> None:
+    """Tests that archiving and retention move and delete the posts on every
+    shard.
+
+    :param sharded_local_db: The sharded local database.
+    :param tmp_path: A temporary directory for the retention checkpoint.
+    """
+    # pylint: disable=unused-argument
+    start = datetime(2022, 1, 1)
+    create_posts(_posts(6, start))
+    assert archive_posts(start + timedelta(minutes=3), batch_size=1) == 3
+    assert [_shard_post_ids(shard) for shard in range(3)] == [[6], [4], [5]]
+    assert [post.id for post in read_posts()] == [6, 5, 4, 3, 2, 1]
+    progress = purge_expired_posts(
+        start + timedelta(minutes=5),
+        sleep_seconds=0,
+        checkpoint_path=str(tmp_path / "checkpoint.json")
+    )
+    assert progress.done
+    assert progress.num_deleted == 5
+    assert [post.id for post in read_posts()] == [6]
+    assert read_post_count() == 1
+
+
+def test_scatter_bounds_shard_reads_by_the_deadline(
+        sharded_local_db: Engine
+) -> None:
+    """Tests that concurrent shard reads see the request's deadline, and that
+    the request stops waiting for them at the deadline.
+
+    :param sharded_local_db: The sharded local database.
+    """
+    # pylint: disable=unused-argument
+    with deadline_scope(5), request_session() as session:
+        budgets = scatter(session, lambda connection: remaining())
+    assert all(0 < budget <= 5 for budget in budgets)
+    main_thread = threading.current_thread()
+    with deadline_scope(0.05), request_session() as session:
+        with pytest.raises(DeadlineExceeded):
+            scatter(
+                session,
+                lambda connection: None
+                if threading.current_thread() is main_thread
+                else time.sleep(0.5)
+            )
+        assert deadline_exceeded()
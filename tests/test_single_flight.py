@@ -0,0 +1,115 @@
+"""Tests single_flight.py."""
+
+import threading
+import pytest
+from prometheus_client import REGISTRY
+from populare_db_proxy.single_flight import (
+    SingleFlight,
+    LEADER,
+    COALESCED,
+    WAIT_TIMEOUT
+)
+
+
+def _calls(name: str, outcome: str) -> float:
+    """Returns the number of calls with an outcome so far.
+
+    :param name: The name of the coalesced operation.
+    :param outcome: The outcome of the calls.
+    :return: The number of calls with the outcome.
+    """
+    return REGISTRY.get_sample_value(
+        "populare_single_flight_calls_total",
+        {"name": name, "outcome": outcome}
+    ) or 0
+
+
+def _run_followers(
+        flight: SingleFlight,
+        key: str,
+        num_followers: int
+) -> tuple[threading.Event, list, list[threading.Thread]]:
+    """Starts a blocked leader call and followers for the same key.
+
+    :param flight: The single-flight group.
+    :param key: The key of the calls.
+    :param num_followers: The number of followers to start.
+    :return: A 3-tuple of the event that releases the leader, the list to
+        which each call appends its result, and the started threads.
+    """
+    release = threading.Event()
+    started = threading.Event()
+    results = []
+    calls = []
+
+    def leader_function() -> list[int]:
+        """Blocks until released and returns the result."""
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        if key == "error":
+            raise ValueError("leader failed")
+        return [len(calls)]
+
+    def call() -> None:
+        """Calls the group and records the result or error."""
+        try:
+            results.append(flight.do(key, leader_function))
+        except ValueError as exc:
+            results.append(exc)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    threads = [threading.Thread(target=call) for _ in range(num_followers)]
+    for thread in threads:
+        thread.start()
+    return release, results, [leader] + threads
+
+
+def test_concurrent_calls_share_one_call() -> None:
+    """Tests that followers share the leader's result."""
+    flight = SingleFlight("test_share", wait_seconds=5)
+    release, results, threads = _run_followers(flight, "key", 5)
+    # Give the followers time to start waiting.
+    threading.Event().wait(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [[1]] * 6
+    assert _calls("test_share", LEADER) == 1
+    assert _calls("test_share", COALESCED) == 5
+
+
+def test_followers_raise_leader_error() -> None:
+    """Tests that followers raise the leader's error."""
+    flight = SingleFlight("test_error", wait_seconds=5)
+    release, results, threads = _run_followers(flight, "error", 2)
+    threading.Event().wait(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_follower_runs_call_after_wait_timeout() -> None:
+    """Tests that a follower stops waiting after the bound."""
+    flight = SingleFlight("test_timeout", wait_seconds=0.01)
+    release, results, threads = _run_followers(flight, "key", 1)
+    threading.Event().wait(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert _calls("test_timeout", WAIT_TIMEOUT) == 1
+    assert len(results) == 2
+
+
+def test_sequential_calls_are_not_coalesced() -> None:
+    """Tests that a key is forgotten once its call completes."""
+    flight = SingleFlight("test_sequential")
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(ZeroDivisionError):
+        flight.do("key", lambda: 1 / 0)
+    assert flight.do("key", lambda: 3) == 3